@@ -37,6 +37,23 @@ class BaseRetroPathPreloader(ABC):
         raise NotImplementedError
 
 
+class BaseRetroPathBackend(ABC):
+
+    @abstractmethod
+    def run():
+        raise NotImplementedError
+
+    def prepare(self, jobs):
+        pass
+
+
+class BaseRetroPathRunner(ABC):
+
+    @abstractmethod
+    def run():
+        raise NotImplementedError
+
+
 class BaseMICOMPreloader(ABC):
 
     @abstractmethod
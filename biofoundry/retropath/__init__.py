@@ -0,0 +1,24 @@
+from .preloader import RetroPathPreloader
+from .runner import RetroPathJob, RetroPathRunner, RetroPath2WrapperBackend
+from .scope import ScopeBackend
+from .pathways import PathwayStore, get_pathway_store
+from .plots import (
+    get_retropath_results,
+    plot_retropath_results,
+    get_classes_counts,
+    plot_classes_counts
+)
+
+__all__ = [
+    "RetroPathPreloader",
+    "RetroPathJob",
+    "RetroPathRunner",
+    "RetroPath2WrapperBackend",
+    "ScopeBackend",
+    "PathwayStore",
+    "get_pathway_store",
+    "get_retropath_results",
+    "plot_retropath_results",
+    "get_classes_counts",
+    "plot_classes_counts"
+]
@@ -0,0 +1,481 @@
+import logging
+
+import os
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from biofoundry.retropath.fingerprints import popcount
+from biofoundry.retropath.graph import PATHWAYS_RANKING
+
+
+# Configure logging
+logging.basicConfig(
+    filename="retropath-" + os.path.basename(__file__).replace(".py", ".log"),
+    filemode="w",
+    format="%(asctime)s - %(filename)s:%(lineno)s - %(funcName)s - " + \
+        "%(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.DEBUG
+)
+LOGGER = logging.getLogger("retropath-" + __name__)
+
+
+# Attribution of the ranked pathways, inside interesting_metabolites/
+PATHWAYS_ATTRIBUTION = "pathways-attribution.csv"
+PATHWAYS_COVERAGE = "pathways-coverage.csv"
+
+# Maximum number of candidate organisms to search the minimal consortium
+# exhaustively, a greedy set cover is used above it
+MAX_EXACT_ORGANISMS = 16
+
+
+class OrganismBitsets:
+    """
+    Precomputed sets of organisms with each EC number, stored as bitsets of
+    64-bit words, so the organisms able to catalyse a step are the bitwise
+    OR of its EC numbers.
+
+    Parameters
+    ----------
+    ec_numbers_df : pandas.DataFrame
+        Dataframe with the columns "ec_numbers" and "ID" (the organism), as
+        in ec_numbers.csv.
+
+    Examples
+    --------
+    >>> bitsets = OrganismBitsets(pd.read_csv("ec_numbers.csv"))
+    >>> bitsets.to_organisms(bitsets.get(["1.1.1.1"]))
+
+    """
+
+    def __init__(self, ec_numbers_df: pd.DataFrame) -> None:
+        ec_numbers_df = ec_numbers_df[["ec_numbers", "ID"]]\
+            .dropna()\
+            .astype(str)\
+            .drop_duplicates()
+
+        ec_codes, self.ec_numbers = pd.factorize(ec_numbers_df["ec_numbers"])
+        organism_codes, self.organisms = pd.factorize(ec_numbers_df["ID"])
+
+        is_present = np.zeros(
+            (len(self.ec_numbers), len(self.organisms)),
+            dtype=bool
+        )
+        is_present[ec_codes, organism_codes] = True
+
+        # Bit i of a bitset is organism i
+        self.bits = self.pack(is_present)
+
+    @property
+    def n_words(self) -> int:
+        return self.bits.shape[1]
+
+    @staticmethod
+    def pack(is_present: np.ndarray) -> np.ndarray:
+        """
+        Pack a boolean matrix into rows of 64-bit words.
+
+        Parameters
+        ----------
+        is_present : numpy.ndarray
+            Boolean matrix with one column per organism.
+
+        Returns
+        -------
+        _ : numpy.ndarray
+            Matrix of uint64 words, one row per input row.
+
+        Examples
+        --------
+        None
+
+        """
+
+        n_bytes = -(-max(is_present.shape[1], 1) // 64) * 8
+
+        packed = np.packbits(is_present, axis=1, bitorder="little")
+        packed = np.pad(packed, ((0, 0), (0, n_bytes - packed.shape[1])))
+
+        return np.ascontiguousarray(packed).view(np.uint64)
+
+    def unpack(self, bits: np.ndarray) -> np.ndarray:
+        """
+        Unpack rows of bitsets into a boolean matrix of organisms.
+
+        Parameters
+        ----------
+        bits : numpy.ndarray
+            Matrix of bitsets.
+
+        Returns
+        -------
+        _ : numpy.ndarray
+            Boolean matrix with one column per organism.
+
+        Examples
+        --------
+        None
+
+        """
+
+        return np.unpackbits(
+                np.ascontiguousarray(bits).view(np.uint8),
+                axis=1,
+                bitorder="little"
+            )[:, :len(self.organisms)]\
+            .astype(bool)
+
+    def get(self, ec_numbers: pd.Series) -> np.ndarray:
+        """
+        Get the bitset of each EC number.
+
+        Parameters
+        ----------
+        ec_numbers : pandas.Series
+            The EC numbers.
+
+        Returns
+        -------
+        _ : numpy.ndarray
+            Matrix of bitsets, empty for unknown EC numbers.
+
+        Examples
+        --------
+        None
+
+        """
+
+        codes = self.ec_numbers.get_indexer(pd.Index(ec_numbers, dtype=object))
+
+        bits = np.zeros((len(codes), self.n_words), dtype=np.uint64)
+        bits[codes >= 0] = self.bits[codes[codes >= 0]]
+
+        return bits
+
+    def to_organisms(self, bitset: np.ndarray) -> list:
+        return list(self.organisms[self.unpack(bitset[None, :])[0]])
+
+
+def get_minimal_consortium(
+    organism_masks: dict,
+    n_steps: int,
+    max_exact: int = MAX_EXACT_ORGANISMS
+) -> tuple:
+    """
+    Get the smallest set of organisms covering all the steps of a pathway.
+
+    Parameters
+    ----------
+    organism_masks : dict
+        Dictionary mapping each organism to the steps it can catalyse, as an
+        integer with bit i set for step i.
+    n_steps : int
+        The number of steps of the pathway.
+    max_exact : int
+        Maximum number of candidate organisms to search exhaustively.
+
+    Returns
+    -------
+    consortium : list
+        The organisms of the consortium, empty if the steps cannot be
+        covered.
+    is_exact : bool
+        Whether the consortium is guaranteed to be minimal.
+
+    Examples
+    --------
+    >>> get_minimal_consortium({"a": 0b011, "b": 0b100, "c": 0b110}, 3)
+    (['a', 'c'], True)
+
+    """
+
+    full_mask = (1 << n_steps) - 1
+
+    # Organisms whose steps are a subset of another's are never needed
+    candidates = {}
+    for organism, mask in sorted(
+        organism_masks.items(),
+        key=lambda item: -bin(item[1]).count("1")
+    ):
+        if mask and not any(
+            mask | other == other for other in candidates.values()
+        ):
+            candidates[organism] = mask
+
+    covered = 0
+    for mask in candidates.values():
+        covered |= mask
+    if covered != full_mask:
+        return [], True
+
+    organisms = sorted(candidates)
+
+    if len(organisms) <= max_exact:
+        for size in range(1, len(organisms) + 1):
+            for consortium in itertools.combinations(organisms, size):
+                mask = 0
+                for organism in consortium:
+                    mask |= candidates[organism]
+                if mask == full_mask:
+                    return list(consortium), True
+
+    # Greedy set cover, taking the organism covering most missing steps
+    consortium = []
+    covered = 0
+    while covered != full_mask:
+        organism = max(
+            organisms,
+            key=lambda organism: \
+                bin(candidates[organism] & ~covered).count("1")
+        )
+        consortium.append(organism)
+        covered |= candidates[organism]
+
+    return sorted(consortium), False
+
+
+def attribute_pathways(
+    ranking_df: pd.DataFrame,
+    ec_numbers_df: pd.DataFrame,
+    rules_df: pd.DataFrame = None,
+    max_exact: int = MAX_EXACT_ORGANISMS
+) -> tuple:
+    """
+    Attribute the steps of the ranked pathways to the organisms of the
+    community, through the EC numbers of their rules.
+
+    Parameters
+    ----------
+    ranking_df : pandas.DataFrame
+        The ranked pathways (see biofoundry.retropath.graph.rank_pathways).
+    ec_numbers_df : pandas.DataFrame
+        The EC numbers of each organism (ec_numbers.csv).
+    rules_df : pandas.DataFrame
+        The rules (rules.csv), used to add the EC numbers of each rule to
+        those listed in the ranking.
+    max_exact : int
+        Maximum number of candidate organisms to search the minimal
+        consortium exhaustively.
+
+    Returns
+    -------
+    attribution_df : pandas.DataFrame
+        Dataframe with one row per pathway, containing the experiment, the
+        rank, the number of steps, the number of steps some organism can
+        catalyse, the organisms able to catalyse all of them
+        (comma-separated), the minimal consortium (comma-separated), its size
+        and whether it is guaranteed to be minimal.
+    coverage_df : pandas.DataFrame
+        Dataframe with one row per pathway and organism catalysing some of
+        its steps, containing the experiment, the rank, the organism, the
+        number of steps it can catalyse and the fraction of the pathway.
+
+    Examples
+    --------
+    None
+
+    """
+
+    bitsets = OrganismBitsets(ec_numbers_df)
+
+    steps_df = ranking_df[["Source", "Rank", "Step", "Rule ID", "EC number"]]\
+        .reset_index(drop=True)
+    steps_df.index.name = "step"
+
+    # EC numbers of each step, from the ranking and from the rules
+    step_ecs = steps_df["EC number"]\
+        .fillna("")\
+        .str.split(",")\
+        .explode()
+    step_ecs = [step_ecs[step_ecs != ""]]
+
+    if rules_df is not None:
+        step_rules = steps_df["Rule ID"].fillna("").str.split(",").explode()
+        step_ecs.append(
+            pd.merge(
+                    left=step_rules.rename("Rule ID").reset_index(),
+                    right=rules_df[["Rule ID", "EC number"]].dropna(),
+                    on="Rule ID",
+                    how="inner"
+                )\
+                .set_index("step")["EC number"]
+        )
+
+    step_ecs = pd.concat(step_ecs).astype(str)
+    step_ecs = step_ecs[~step_ecs.reset_index().duplicated().to_numpy()]
+
+    # Organisms of each step, as the union of its EC numbers
+    step_bits = np.zeros((len(steps_df), bitsets.n_words), dtype=np.uint64)
+    np.bitwise_or.at(
+        step_bits,
+        step_ecs.index.to_numpy(),
+        bitsets.get(step_ecs)
+    )
+    is_catalysed = popcount(step_bits).sum(axis=1) > 0
+
+    # Steps each organism can catalyse, per pathway
+    can_catalyse = bitsets.unpack(step_bits)
+
+    pathway_codes, pathways = pd.MultiIndex\
+        .from_frame(steps_df[["Source", "Rank"]])\
+        .factorize()
+    n_steps = np.bincount(pathway_codes, minlength=len(pathways))
+
+    n_covered = np.zeros(
+        (len(pathways), len(bitsets.organisms)),
+        dtype=np.int64
+    )
+    np.add.at(n_covered, pathway_codes, can_catalyse)
+
+    coverage_df = pd.DataFrame(
+        n_covered,
+        index=pathways,
+        columns=bitsets.organisms
+    )\
+        .rename_axis(index=["Source", "Rank"], columns="Organism")\
+        .stack()\
+        .rename("Steps covered")\
+        .reset_index()
+    coverage_df = coverage_df[coverage_df["Steps covered"] > 0]
+    coverage_df["Coverage"] = coverage_df["Steps covered"] / \
+        n_steps[pathways.get_indexer(
+            pd.MultiIndex.from_frame(coverage_df[["Source", "Rank"]])
+        )]
+    coverage_df = coverage_df.reset_index(drop=True)
+
+    # Steps of each pathway and organism as integer masks, bit i being the
+    # i-th step of the pathway (Python integers for very long pathways)
+    order = np.argsort(pathway_codes, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(n_steps)[:-1]])
+
+    positions = np.empty(len(steps_df), dtype=np.int64)
+    positions[order] = np.arange(len(steps_df)) - starts[pathway_codes[order]]
+
+    dtype = np.int64 if n_steps.max(initial=0) < 63 else object
+    step_masks = np.left_shift(np.ones(len(steps_df), dtype=dtype), positions)\
+        if dtype == np.int64 \
+        else np.array([1 << int(position) for position in positions], dtype)
+
+    masks = np.zeros((len(pathways), len(bitsets.organisms)), dtype=dtype)
+    np.add.at(masks, pathway_codes, can_catalyse * step_masks[:, None])
+
+    # Minimal consortium of each pathway
+    rows = []
+    for i, (source, rank) in enumerate(pathways):
+        steps = order[starts[i]:starts[i] + n_steps[i]]
+        organism_masks = {
+            organism: int(mask)
+            for organism, mask in zip(bitsets.organisms, masks[i])
+            if mask
+        }
+
+        consortium, is_exact = get_minimal_consortium(
+            organism_masks=organism_masks,
+            n_steps=len(steps),
+            max_exact=max_exact
+        )
+        rows.append({
+            "Source": source,
+            "Rank": rank,
+            "Steps": len(steps),
+            "Steps covered": int(is_catalysed[steps].sum()),
+            "Single organisms": ",".join(
+                organism
+                for organism, mask in organism_masks.items()
+                if mask == (1 << len(steps)) - 1
+            ),
+            "Consortium": ",".join(consortium),
+            "Consortium size": len(consortium),
+            "Exact": is_exact
+        })
+
+    attribution_df = pd.DataFrame(
+        rows,
+        columns=[
+            "Source",
+            "Rank",
+            "Steps",
+            "Steps covered",
+            "Single organisms",
+            "Consortium",
+            "Consortium size",
+            "Exact"
+        ]
+    )
+
+    LOGGER.info(
+        f"Attributed {len(attribution_df)} pathways to " + \
+        f"{len(bitsets.organisms)} organisms: " + \
+        f"{(attribution_df['Consortium size'] > 0).sum()} fully covered"
+    )
+
+    return attribution_df, coverage_df
+
+
+def get_pathways_attribution(config: dict) -> tuple:
+    """
+    Attribute the ranked pathways of the RetroPath2.0 analysis (see
+    biofoundry.retropath.graph.get_ranked_pathways) to the organisms of the
+    community and save the results in interesting_metabolites/.
+
+    Parameters
+    ----------
+    config : dict
+        The configuration dictionary.
+
+    Returns
+    -------
+    attribution_df : pandas.DataFrame
+        The attribution of each pathway (see attribute_pathways).
+    coverage_df : pandas.DataFrame
+        The coverage of each pathway by each organism.
+
+    Examples
+    --------
+    None
+
+    """
+
+    interesting_metabolites_dir = os.path.join(
+        config["paths"]["retropath"],
+        "interesting_metabolites/"
+    )
+
+    attribution_df, coverage_df = attribute_pathways(
+        ranking_df=pd.read_csv(
+            os.path.join(interesting_metabolites_dir, PATHWAYS_RANKING)
+        ),
+        ec_numbers_df=pd.read_csv(
+            os.path.join(
+                config["paths"]["retropath"],
+                config["retropath"]["files"]["ec_numbers"]
+            )
+        ),
+        rules_df=pd.read_csv(
+            os.path.join(
+                config["paths"]["retropath"],
+                config["retropath"]["files"]["rules"]
+            ),
+            usecols=["Rule ID", "EC number"]
+        )
+    )
+
+    # Save to files
+    attribution_df.to_csv(
+        os.path.join(interesting_metabolites_dir, PATHWAYS_ATTRIBUTION),
+        header=True,
+        index=False
+    )
+    coverage_df.to_csv(
+        os.path.join(interesting_metabolites_dir, PATHWAYS_COVERAGE),
+        header=True,
+        index=False
+    )
+
+    LOGGER.info(
+        f"Saved pathways attribution to {interesting_metabolites_dir}"
+    )
+
+    return attribution_df, coverage_df
@@ -0,0 +1,570 @@
+import logging
+
+from typing import Callable
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from biofoundry.retropath.incremental import hash_params
+
+
+# Configure logging
+logging.basicConfig(
+    filename="retropath-" + os.path.basename(__file__).replace(".py", ".log"),
+    filemode="w",
+    format="%(asctime)s - %(filename)s:%(lineno)s - %(funcName)s - " + \
+        "%(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.DEBUG
+)
+LOGGER = logging.getLogger("retropath-" + __name__)
+
+
+class TableCache:
+    """
+    Least recently used (LRU) cache of tables loaded from disk.
+
+    Each table is stored together with the signature of the file it was read
+    from, so it is transparently reloaded when the file changes.
+
+    Parameters
+    ----------
+    max_size_mb : float
+        Maximum amount of memory (in MB) used by the cached tables. The least
+        recently used tables are evicted when exceeded.
+
+    Examples
+    --------
+    >>> cache = TableCache(max_size_mb=512)
+    >>> rules_df = cache.load(
+    >>>     path="rules.csv",
+    >>>     reader=pd.read_csv
+    >>> )
+    >>> cache.cache_info()
+
+    """
+
+    def __init__(self, max_size_mb: float = 1024) -> None:
+        self.max_size = int(max_size_mb * 1024 ** 2)
+
+        self.hits = 0
+        self.misses = 0
+
+        self._tables = OrderedDict()
+
+    @staticmethod
+    def get_signature(path: str) -> tuple:
+        """
+        Get the signature of a file for detecting changes.
+
+        Parameters
+        ----------
+        path : str
+            The path to the file.
+
+        Returns
+        -------
+        _ : tuple
+            The inode, modification time (in ns) and size of the file.
+
+        Examples
+        --------
+        None
+
+        """
+
+        stat = os.stat(path)
+
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    @property
+    def size(self) -> int:
+        """
+        Memory (in bytes) used by the cached tables.
+        """
+
+        return sum(nbytes for _, _, nbytes in self._tables.values())
+
+    def load(
+        self,
+        path: str,
+        reader: Callable[[str], pd.DataFrame]
+    ) -> pd.DataFrame:
+        """
+        Load a table from the cache or, if missing or outdated, from disk.
+
+        Parameters
+        ----------
+        path : str
+            The path to the table.
+        reader : Callable[[str], pandas.DataFrame]
+            The function reading the table from its path.
+
+        Returns
+        -------
+        _ : pandas.DataFrame
+            A copy of the table, so callers can safely modify it.
+
+        Examples
+        --------
+        None
+
+        """
+
+        key = os.path.abspath(path)
+        signature = self.get_signature(path)
+
+        if key in self._tables and self._tables[key][0] == signature:
+            self.hits += 1
+            self._tables.move_to_end(key)
+
+            LOGGER.debug(f"Cache hit for {path}")
+
+            return self._tables[key][1].copy()
+
+        self.misses += 1
+
+        LOGGER.debug(f"Cache miss for {path}")
+
+        table_df = reader(path)
+        nbytes = int(table_df.memory_usage(index=True, deep=True).sum())
+
+        # Replace outdated version, if any
+        self._tables.pop(key, None)
+
+        if nbytes <= self.max_size:
+            self._tables[key] = (signature, table_df, nbytes)
+            self.evict()
+        else:
+            LOGGER.warning(
+                f"Table {path} ({nbytes} bytes) exceeds the cache size " + \
+                f"({self.max_size} bytes) and will not be cached"
+            )
+
+        return table_df.copy()
+
+    def evict(self) -> None:
+        """
+        Evict the least recently used tables until the size limit is met.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        Examples
+        --------
+        None
+
+        """
+
+        while self._tables and self.size > self.max_size:
+            key, _ = self._tables.popitem(last=False)
+
+            LOGGER.debug(f"Evicted {key} from cache")
+
+    def clear(self) -> None:
+        """
+        Remove all cached tables and reset the counters.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        Examples
+        --------
+        None
+
+        """
+
+        self._tables.clear()
+
+        self.hits = 0
+        self.misses = 0
+
+    def cache_info(self) -> dict:
+        """
+        Get the cache statistics.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        _ : dict
+            Dictionary containing the number of hits, misses and tables
+            stored, together with the current and maximum sizes (in bytes).
+
+        Examples
+        --------
+        None
+
+        """
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "tables": len(self._tables),
+            "size": self.size,
+            "max_size": self.max_size
+        }
+
+
+# Metadata of each entry of the result cache
+RESULT_ENTRY = "entry.json"
+
+
+class ResultCache:
+    """
+    Content-addressed cache of RetroPath2.0 experiment folders.
+
+    Runs are keyed by the hashes of the rules and sink files, the source
+    name and InChI, and the RetroPath2.0 parameters, so a source is only run
+    again when any of them changes. Entries are evicted in least recently
+    used (LRU) order when the cache exceeds its size budget.
+
+    Parameters
+    ----------
+    path : str
+        The directory of the cache.
+    max_size_mb : float
+        Maximum disk space (in MB) used by the cached experiments.
+
+    Examples
+    --------
+    >>> cache = ResultCache("cache/results/", max_size_mb=10240)
+    >>> key = cache.get_key(
+    >>>     rules_path="rules.csv",
+    >>>     sink_path="sink.csv",
+    >>>     source_name="glucose",
+    >>>     source_inchi="InChI=1S/C6H12O6/...",
+    >>>     params={"dmin": 6, "dmax": 16, "max_steps": 10, "topx": 100}
+    >>> )
+    >>> if cache.restore(key, "experiments/glucose") is None:
+    >>>     ...
+    >>>     cache.store(key, "experiments/glucose", {"Return code": "OK"})
+
+    """
+
+    def __init__(self, path: str, max_size_mb: float = 10240) -> None:
+        self.path = path
+        self.max_size = int(max_size_mb * 1024 ** 2)
+
+        self.hits = 0
+        self.misses = 0
+
+        # Hashes of the rules and sink files, by path and signature
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def hash_file(self, path: str) -> str:
+        """
+        Get the SHA-256 hash of a file, hashing it only once per signature.
+
+        Parameters
+        ----------
+        path : str
+            The path to the file.
+
+        Returns
+        -------
+        _ : str
+            The hexadecimal hash of the file contents.
+
+        Examples
+        --------
+        None
+
+        """
+
+        key = (os.path.abspath(path), TableCache.get_signature(path))
+
+        if key not in self._hashes:
+            sha256 = hashlib.sha256()
+            with open(path, mode="rb") as fh:
+                for chunk in iter(lambda: fh.read(1024 ** 2), b""):
+                    sha256.update(chunk)
+
+            self._hashes[key] = sha256.hexdigest()
+
+        return self._hashes[key]
+
+    def get_key(
+        self,
+        rules_path: str,
+        sink_path: str,
+        source_name: str,
+        source_inchi: str,
+        params: dict,
+        backend: dict = None
+    ) -> str:
+        """
+        Get the key of a run.
+
+        Parameters
+        ----------
+        rules_path : str
+            The path to the rules file.
+        sink_path : str
+            The path to the sink file.
+        source_name : str
+            The source name, which RetroPath2.0 writes in the outputs.
+        source_inchi : str
+            The source InChI.
+        params : dict
+            The RetroPath2.0 parameters.
+        backend : dict
+            The name and version of the backend performing the run, so runs
+            of different engines are never mixed up.
+
+        Returns
+        -------
+        _ : str
+            The hexadecimal key.
+
+        Examples
+        --------
+        None
+
+        """
+
+        return hash_params({
+            "rules": self.hash_file(rules_path),
+            "sink": self.hash_file(sink_path),
+            "source_name": source_name,
+            "source_inchi": source_inchi,
+            "params": params,
+            "backend": backend or {}
+        })
+
+    def get_entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key)
+
+    @property
+    def size(self) -> int:
+        """
+        Disk space (in bytes) used by the cached experiments.
+        """
+
+        return sum(entry["size"] for _, entry in self.get_entries())
+
+    def get_entries(self) -> list:
+        """
+        Get the metadata of all entries, least recently used first.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        entries : list
+            Pairs of entry path and metadata.
+
+        Examples
+        --------
+        None
+
+        """
+
+        entries = []
+
+        if not os.path.isdir(self.path):
+            return entries
+
+        for shard in os.scandir(self.path):
+            if not shard.is_dir():
+                continue
+
+            for entry in os.scandir(shard.path):
+                entry_file = os.path.join(entry.path, RESULT_ENTRY)
+
+                # Skip entries being written
+                if ".tmp-" in entry.name or not os.path.exists(entry_file):
+                    continue
+
+                with open(entry_file, mode="r") as fh:
+                    metadata = json.load(fh)
+
+                metadata["last_used"] = os.stat(entry_file).st_mtime_ns
+                entries.append((entry.path, metadata))
+
+        return sorted(entries, key=lambda item: item[1]["last_used"])
+
+    def restore(self, key: str, outdir: str) -> dict:
+        """
+        Restore a cached experiment folder.
+
+        Parameters
+        ----------
+        key : str
+            The key of the run.
+        outdir : str
+            The experiment folder, replaced by the cached one.
+
+        Returns
+        -------
+        _ : dict
+            The metadata stored with the entry, None if not cached.
+
+        Examples
+        --------
+        None
+
+        """
+
+        entry_path = self.get_entry_path(key)
+        entry_file = os.path.join(entry_path, RESULT_ENTRY)
+
+        if not os.path.exists(entry_file):
+            self.misses += 1
+            return None
+
+        shutil.rmtree(outdir, ignore_errors=True)
+        shutil.copytree(
+            entry_path,
+            outdir,
+            ignore=shutil.ignore_patterns(RESULT_ENTRY)
+        )
+
+        # Mark as recently used
+        os.utime(entry_file)
+
+        with open(entry_file, mode="r") as fh:
+            metadata = json.load(fh)
+
+        self.hits += 1
+
+        LOGGER.debug(f"Restored {outdir} from result cache")
+
+        return metadata
+
+    def store(self, key: str, outdir: str, metadata: dict = None) -> None:
+        """
+        Store an experiment folder and evict the least recently used entries
+        if the size budget is exceeded.
+
+        Parameters
+        ----------
+        key : str
+            The key of the run.
+        outdir : str
+            The experiment folder.
+        metadata : dict
+            JSON-serializable metadata restored with the entry (e.g. the
+            return code).
+
+        Returns
+        -------
+        None
+
+        Examples
+        --------
+        None
+
+        """
+
+        entry_path = self.get_entry_path(key)
+
+        size = sum(
+            os.path.getsize(os.path.join(root, filename))
+            for root, _, filenames in os.walk(outdir)
+            for filename in filenames
+        )
+
+        if size > self.max_size:
+            LOGGER.warning(
+                f"Experiment {outdir} ({size} bytes) exceeds the result " + \
+                f"cache size ({self.max_size} bytes) and will not be cached"
+            )
+            return
+
+        # Copy to a temporal folder first to avoid partially written entries
+        tmp_path = f"{entry_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        shutil.copytree(outdir, tmp_path)
+
+        with open(os.path.join(tmp_path, RESULT_ENTRY), mode="w") as fh:
+            json.dump({**(metadata or {}), "size": size}, fh)
+
+        with self._lock:
+            shutil.rmtree(entry_path, ignore_errors=True)
+            os.replace(tmp_path, entry_path)
+
+            self.evict()
+
+        LOGGER.debug(f"Stored {outdir} in result cache")
+
+    def evict(self) -> None:
+        """
+        Evict the least recently used entries until the size limit is met.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        Examples
+        --------
+        None
+
+        """
+
+        entries = self.get_entries()
+        size = sum(entry["size"] for _, entry in entries)
+
+        for entry_path, entry in entries:
+            if size <= self.max_size:
+                break
+
+            shutil.rmtree(entry_path, ignore_errors=True)
+            size -= entry["size"]
+
+            LOGGER.debug(f"Evicted {entry_path} from result cache")
+
+    def cache_info(self) -> dict:
+        """
+        Get the cache statistics.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        _ : dict
+            Dictionary containing the number of hits, misses and entries
+            stored, together with the current and maximum sizes (in bytes).
+
+        Examples
+        --------
+        None
+
+        """
+
+        entries = self.get_entries()
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "size": sum(entry["size"] for _, entry in entries),
+            "max_size": self.max_size
+        }
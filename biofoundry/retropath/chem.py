@@ -0,0 +1,550 @@
+import logging
+
+from typing import Callable, Iterable
+
+import os
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from rdkit import Chem
+from rdkit.Chem import AllChem
+from rdkit.Chem.MolStandardize import rdMolStandardize
+
+
+# Configure logging
+logging.basicConfig(
+    filename="retropath-" + os.path.basename(__file__).replace(".py", ".log"),
+    filemode="w",
+    format="%(asctime)s - %(filename)s:%(lineno)s - %(funcName)s - " + \
+        "%(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.DEBUG
+)
+LOGGER = logging.getLogger("retropath-" + __name__)
+
+
+class ConversionCache:
+    """
+    Persistent cache of chemical conversions (e.g. canonical SMILES to InChI)
+    stored as a two-column CSV file.
+
+    Parameters
+    ----------
+    path : str
+        The path to the CSV file. It is created on the first save. If None,
+        the cache is kept in memory only.
+
+    Examples
+    --------
+    >>> cache = ConversionCache("cache/smiles_inchi.csv")
+    >>> cache.update({"C": "InChI=1S/CH4/h1H4"})
+    >>> cache.save()
+
+    """
+
+    def __init__(self, path: str = None) -> None:
+        self.path = path
+
+        self._values = {}
+        self._changed = False
+
+        if path is not None and os.path.exists(path):
+            cache_df = pd.read_csv(
+                path,
+                dtype=str,
+                keep_default_na=False # Keys and values are never empty
+            )
+            self._values = dict(zip(cache_df["key"], cache_df["value"]))
+
+            LOGGER.debug(f"Loaded {len(self._values)} conversions from {path}")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._values
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def keys(self) -> set:
+        return self._values.keys()
+
+    def get(self, key: str, default: str = None) -> str:
+        return self._values.get(key, default)
+
+    def update(self, values: dict) -> None:
+        """
+        Add new conversions to the cache.
+
+        Parameters
+        ----------
+        values : dict
+            Dictionary mapping keys to converted values.
+
+        Returns
+        -------
+        None
+
+        Examples
+        --------
+        None
+
+        """
+
+        self._values.update(values)
+        self._changed = self._changed or bool(values)
+
+    def save(self) -> None:
+        """
+        Save the cache to disk if it changed since it was loaded.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        Examples
+        --------
+        None
+
+        """
+
+        if self.path is None or not self._changed:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        pd.DataFrame({
+                "key": list(self._values.keys()),
+                "value": list(self._values.values())
+            })\
+            .to_csv(self.path, header=True, index=False)
+
+        self._changed = False
+
+        LOGGER.debug(f"Saved {len(self._values)} conversions to {self.path}")
+
+
+def parallel_map(
+    func: Callable,
+    items: Iterable,
+    n_jobs: int = 1,
+    min_pool_size: int = 1000
+) -> list:
+    """
+    Apply a function to all items, using a process pool for large inputs.
+
+    Parameters
+    ----------
+    func : Callable
+        The function to apply. Must be picklable (i.e. defined at module
+        level).
+    items : Iterable
+        The items to process.
+    n_jobs : int
+        The number of worker processes.
+    min_pool_size : int
+        Minimum number of items to use the process pool. Smaller inputs are
+        processed sequentially to avoid the overhead of starting workers.
+
+    Returns
+    -------
+    _ : list
+        The results, in the same order as the items.
+
+    Examples
+    --------
+    None
+
+    """
+
+    items = list(items)
+
+    if n_jobs <= 1 or len(items) < min_pool_size:
+        return [func(item) for item in items]
+
+    LOGGER.debug(f"Processing {len(items)} items with {n_jobs} workers")
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        return list(
+            executor.map(
+                func,
+                items,
+                chunksize=max(1, len(items) // (4 * n_jobs))
+            )
+        )
+
+
+def canonicalize_smiles(smiles: str) -> str:
+    """
+    Get the canonical form of a SMILES string.
+
+    Parameters
+    ----------
+    smiles : str
+        The SMILES string.
+
+    Returns
+    -------
+    _ : str
+        The canonical SMILES or None if it cannot be parsed.
+
+    Examples
+    --------
+    >>> canonicalize_smiles("OCC")
+    'CCO'
+
+    """
+
+    mol = Chem.MolFromSmiles(smiles)
+
+    if mol is None:
+        return None
+
+    return Chem.MolToSmiles(mol)
+
+
+def smiles_to_inchi(smiles: str) -> str:
+    """
+    Convert a SMILES string to InChI without stereochemical information, as
+    expected by RetroPath2.0.
+
+    Parameters
+    ----------
+    smiles : str
+        The SMILES string.
+
+    Returns
+    -------
+    _ : str
+        The InChI or None if the conversion fails.
+
+    Examples
+    --------
+    >>> smiles_to_inchi("CCO")
+    'InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3'
+
+    """
+
+    mol = Chem.MolFromSmiles(smiles)
+
+    if mol is None:
+        return None
+
+    return Chem.MolToInchi(mol, options="-SNon") or None
+
+
+def get_inchis_from_smiles(
+    smiles: pd.Series,
+    cache: ConversionCache = None,
+    n_jobs: int = 1,
+    min_pool_size: int = 1000
+) -> pd.Series:
+    """
+    Convert SMILES strings to InChIs in parallel, only converting molecules
+    missing in the cache (keyed by canonical SMILES).
+
+    Parameters
+    ----------
+    smiles : pandas.Series
+        The SMILES strings. Missing values are allowed.
+    cache : ConversionCache
+        The cache of already converted molecules. It is updated and saved
+        with the new conversions, molecules without InChI are stored as an
+        empty string so they are not converted again.
+    n_jobs : int
+        The number of worker processes.
+    min_pool_size : int
+        Minimum number of molecules to use the process pool.
+
+    Returns
+    -------
+    _ : pandas.Series
+        The InChIs, with the same index as smiles. Missing and invalid
+        SMILES get None.
+
+    Examples
+    --------
+    None
+
+    """
+
+    cache = cache if cache is not None else ConversionCache()
+
+    unique_smiles = smiles.dropna().unique()
+
+    # Canonical SMILES are used as cache keys
+    canonical = dict(
+        zip(
+            unique_smiles,
+            parallel_map(
+                func=canonicalize_smiles,
+                items=unique_smiles,
+                n_jobs=n_jobs,
+                min_pool_size=min_pool_size
+            )
+        )
+    )
+
+    invalid_smiles = [key for key, value in canonical.items() if value is None]
+    if invalid_smiles:
+        LOGGER.warning(
+            f"Number of invalid SMILES: {len(invalid_smiles)}/" + \
+            f"{len(unique_smiles)} ({', '.join(invalid_smiles)})"
+        )
+
+    # Convert only new molecules
+    new_smiles = sorted(
+        set(canonical.values()) - {None} - cache.keys()
+    )
+
+    LOGGER.info(
+        f"Converting {len(new_smiles)}/{len(unique_smiles)} SMILES to InChI " + \
+        f"({len(unique_smiles) - len(new_smiles)} cached or invalid)"
+    )
+
+    new_inchis = parallel_map(
+        func=smiles_to_inchi,
+        items=new_smiles,
+        n_jobs=n_jobs,
+        min_pool_size=min_pool_size
+    )
+
+    failed_smiles = [
+        key for key, value in zip(new_smiles, new_inchis) if value is None
+    ]
+    if failed_smiles:
+        LOGGER.warning(
+            f"Number of SMILES without InChI: {len(failed_smiles)} " + \
+            f"({', '.join(failed_smiles)})"
+        )
+
+    cache.update({
+        key: value or "" for key, value in zip(new_smiles, new_inchis)
+    })
+    cache.save()
+
+    return smiles.map(
+        lambda value: cache.get(canonical.get(value)) or None,
+        na_action="ignore"
+    )
+
+
+def inchi_to_inchikey(inchi: str, connectivity: bool = False) -> str:
+    """
+    Convert an InChI to its InChIKey.
+
+    Parameters
+    ----------
+    inchi : str
+        The InChI.
+    connectivity : bool
+        Whether to return only the first block of the InChIKey, which
+        encodes the connectivity layer (i.e. ignoring stereochemistry).
+
+    Returns
+    -------
+    inchikey : str
+        The InChIKey or None if the conversion fails.
+
+    Examples
+    --------
+    >>> inchi_to_inchikey("InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3")
+    'LFQSCWFLJHTTHZ-UHFFFAOYSA-N'
+
+    """
+
+    if not isinstance(inchi, str) or not inchi.startswith("InChI="):
+        return None
+
+    inchikey = Chem.InchiToInchiKey(inchi) or None
+
+    if inchikey is not None and connectivity:
+        inchikey = inchikey.split("-")[0]
+
+    return inchikey
+
+
+def get_inchikeys(
+    inchis: pd.Series,
+    connectivity: bool = False,
+    n_jobs: int = 1,
+    min_pool_size: int = 1000
+) -> pd.Series:
+    """
+    Convert InChIs to InChIKeys in parallel.
+
+    Parameters
+    ----------
+    inchis : pandas.Series
+        The InChIs.
+    connectivity : bool
+        Whether to keep only the connectivity block of the InChIKeys.
+    n_jobs : int
+        The number of worker processes.
+    min_pool_size : int
+        Minimum number of InChIs to use the process pool.
+
+    Returns
+    -------
+    _ : pandas.Series
+        The InChIKeys (None for invalid InChIs), with the same index as
+        inchis.
+
+    Examples
+    --------
+    None
+
+    """
+
+    return pd.Series(
+        parallel_map(
+            func=partial(inchi_to_inchikey, connectivity=connectivity),
+            items=inchis,
+            n_jobs=n_jobs,
+            min_pool_size=min_pool_size
+        ),
+        index=inchis.index,
+        dtype=object
+    )
+
+
+def standardize_inchi(inchi: str) -> str:
+    """
+    Standardize an InChI by neutralizing charges and removing stereochemical
+    information, as done for the sources (see smiles_to_inchi).
+
+    Parameters
+    ----------
+    inchi : str
+        The InChI.
+
+    Returns
+    -------
+    _ : str
+        The standardized InChI or None if it cannot be parsed.
+
+    Examples
+    --------
+    >>> standardize_inchi("InChI=1S/C2H4O2/c1-2(3)4/h1H3,(H,3,4)/p-1")
+    'InChI=1S/C2H4O2/c1-2(3)4/h1H3,(H,3,4)'
+
+    """
+
+    if not isinstance(inchi, str) or not inchi.startswith("InChI="):
+        return None
+
+    mol = Chem.MolFromInchi(inchi)
+
+    if mol is None:
+        return None
+
+    mol = rdMolStandardize.Uncharger().uncharge(mol)
+
+    return Chem.MolToInchi(mol, options="-SNon") or None
+
+
+def get_standardized_inchis(
+    inchis: pd.Series,
+    cache: ConversionCache = None,
+    n_jobs: int = 1,
+    min_pool_size: int = 1000
+) -> pd.Series:
+    """
+    Standardize InChIs in parallel (see standardize_inchi), only converting
+    those missing in the cache.
+
+    Parameters
+    ----------
+    inchis : pandas.Series
+        The InChIs. Missing values are allowed.
+    cache : ConversionCache
+        The cache of already standardized InChIs. It is updated and saved
+        with the new conversions, invalid InChIs are stored as an empty
+        string so they are not converted again.
+    n_jobs : int
+        The number of worker processes.
+    min_pool_size : int
+        Minimum number of InChIs to use the process pool.
+
+    Returns
+    -------
+    _ : pandas.Series
+        The standardized InChIs, with the same index as inchis. Missing and
+        invalid InChIs get None.
+
+    Examples
+    --------
+    None
+
+    """
+
+    cache = cache if cache is not None else ConversionCache()
+
+    # Convert only new InChIs
+    new_inchis = sorted(set(inchis.dropna().unique()) - cache.keys())
+
+    LOGGER.info(
+        f"Standardizing {len(new_inchis)}/{inchis.nunique()} InChIs " + \
+        f"({inchis.nunique() - len(new_inchis)} cached)"
+    )
+
+    standardized = parallel_map(
+        func=standardize_inchi,
+        items=new_inchis,
+        n_jobs=n_jobs,
+        min_pool_size=min_pool_size
+    )
+
+    invalid_inchis = [
+        key for key, value in zip(new_inchis, standardized) if value is None
+    ]
+    if invalid_inchis:
+        LOGGER.warning(
+            f"Number of invalid InChIs: {len(invalid_inchis)}/" + \
+            f"{len(new_inchis)}"
+        )
+
+    cache.update({
+        key: value or "" for key, value in zip(new_inchis, standardized)
+    })
+    cache.save()
+
+    return inchis.map(
+        lambda inchi: cache.get(inchi) or None,
+        na_action="ignore"
+    )
+
+
+def normalize_reaction_smarts(smarts: str) -> str:
+    """
+    Normalise a reaction SMARTS by parsing and writing it back with RDKit,
+    so equivalent rules written differently get the same string. Atom maps
+    are kept, as they define the transformation.
+
+    Parameters
+    ----------
+    smarts : str
+        The reaction SMARTS.
+
+    Returns
+    -------
+    _ : str
+        The normalised reaction SMARTS, or the input if it cannot be parsed.
+
+    Examples
+    --------
+    >>> normalize_reaction_smarts("([C:1]-[O:2])>>[C:1].[O:2]")
+    '[C:1]-[O:2]>>[C:1].[O:2]'
+
+    """
+
+    try:
+        reaction = AllChem.ReactionFromSmarts(smarts)
+    except ValueError:
+        return smarts
+
+    return AllChem.ReactionToSmarts(reaction)
@@ -0,0 +1,191 @@
+import logging
+
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from biofoundry.retropath.store import SUBSTRATE, PRODUCT
+
+
+# Configure logging
+logging.basicConfig(
+    filename="retropath-" + os.path.basename(__file__).replace(".py", ".log"),
+    filemode="w",
+    format="%(asctime)s - %(filename)s:%(lineno)s - %(funcName)s - " + \
+        "%(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.DEBUG
+)
+LOGGER = logging.getLogger("retropath-" + __name__)
+
+
+# Expansion screen of the sources, inside interesting_metabolites/
+EXPANSION_RESULTS = "expansion.csv"
+
+# Round of compounds never reached
+UNREACHABLE = -1
+
+
+def get_incidence(
+    stoichiometry_df: pd.DataFrame,
+    reactions_df: pd.DataFrame
+) -> tuple:
+    """
+    Get the substrate and product incidence matrices of the given reactions,
+    adding the reverse direction of reversible ones.
+
+    Compartments and stoichiometric coefficients are ignored, so each matrix
+    only tells which compounds take part in each directed reaction.
+
+    Parameters
+    ----------
+    stoichiometry_df : pandas.DataFrame
+        The stoichiometry store (see
+        biofoundry.retropath.store.parse_stoichiometry).
+    reactions_df : pandas.DataFrame
+        Dataframe with the columns "reaction" (integer code of the
+        stoichiometry store) and "Reversible" (bool).
+
+    Returns
+    -------
+    substrates : scipy.sparse.csr_matrix
+        Binary matrix of directed reactions by compounds, marking substrates.
+    products : scipy.sparse.csr_matrix
+        Binary matrix of directed reactions by compounds, marking products.
+    reaction_codes : numpy.ndarray
+        The reaction code of each row.
+
+    Examples
+    --------
+    None
+
+    """
+
+    # A reaction is reversible if any of its rules is
+    reactions_df = reactions_df\
+        .groupby("reaction", sort=False)["Reversible"]\
+        .any()\
+        .reset_index()
+
+    # Rows of the forward reactions, followed by the reversed ones
+    reaction_codes = np.concatenate([
+        reactions_df["reaction"].to_numpy(),
+        reactions_df.loc[reactions_df["Reversible"], "reaction"].to_numpy()
+    ])
+
+    n_reactions = len(stoichiometry_df["reaction"].cat.categories)
+    n_compounds = len(stoichiometry_df["compound"].cat.categories)
+
+    forward_rows = np.full(n_reactions, -1, dtype=np.int64)
+    forward_rows[reactions_df["reaction"].to_numpy()] = \
+        np.arange(len(reactions_df))
+
+    reverse_rows = np.full(n_reactions, -1, dtype=np.int64)
+    is_reversible = reactions_df["Reversible"].to_numpy()
+    reverse_rows[reactions_df["reaction"].to_numpy()[is_reversible]] = \
+        len(reactions_df) + np.arange(is_reversible.sum())
+
+    reaction = stoichiometry_df["reaction"].cat.codes.to_numpy()
+    compound = stoichiometry_df["compound"].cat.codes.to_numpy()
+    side = stoichiometry_df["side"].to_numpy()
+
+    def get_matrix(forward_side: int) -> sparse.csr_matrix:
+        rows = np.concatenate([
+            forward_rows[reaction[side == forward_side]],
+            reverse_rows[reaction[side != forward_side]]
+        ])
+        cols = np.concatenate([
+            compound[side == forward_side],
+            compound[side != forward_side]
+        ])
+        is_used = rows >= 0
+
+        matrix = sparse.csr_matrix(
+            (
+                np.ones(is_used.sum(), dtype=np.int32),
+                (rows[is_used], cols[is_used])
+            ),
+            shape=(len(reaction_codes), n_compounds)
+        )
+
+        # Compounds in several compartments count once
+        matrix.sum_duplicates()
+        matrix.data[:] = 1
+
+        return matrix
+
+    return get_matrix(SUBSTRATE), get_matrix(PRODUCT), reaction_codes
+
+
+def expand_network(
+    substrates: sparse.csr_matrix,
+    products: sparse.csr_matrix,
+    seeds: np.ndarray,
+    max_rounds: int = None
+) -> np.ndarray:
+    """
+    Expand the network from the seed compounds, firing in each round every
+    reaction whose substrates are all available, until no new compounds are
+    produced.
+
+    Parameters
+    ----------
+    substrates : scipy.sparse.csr_matrix
+        Binary matrix of directed reactions by compounds, marking substrates.
+    products : scipy.sparse.csr_matrix
+        Binary matrix of directed reactions by compounds, marking products.
+    seeds : numpy.ndarray
+        Boolean mask of the compounds initially available.
+    max_rounds : int
+        Maximum number of rounds. Defaults to running until a fixed point.
+
+    Returns
+    -------
+    rounds : numpy.ndarray
+        The round in which each compound became available (0 for seeds),
+        UNREACHABLE for compounds never produced.
+
+    Examples
+    --------
+    None
+
+    """
+
+    n_required = np.diff(substrates.indptr)
+    products_t = products.T.tocsr()
+
+    available = np.asarray(seeds, dtype=bool).copy()
+    rounds = np.where(available, 0, UNREACHABLE).astype(np.int32)
+    fired = np.zeros(len(n_required), dtype=bool)
+
+    n_round = 0
+    while max_rounds is None or n_round < max_rounds:
+        n_round += 1
+
+        n_available = substrates @ available.astype(np.int32)
+
+        # Reactions without substrates never fire
+        firing = (n_available == n_required) & (n_required > 0) & ~fired
+
+        if not firing.any():
+            break
+
+        fired |= firing
+
+        new = (products_t @ firing.astype(np.int32) > 0) & ~available
+
+        if not new.any():
+            break
+
+        rounds[new] = n_round
+        available |= new
+
+    LOGGER.info(
+        f"Network expansion: {available.sum()}/{len(available)} compounds " + \
+        f"available after {rounds.max()} rounds " + \
+        f"({fired.sum()}/{len(fired)} reactions fired)"
+    )
+
+    return rounds
@@ -0,0 +1,541 @@
+import logging
+
+from typing import Iterable
+
+import os
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from rdkit import Chem, DataStructs
+from rdkit.Chem import MACCSkeys, rdChemReactions, rdFingerprintGenerator
+
+from biofoundry.retropath.chem import parallel_map
+
+
+# Configure logging
+logging.basicConfig(
+    filename="retropath-" + os.path.basename(__file__).replace(".py", ".log"),
+    filemode="w",
+    format="%(asctime)s - %(filename)s:%(lineno)s - %(funcName)s - " + \
+        "%(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.DEBUG
+)
+LOGGER = logging.getLogger("retropath-" + __name__)
+
+
+# Size of the substructure screening fingerprints
+PATTERN_FP_SIZE = 2048
+
+
+def get_packed_fingerprint(
+    fingerprint: DataStructs.ExplicitBitVect
+) -> np.ndarray:
+    """
+    Pack a RDKit bit vector into bytes.
+
+    Parameters
+    ----------
+    fingerprint : rdkit.DataStructs.ExplicitBitVect
+        The fingerprint.
+
+    Returns
+    -------
+    _ : numpy.ndarray
+        The fingerprint as a uint8 array (8 bits per byte).
+
+    Examples
+    --------
+    None
+
+    """
+
+    bits = np.zeros(fingerprint.GetNumBits(), dtype=np.uint8)
+    DataStructs.ConvertToNumpyArray(fingerprint, bits)
+
+    return np.packbits(bits)
+
+
+def get_pattern_fingerprint(
+    mol: Chem.Mol,
+    fp_size: int = PATTERN_FP_SIZE
+) -> np.ndarray:
+    """
+    Get the packed substructure screening fingerprint of a molecule, with
+    explicit hydrogens (as rules are applied).
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The molecule, with explicit hydrogens.
+    fp_size : int
+        The number of bits.
+
+    Returns
+    -------
+    _ : numpy.ndarray
+        The packed fingerprint.
+
+    Examples
+    --------
+    >>> get_pattern_fingerprint(Chem.AddHs(Chem.MolFromSmiles("CCO")))
+
+    """
+
+    return get_packed_fingerprint(Chem.PatternFingerprint(mol, fpSize=fp_size))
+
+
+class RuleScreen:
+    """
+    Index of the substructure bits required by the reaction centre (reactant
+    template) of each rule.
+
+    A rule can only match a molecule if all the bits of its template are set
+    in the fingerprint of the molecule, so rules failing this test are pruned
+    without running the full SMARTS match. The test is exact in that sense:
+    it never prunes rules that would match.
+
+    Parameters
+    ----------
+    reactions : Iterable[rdChemReactions.ChemicalReaction]
+        The compiled rules, each with a single reactant template.
+    fp_size : int
+        The number of bits of the fingerprints.
+
+    Examples
+    --------
+    >>> screen = RuleScreen(reactions)
+    >>> candidates = screen.get_candidates(Chem.AddHs(mol))
+    >>> screen.pruning_ratio
+
+    """
+
+    def __init__(
+        self,
+        reactions: Iterable[rdChemReactions.ChemicalReaction],
+        fp_size: int = PATTERN_FP_SIZE
+    ) -> None:
+        self.fp_size = fp_size
+
+        fingerprints = []
+        for reaction in reactions:
+            template = Chem.Mol(reaction.GetReactantTemplate(0))
+            template.UpdatePropertyCache(strict=False)
+
+            fingerprints.append(
+                get_pattern_fingerprint(template, fp_size=fp_size)
+            )
+
+        # Rules by packed bits
+        self.bits = np.vstack(fingerprints) if fingerprints \
+            else np.zeros((0, fp_size // 8), dtype=np.uint8)
+
+        self.n_queries = 0
+        self.n_candidates = 0
+
+        LOGGER.debug(f"Indexed the reaction centres of {len(self.bits)} rules")
+
+    def __len__(self) -> int:
+        return len(self.bits)
+
+    @property
+    def pruning_ratio(self) -> float:
+        """
+        Fraction of the rules pruned over all queries so far.
+        """
+
+        if not self.n_queries or not len(self):
+            return 0.0
+
+        return 1 - self.n_candidates / (self.n_queries * len(self))
+
+    def get_mask(self, mol: Chem.Mol) -> np.ndarray:
+        """
+        Get the rules that may match a molecule.
+
+        Parameters
+        ----------
+        mol : rdkit.Chem.Mol
+            The molecule, with explicit hydrogens.
+
+        Returns
+        -------
+        is_candidate : numpy.ndarray
+            Boolean mask of the rules whose template bits are all set in the
+            molecule fingerprint.
+
+        Examples
+        --------
+        None
+
+        """
+
+        fingerprint = get_pattern_fingerprint(mol, fp_size=self.fp_size)
+
+        # Bits required by the rule but missing in the molecule
+        is_candidate = ~np.any(self.bits & ~fingerprint, axis=1)
+
+        self.n_queries += 1
+        self.n_candidates += int(is_candidate.sum())
+
+        return is_candidate
+
+    def get_candidates(self, mol: Chem.Mol) -> np.ndarray:
+        """
+        Get the indexes of the rules that may match a molecule, in the order
+        of the index.
+
+        Parameters
+        ----------
+        mol : rdkit.Chem.Mol
+            The molecule, with explicit hydrogens.
+
+        Returns
+        -------
+        _ : numpy.ndarray
+            The indexes of the candidate rules.
+
+        Examples
+        --------
+        None
+
+        """
+
+        return np.flatnonzero(self.get_mask(mol))
+
+
+# Nearest neighbours of the sources, inside interesting_metabolites/
+NEAREST_NEIGHBOURS = "nearest_neighbours.csv"
+
+
+def get_similarity_fingerprint(
+    inchi: str,
+    kind: str = "morgan",
+    radius: int = 2,
+    fp_size: int = 2048
+) -> np.ndarray:
+    """
+    Get the packed similarity fingerprint of a compound, padded to a whole
+    number of 64-bit words.
+
+    Parameters
+    ----------
+    inchi : str
+        The InChI of the compound.
+    kind : str
+        The fingerprint type: "morgan" or "maccs".
+    radius : int
+        The radius of Morgan fingerprints.
+    fp_size : int
+        The number of bits of Morgan fingerprints.
+
+    Returns
+    -------
+    _ : numpy.ndarray
+        The packed fingerprint or None if the InChI cannot be parsed.
+
+    Examples
+    --------
+    >>> get_similarity_fingerprint("InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3").shape
+    (256,)
+
+    """
+
+    mol = Chem.MolFromInchi(inchi) if isinstance(inchi, str) else None
+
+    if mol is None:
+        return None
+
+    if kind == "maccs":
+        fingerprint = MACCSkeys.GenMACCSKeys(mol)
+    elif kind == "morgan":
+        fingerprint = rdFingerprintGenerator\
+            .GetMorganGenerator(radius=radius, fpSize=fp_size)\
+            .GetFingerprint(mol)
+    else:
+        raise ValueError(f"Unknown fingerprint type: {kind}")
+
+    packed = get_packed_fingerprint(fingerprint)
+
+    return np.pad(packed, (0, -len(packed) % 8))
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """
+    Count the set bits of 64-bit words (SWAR algorithm, as numpy<2 has no
+    bitwise_count).
+
+    Parameters
+    ----------
+    words : numpy.ndarray
+        Array of uint64 words.
+
+    Returns
+    -------
+    _ : numpy.ndarray
+        The number of set bits of each word (uint64).
+
+    Examples
+    --------
+    >>> popcount(np.array([0b1011], dtype=np.uint64))
+    array([3], dtype=uint64)
+
+    """
+
+    words = words - ((words >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    words = (words & np.uint64(0x3333333333333333)) + \
+        ((words >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    words = (words + (words >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+
+    return (words * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+class SimilarityIndex:
+    """
+    Index of bit-packed fingerprints for Tanimoto similarity searches.
+
+    Fingerprints are stored as 64-bit words, so each comparison is a few
+    vectorised bitwise operations per word.
+
+    Parameters
+    ----------
+    names : Iterable[str]
+        The names of the indexed compounds.
+    fingerprints : numpy.ndarray
+        The packed fingerprints (see get_similarity_fingerprint), one row per
+        compound.
+
+    Examples
+    --------
+    >>> index = SimilarityIndex.from_inchis(sink_df["Name"], sink_df["InChI"])
+    >>> index.query(names=["glucose"], fingerprints=fingerprints, k=5)
+
+    """
+
+    # Maximum size (in bytes) of the intermediate arrays of a query block
+    BLOCK_SIZE = 64 * 1024 ** 2
+
+    def __init__(self, names: Iterable[str], fingerprints: np.ndarray) -> None:
+        self.names = np.asarray(list(names), dtype=object)
+        self.words = np.ascontiguousarray(fingerprints).view(np.uint64)
+        self.counts = popcount(self.words).sum(axis=1)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def from_inchis(
+        cls,
+        names: Iterable[str],
+        inchis: Iterable[str],
+        n_jobs: int = 1,
+        **kwargs
+    ) -> "SimilarityIndex":
+        """
+        Build the index from InChIs, skipping those that cannot be parsed.
+
+        Parameters
+        ----------
+        names : Iterable[str]
+            The names of the compounds.
+        inchis : Iterable[str]
+            The InChIs of the compounds.
+        n_jobs : int
+            The number of worker processes.
+        **kwargs
+            Fingerprint options (see get_similarity_fingerprint).
+
+        Returns
+        -------
+        _ : SimilarityIndex
+            The index.
+
+        Examples
+        --------
+        None
+
+        """
+
+        names, fingerprints = get_fingerprints(
+            names=names,
+            inchis=inchis,
+            n_jobs=n_jobs,
+            **kwargs
+        )
+
+        return cls(names=names, fingerprints=fingerprints)
+
+    def get_similarities(self, fingerprints: np.ndarray) -> np.ndarray:
+        """
+        Get the Tanimoto similarity between each query and every indexed
+        compound.
+
+        Parameters
+        ----------
+        fingerprints : numpy.ndarray
+            The packed fingerprints of the queries.
+
+        Returns
+        -------
+        _ : numpy.ndarray
+            Matrix of queries by indexed compounds.
+
+        Examples
+        --------
+        None
+
+        """
+
+        words = np.ascontiguousarray(fingerprints).view(np.uint64)
+        counts = popcount(words).sum(axis=1)
+
+        intersections = np.empty((len(words), len(self)), dtype=np.float32)
+
+        block = max(1, self.BLOCK_SIZE // max(1, self.words.nbytes))
+        for start in range(0, len(words), block):
+            stop = start + block
+            intersections[start:stop] = popcount(
+                    words[start:stop, None, :] & self.words[None, :, :]
+                )\
+                .sum(axis=2)
+
+        unions = counts[:, None] + self.counts[None, :] - intersections
+
+        return np.divide(
+            intersections,
+            unions,
+            out=np.zeros_like(intersections),
+            where=unions > 0
+        )
+
+    def query(
+        self,
+        names: Iterable[str],
+        fingerprints: np.ndarray,
+        k: int = 5,
+        exclude_self: bool = False
+    ) -> pd.DataFrame:
+        """
+        Get the k most similar indexed compounds of each query.
+
+        Parameters
+        ----------
+        names : Iterable[str]
+            The names of the queries.
+        fingerprints : numpy.ndarray
+            The packed fingerprints of the queries.
+        k : int
+            The number of neighbours per query.
+        exclude_self : bool
+            Whether to skip indexed compounds with the same name as the query.
+
+        Returns
+        -------
+        neighbours_df : pandas.DataFrame
+            Dataframe containing the query, the rank, the neighbour and the
+            Tanimoto similarity, sorted by query and rank.
+
+        Examples
+        --------
+        None
+
+        """
+
+        names = np.asarray(list(names), dtype=object)
+
+        if not len(self) or not len(names):
+            return pd.DataFrame({
+                "Query": pd.Series(dtype=object),
+                "Rank": pd.Series(dtype=np.int64),
+                "Neighbour": pd.Series(dtype=object),
+                "Similarity": pd.Series(dtype=np.float32)
+            })
+
+        similarities = self.get_similarities(fingerprints)
+
+        if exclude_self:
+            similarities[names[:, None] == self.names[None, :]] = -1
+
+        k = min(k, len(self))
+
+        # Top k without sorting all the compounds
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        top_similarities = np.take_along_axis(similarities, top, axis=1)
+
+        order = np.argsort(-top_similarities, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_similarities = np.take_along_axis(top_similarities, order, axis=1)
+
+        neighbours_df = pd.DataFrame({
+            "Query": np.repeat(names, k),
+            "Rank": np.tile(np.arange(1, k + 1), len(names)),
+            "Neighbour": self.names[top.ravel()],
+            "Similarity": top_similarities.ravel()
+        })
+
+        return neighbours_df[neighbours_df["Similarity"] >= 0]\
+            .reset_index(drop=True)
+
+
+def get_fingerprints(
+    names: Iterable[str],
+    inchis: Iterable[str],
+    n_jobs: int = 1,
+    **kwargs
+) -> tuple:
+    """
+    Get the packed similarity fingerprints of several compounds in
+    parallel, skipping those whose InChI cannot be parsed.
+
+    Parameters
+    ----------
+    names : Iterable[str]
+        The names of the compounds.
+    inchis : Iterable[str]
+        The InChIs of the compounds.
+    n_jobs : int
+        The number of worker processes.
+    **kwargs
+        Fingerprint options (see get_similarity_fingerprint).
+
+    Returns
+    -------
+    names : list
+        The names of the valid compounds.
+    fingerprints : numpy.ndarray
+        The packed fingerprints, one row per valid compound.
+
+    Examples
+    --------
+    None
+
+    """
+
+    names = list(names)
+    fingerprints = parallel_map(
+        func=partial(get_similarity_fingerprint, **kwargs),
+        items=inchis,
+        n_jobs=n_jobs
+    )
+
+    is_valid = [fingerprint is not None for fingerprint in fingerprints]
+
+    if not all(is_valid):
+        LOGGER.warning(
+            "Number of compounds without fingerprint: " + \
+            f"{len(is_valid) - sum(is_valid)}/{len(is_valid)}"
+        )
+
+    valid = [
+        fingerprint
+        for fingerprint in fingerprints
+        if fingerprint is not None
+    ]
+    fingerprints = np.vstack(valid) if valid \
+        else np.zeros((0, 8), dtype=np.uint8)
+
+    return [
+        name for name, valid in zip(names, is_valid) if valid
+    ], fingerprints
@@ -0,0 +1,570 @@
+import logging
+
+from typing import Iterable
+
+import os
+import heapq
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from biofoundry.retropath.chem import parallel_map
+from biofoundry.retropath.pathways import get_pathway_store
+
+
+# Configure logging
+logging.basicConfig(
+    filename="retropath-" + os.path.basename(__file__).replace(".py", ".log"),
+    filemode="w",
+    format="%(asctime)s - %(filename)s:%(lineno)s - %(funcName)s - " + \
+        "%(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.DEBUG
+)
+LOGGER = logging.getLogger("retropath-" + __name__)
+
+
+# Ranked pathways of all experiments, inside interesting_metabolites/
+PATHWAYS_RANKING = "pathways-ranking.csv"
+
+# Name of the node standing for all the sink compounds
+SINK_NODE = "<sink>"
+
+# Lowest score considered when weighting steps by -log(score)
+MIN_SCORE = 1e-6
+
+
+class ScopeGraph:
+    """
+    Compound graph of a scope in CSR format, in the retrosynthetic
+    direction.
+
+    Each transformation is an edge from its substrate to its only product
+    not in the sink, or to SINK_NODE if all its products are in the sink.
+    Transformations with several products outside the sink branch the
+    pathway and are left out, so every path from the source to SINK_NODE
+    is a linear pathway. Only the lightest transformation between each pair
+    of compounds is kept.
+
+    Parameters
+    ----------
+    nodes : numpy.ndarray
+        The compound of each node, SINK_NODE last.
+    indptr : numpy.ndarray
+        The edges leaving node i are indptr[i]:indptr[i + 1].
+    indices : numpy.ndarray
+        The target node of each edge.
+    weights : numpy.ndarray
+        The weight of each edge.
+    transformations : numpy.ndarray
+        The transformation ID of each edge.
+
+    Examples
+    --------
+    >>> graph = ScopeGraph.from_scope(store.get_by_source("glucose"))
+    >>> graph.get_k_shortest_paths(graph.get_node("OCC1OC(O)..."), k=5)
+
+    """
+
+    def __init__(
+        self,
+        nodes: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        weights: np.ndarray,
+        transformations: np.ndarray
+    ) -> None:
+        self.nodes = nodes
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.transformations = transformations
+
+        self._node_index = {node: i for i, node in enumerate(nodes)}
+        self._edge_index = None
+        self._adjacency = (indptr.tolist(), indices.tolist(), weights.tolist())
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def sink(self) -> int:
+        return len(self.nodes) - 1
+
+    def get_node(self, compound: str) -> int:
+        return self._node_index.get(compound, -1)
+
+    def get_edge(self, u: int, v: int) -> int:
+        if self._edge_index is None:
+            sources = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+            self._edge_index = {
+                (int(source), int(target)): i
+                for i, (source, target) in enumerate(
+                    zip(sources, self.indices)
+                )
+            }
+
+        return self._edge_index[(u, v)]
+
+    @classmethod
+    def from_scope(
+        cls,
+        scope_df: pd.DataFrame,
+        weight: str = "steps"
+    ) -> "ScopeGraph":
+        """
+        Compile the graph of a scope.
+
+        Parameters
+        ----------
+        scope_df : pandas.DataFrame
+            Rows of the pathway store (see
+            biofoundry.retropath.pathways.PathwayStore) of a single
+            experiment, with the columns "Transformation ID", "Substrate",
+            "Product", "In sink" and "Score".
+        weight : str
+            "steps" to weight every transformation by 1, or "score" to weight
+            it by -log(score) of its best rule, so the lightest pathways are
+            those with the highest product of scores.
+
+        Returns
+        -------
+        _ : ScopeGraph
+            The graph.
+
+        Examples
+        --------
+        None
+
+        """
+
+        products_df = scope_df[[
+                "Transformation ID",
+                "Substrate",
+                "Product",
+                "In sink"
+            ]]\
+            .astype({"Transformation ID": str, "Substrate": str})\
+            .drop_duplicates(["Transformation ID", "Product"])
+        precursors_df = products_df[~products_df["In sink"]]
+
+        n_precursors = precursors_df\
+            .groupby("Transformation ID")["Product"]\
+            .count()\
+            .reindex(products_df["Transformation ID"].unique(), fill_value=0)
+
+        edges_df = products_df\
+            .drop_duplicates("Transformation ID")\
+            [["Transformation ID", "Substrate"]]\
+            .set_index("Transformation ID")\
+            .loc[n_precursors.index[n_precursors <= 1]]\
+            .join(
+                precursors_df\
+                    .set_index("Transformation ID")["Product"]\
+                    .astype(str)
+            )\
+            .fillna({"Product": SINK_NODE})\
+            .reset_index()
+
+        if n_precursors.gt(1).any():
+            LOGGER.debug(
+                f"Skipped {n_precursors.gt(1).sum()} branching " + \
+                "transformations"
+            )
+
+        if weight == "score":
+            scores = scope_df\
+                .groupby(scope_df["Transformation ID"].astype(str))["Score"]\
+                .max()\
+                .clip(lower=MIN_SCORE, upper=1)\
+                .fillna(MIN_SCORE)
+            edges_df["weight"] = -np.log(
+                scores.loc[edges_df["Transformation ID"]].to_numpy()
+            )
+        elif weight == "steps":
+            edges_df["weight"] = 1.0
+        else:
+            raise ValueError(f"Unknown weight: {weight}")
+
+        # Keep the lightest transformation between each pair of compounds
+        edges_df = edges_df\
+            .sort_values(["weight", "Transformation ID"], kind="stable")\
+            .drop_duplicates(["Substrate", "Product"])\
+            .query("Substrate != Product")
+
+        compounds = pd.Index(
+                pd.concat([edges_df["Substrate"], edges_df["Product"]])
+            )\
+            .unique()\
+            .drop(SINK_NODE, errors="ignore")
+        nodes = np.append(compounds.to_numpy(dtype=object), SINK_NODE)
+
+        node_index = pd.Index(nodes)
+        sources = node_index.get_indexer(edges_df["Substrate"])
+        targets = node_index.get_indexer(edges_df["Product"])
+
+        order = np.argsort(sources, kind="stable")
+        indptr = np.concatenate([
+            [0],
+            np.cumsum(np.bincount(sources, minlength=len(nodes)))
+        ])
+
+        return cls(
+            nodes=nodes,
+            indptr=indptr,
+            indices=targets[order],
+            weights=edges_df["weight"].to_numpy()[order],
+            transformations=edges_df["Transformation ID"].to_numpy()[order]
+        )
+
+    def get_shortest_path(
+        self,
+        source: int,
+        removed_nodes: set = frozenset(),
+        removed_edges: set = frozenset()
+    ) -> tuple:
+        """
+        Get the lightest path from a node to SINK_NODE (Dijkstra's algorithm).
+
+        Parameters
+        ----------
+        source : int
+            The start node.
+        removed_nodes : set
+            Nodes that cannot be visited.
+        removed_edges : set
+            Edges (pairs of nodes) that cannot be followed.
+
+        Returns
+        -------
+        path : list
+            The nodes of the path, None if SINK_NODE cannot be reached.
+        cost : float
+            The weight of the path.
+
+        Examples
+        --------
+        None
+
+        """
+
+        # Python lists are faster than arrays for scalar access
+        indptr, indices, weights = self._adjacency
+
+        distances = {source: 0.0}
+        previous = {}
+        visited = set()
+        queue = [(0.0, source)]
+
+        while queue:
+            distance, u = heapq.heappop(queue)
+
+            if u in visited:
+                continue
+            visited.add(u)
+
+            if u == self.sink:
+                path = [u]
+                while path[-1] != source:
+                    path.append(previous[path[-1]])
+                return path[::-1], distance
+
+            for i in range(indptr[u], indptr[u + 1]):
+                v = indices[i]
+
+                if v in visited or v in removed_nodes or \
+                    (u, v) in removed_edges:
+                    continue
+
+                candidate = distance + weights[i]
+                if candidate < distances.get(v, np.inf):
+                    distances[v] = candidate
+                    previous[v] = u
+                    heapq.heappush(queue, (candidate, v))
+
+        return None, np.inf
+
+    def get_path_cost(self, path: list) -> float:
+        return float(sum(
+            self.weights[self.get_edge(u, v)]
+            for u, v in zip(path[:-1], path[1:])
+        ))
+
+    def get_k_shortest_paths(self, source: int, k: int = 5) -> list:
+        """
+        Get the k lightest loopless paths from a node to SINK_NODE (Yen's
+        algorithm).
+
+        Parameters
+        ----------
+        source : int
+            The start node.
+        k : int
+            The number of paths.
+
+        Returns
+        -------
+        paths : list
+            Pairs of path (list of nodes) and cost, lightest first.
+
+        Examples
+        --------
+        None
+
+        """
+
+        path, cost = self.get_shortest_path(source)
+
+        if path is None:
+            return []
+
+        paths = [(path, cost)]
+        seen = {tuple(path)}
+        candidates = []
+
+        while len(paths) < k:
+            last_path = paths[-1][0]
+
+            for i in range(len(last_path) - 1):
+                spur_node = last_path[i]
+                root = last_path[:i + 1]
+
+                # Edges leaving the root in the paths found so far
+                removed_edges = {
+                    (path[i], path[i + 1])
+                    for path, _ in paths
+                    if len(path) > i + 1 and path[:i + 1] == root
+                }
+
+                spur_path, spur_cost = self.get_shortest_path(
+                    source=spur_node,
+                    removed_nodes=set(root[:-1]),
+                    removed_edges=removed_edges
+                )
+
+                if spur_path is None:
+                    continue
+
+                path = root[:-1] + spur_path
+                if tuple(path) not in seen:
+                    seen.add(tuple(path))
+                    heapq.heappush(
+                        candidates,
+                        (self.get_path_cost(root) + spur_cost, path)
+                    )
+
+            if not candidates:
+                break
+
+            cost, path = heapq.heappop(candidates)
+            paths.append((path, cost))
+
+        return paths
+
+
+def rank_scope_pathways(
+    scope: tuple,
+    k: int = 5,
+    weight: str = "steps"
+) -> pd.DataFrame:
+    """
+    Rank the pathways of a single scope.
+
+    Parameters
+    ----------
+    scope : tuple
+        The experiment name and its rows of the pathway store.
+    k : int
+        The number of pathways.
+    weight : str
+        The weight of the transformations (see ScopeGraph.from_scope).
+
+    Returns
+    -------
+    ranking_df : pandas.DataFrame
+        Dataframe with one row per pathway step (see rank_pathways).
+
+    Examples
+    --------
+    None
+
+    """
+
+    name, scope_df = scope
+
+    # The source is the substrate of the first iteration
+    first_df = scope_df[scope_df["Iteration"] == scope_df["Iteration"].min()]
+    if not len(first_df):
+        return pd.DataFrame()
+    source = str(first_df["Substrate"].iloc[0])
+
+    graph = ScopeGraph.from_scope(scope_df=scope_df, weight=weight)
+    paths = graph.get_k_shortest_paths(source=graph.get_node(source), k=k) \
+        if graph.get_node(source) >= 0 else []
+
+    # Candidate rules of the transformations in the pathways only
+    used = {
+        graph.transformations[graph.get_edge(u, v)]
+        for path, _ in paths
+        for u, v in zip(path[:-1], path[1:])
+    }
+    rules_df = scope_df\
+        .astype({"Transformation ID": str})\
+        .loc[lambda df: df["Transformation ID"].isin(used)]\
+        .groupby("Transformation ID")\
+        .agg({
+            "Rule ID": lambda values: ",".join(sorted(set(values.dropna()))),
+            "EC number": lambda values: ",".join(sorted(set(values.dropna())))
+        })
+
+    rows = []
+    for rank, (path, cost) in enumerate(paths, start=1):
+        n_steps = len(path) - 1
+
+        # Steps from the sink to the source
+        for step, (u, v) in enumerate(
+            reversed(list(zip(path[:-1], path[1:]))),
+            start=1
+        ):
+            transformation = graph.transformations[graph.get_edge(u, v)]
+            rows.append({
+                "Source": name,
+                "Rank": rank,
+                "Cost": cost,
+                "Steps": n_steps,
+                "Step": step,
+                "Transformation ID": transformation,
+                "Precursor": graph.nodes[v] if v != graph.sink else None,
+                "Product": graph.nodes[u],
+                "Rule ID": rules_df.loc[transformation, "Rule ID"],
+                "EC number": rules_df.loc[transformation, "EC number"]
+            })
+
+    return pd.DataFrame(rows)
+
+
+def rank_pathways(
+    pathways_df: pd.DataFrame,
+    k: int = 5,
+    weight: str = "steps",
+    sources: Iterable[str] = None,
+    n_jobs: int = 1
+) -> pd.DataFrame:
+    """
+    Rank the k best pathways from the sink to each source, in parallel
+    across sources.
+
+    Parameters
+    ----------
+    pathways_df : pandas.DataFrame
+        The pathway store (see biofoundry.retropath.pathways.PathwayStore).
+        Only transformations in scope are used.
+    k : int
+        The number of pathways per source.
+    weight : str
+        "steps" to rank by number of steps, or "score" to rank by the
+        product of the rule scores (see ScopeGraph.from_scope).
+    sources : Iterable[str]
+        The experiments to rank. Defaults to all experiments with a scope.
+    n_jobs : int
+        The number of worker processes.
+
+    Returns
+    -------
+    ranking_df : pandas.DataFrame
+        Dataframe with one row per pathway step, containing the experiment,
+        the rank and cost of the pathway, its number of steps, the step
+        (from the sink to the source), the transformation, its precursor
+        (None if all precursors are in the sink) and product in the
+        biosynthetic direction, and the candidate rules and EC numbers
+        (comma-separated).
+
+    Examples
+    --------
+    >>> rank_pathways(store.df, k=10, weight="score")
+
+    """
+
+    scope_df = pathways_df[pathways_df["In scope"]]
+    scope_df = scope_df.astype({"Source": str})
+
+    if sources is not None:
+        scope_df = scope_df[scope_df["Source"].isin(set(sources))]
+
+    scopes = list(scope_df.groupby("Source", sort=True))
+
+    LOGGER.info(f"Ranking the {k} best pathways of {len(scopes)} scopes")
+
+    frames = parallel_map(
+        func=partial(rank_scope_pathways, k=k, weight=weight),
+        items=scopes,
+        n_jobs=n_jobs,
+        min_pool_size=2
+    )
+    frames = [frame for frame in frames if len(frame)]
+
+    columns = [
+        "Source",
+        "Rank",
+        "Cost",
+        "Steps",
+        "Step",
+        "Transformation ID",
+        "Precursor",
+        "Product",
+        "Rule ID",
+        "EC number"
+    ]
+    ranking_df = pd.concat(frames, ignore_index=True)[columns] if frames \
+        else pd.DataFrame(columns=columns)
+
+    LOGGER.info(
+        f"Ranked {ranking_df[['Source', 'Rank']].drop_duplicates().shape[0]} " + \
+        f"pathways of {ranking_df['Source'].nunique()} sources"
+    )
+
+    return ranking_df
+
+
+def get_ranked_pathways(config: dict) -> pd.DataFrame:
+    """
+    Rank the pathways of every scope of the RetroPath2.0 analysis and save
+    them in interesting_metabolites/.
+
+    Parameters
+    ----------
+    config : dict
+        The configuration dictionary.
+
+    Returns
+    -------
+    ranking_df : pandas.DataFrame
+        The ranked pathways (see rank_pathways).
+
+    Examples
+    --------
+    None
+
+    """
+
+    pathways_config = config["retropath"].get("pathways", {})
+
+    ranking_df = rank_pathways(
+        pathways_df=get_pathway_store(config).df,
+        k=pathways_config.get("k", 5),
+        weight=pathways_config.get("weight", "steps"),
+        n_jobs=config["retropath"].get("n_jobs", 1)
+    )
+
+    # Save to file
+    ranking_path = os.path.join(
+        config["paths"]["retropath"],
+        "interesting_metabolites/",
+        PATHWAYS_RANKING
+    )
+    ranking_df.to_csv(ranking_path, header=True, index=False)
+
+    LOGGER.info(f"Saved ranked pathways to {ranking_path}")
+
+    return ranking_df
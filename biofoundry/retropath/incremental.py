@@ -0,0 +1,257 @@
+import logging
+
+import os
+import json
+import hashlib
+
+
+# Configure logging
+logging.basicConfig(
+    filename="retropath-" + os.path.basename(__file__).replace(".py", ".log"),
+    filemode="w",
+    format="%(asctime)s - %(filename)s:%(lineno)s - %(funcName)s - " + \
+        "%(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.DEBUG
+)
+LOGGER = logging.getLogger("retropath-" + __name__)
+
+
+# Manifest of the preloader steps, inside the cache directory
+STEPS_MANIFEST = "preloader-manifest.json"
+
+
+def hash_params(params: dict) -> str:
+    """
+    Get the SHA-256 hash of a dictionary of parameters.
+
+    Parameters
+    ----------
+    params : dict
+        The parameters. Must be JSON serializable.
+
+    Returns
+    -------
+    _ : str
+        The hexadecimal hash, independent of the order of the keys.
+
+    Examples
+    --------
+    >>> hash_params({"dmin": 6, "dmax": 16})[:8]
+    '293cff2a'
+
+    """
+
+    return hashlib.sha256(
+        json.dumps(params, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class StepManifest:
+    """
+    Manifest of the inputs each preloader step was last computed from, used
+    for skipping steps whose inputs did not change.
+
+    Inputs are identified by the SHA-256 hash of their contents, so touching
+    a file or regenerating it with the same contents does not invalidate the
+    steps depending on it. Hashes are memoized by file modification time and
+    size to avoid reading unchanged files again.
+
+    Parameters
+    ----------
+    path : str
+        The path to the JSON manifest. If None, steps are never skipped.
+
+    Examples
+    --------
+    >>> manifest = StepManifest("cache/preloader-manifest.json")
+    >>> fingerprint = manifest.get_fingerprint(
+    >>>     files=["ec_numbers.csv", "retrorules.csv"],
+    >>>     params={"dmin": 6, "dmax": 16}
+    >>> )
+    >>> if not manifest.is_fresh("rules", fingerprint):
+    >>>     ...
+    >>>     manifest.record("rules", fingerprint, outputs=["rules.csv"])
+
+    """
+
+    def __init__(self, path: str = None) -> None:
+        self.path = path
+
+        self._manifest = {"files": {}, "steps": {}}
+
+        if path is not None and os.path.exists(path):
+            with open(path, mode="r") as fh:
+                self._manifest = json.load(fh)
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def hash_file(self, path: str) -> str:
+        """
+        Get the SHA-256 hash of a file, reusing the memoized hash if the file
+        did not change since it was last hashed.
+
+        Parameters
+        ----------
+        path : str
+            The path to the file.
+
+        Returns
+        -------
+        sha256 : str
+            The hexadecimal hash of the file contents.
+
+        Examples
+        --------
+        None
+
+        """
+
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+
+        memo = self._manifest["files"].get(path)
+        if memo is not None and \
+            memo["mtime_ns"] == stat.st_mtime_ns and \
+            memo["size"] == stat.st_size:
+            return memo["sha256"]
+
+        sha256 = hashlib.sha256()
+        with open(path, mode="rb") as fh:
+            for chunk in iter(lambda: fh.read(1024 ** 2), b""):
+                sha256.update(chunk)
+
+        self._manifest["files"][path] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": sha256.hexdigest()
+        }
+
+        return sha256.hexdigest()
+
+    def get_fingerprint(
+        self,
+        files: list,
+        params: dict = None,
+        outputs: list = None
+    ) -> dict:
+        """
+        Get the fingerprint of the inputs of a step.
+
+        Parameters
+        ----------
+        files : list
+            The paths to the input files.
+        params : dict
+            The parameters of the step.
+        outputs : list
+            The paths to the files the step writes. A step computed for other
+            outputs (e.g. a sweep window) is then never considered fresh.
+
+        Returns
+        -------
+        _ : dict
+            Dictionary mapping each input file to its hash, plus the hash of
+            the parameters and the output paths. Empty if the manifest is
+            disabled.
+
+        Examples
+        --------
+        None
+
+        """
+
+        if not self.enabled:
+            return {}
+
+        fingerprint = {
+            os.path.abspath(path): self.hash_file(path)
+            for path in files
+        }
+        fingerprint["params"] = hash_params(params or {})
+        fingerprint["outputs"] = sorted(
+            os.path.abspath(path) for path in outputs or []
+        )
+
+        return fingerprint
+
+    def is_fresh(self, step: str, fingerprint: dict) -> bool:
+        """
+        Check whether a step can be skipped, i.e. it was computed from the
+        same inputs and all its outputs still exist.
+
+        Parameters
+        ----------
+        step : str
+            The name of the step.
+        fingerprint : dict
+            The fingerprint of the current inputs (see get_fingerprint).
+
+        Returns
+        -------
+        _ : bool
+            Whether the step is up to date.
+
+        Examples
+        --------
+        None
+
+        """
+
+        if not self.enabled:
+            return False
+
+        record = self._manifest["steps"].get(step)
+
+        is_fresh = record is not None and \
+            record["inputs"] == fingerprint and \
+            all(os.path.exists(path) for path in record["outputs"])
+
+        if is_fresh:
+            LOGGER.info(f"Skipping step {step}: inputs did not change")
+
+        return is_fresh
+
+    def record(self, step: str, fingerprint: dict, outputs: list) -> None:
+        """
+        Record the inputs and outputs of a computed step and save the
+        manifest.
+
+        Parameters
+        ----------
+        step : str
+            The name of the step.
+        fingerprint : dict
+            The fingerprint of the inputs the step was computed from.
+        outputs : list
+            The paths to the files written by the step.
+
+        Returns
+        -------
+        None
+
+        Examples
+        --------
+        None
+
+        """
+
+        if not self.enabled:
+            return
+
+        self._manifest["steps"][step] = {
+            "inputs": fingerprint,
+            "outputs": [os.path.abspath(path) for path in outputs]
+        }
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, mode="w") as fh:
+            json.dump(self._manifest, fh, indent=1, sort_keys=True)
+
+        os.replace(tmp_path, self.path)
+
+        LOGGER.debug(f"Recorded step {step} in {self.path}")
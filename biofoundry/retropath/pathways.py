@@ -0,0 +1,629 @@
+import logging
+
+from typing import Iterable
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from biofoundry.retropath.chem import canonicalize_smiles, parallel_map
+from biofoundry.retropath.plots import scan_experiments
+from biofoundry.retropath.store import (
+    load_columnar,
+    load_columnar_metadata,
+    save_columnar
+)
+
+
+# Configure logging
+logging.basicConfig(
+    filename="retropath-" + os.path.basename(__file__).replace(".py", ".log"),
+    filemode="w",
+    format="%(asctime)s - %(filename)s:%(lineno)s - %(funcName)s - " + \
+        "%(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.DEBUG
+)
+LOGGER = logging.getLogger("retropath-" + __name__)
+
+
+# Pathway store of all experiments, inside interesting_metabolites/
+PATHWAYS_STORE = "pathways.npz"
+
+# One row per transformation, rule, EC number and product. Pathways are not
+# stored explicitly: those of a source are its transformations "In scope",
+# which biofoundry.retropath.graph.rank_pathways splits into ranked pathways
+# with ordered steps
+PATHWAYS_COLUMNS = [
+    "Source",
+    "Transformation ID",
+    "Iteration",
+    "Rule ID",
+    "EC number",
+    "Substrate",
+    "Product",
+    "In sink",
+    "Sink name",
+    "Score",
+    "In scope"
+]
+
+# Columns stored as categories, i.e. those that can be indexed
+CATEGORICAL_COLUMNS = [
+    "Source",
+    "Transformation ID",
+    "Rule ID",
+    "EC number",
+    "Substrate",
+    "Product",
+    "Sink name"
+]
+
+
+def split_values(values: pd.Series) -> pd.Series:
+    """
+    Split multi-valued fields of RetroPath2.0 results (e.g. several rules
+    or EC numbers of the same transformation) into lists.
+
+    Parameters
+    ----------
+    values : pandas.Series
+        The field values, either single values or lists enclosed in brackets
+        or braces and separated by commas, semicolons or pipes.
+
+    Returns
+    -------
+    _ : pandas.Series
+        The lists of values.
+
+    Examples
+    --------
+    >>> split_values(pd.Series(["[1.1.1.1, 1.1.1.2]", "2.3.1.-"])).tolist()
+    [['1.1.1.1', '1.1.1.2'], ['2.3.1.-']]
+
+    """
+
+    return values\
+        .fillna("")\
+        .astype(str)\
+        .str.strip("[]{}() ")\
+        .str.split(r"\s*[,;|]\s*", regex=True)
+
+
+def read_experiment_pathways(experiment: tuple) -> pd.DataFrame:
+    """
+    Read the transformations of an experiment into the rows of the pathway
+    store.
+
+    Parameters
+    ----------
+    experiment : tuple
+        The experiment name and the path to its folder.
+
+    Returns
+    -------
+    pathways_df : pandas.DataFrame
+        Dataframe with the columns in PATHWAYS_COLUMNS. Empty if the
+        experiment has no results.
+
+    Examples
+    --------
+    None
+
+    """
+
+    name, path = experiment
+
+    with os.scandir(path) as entries:
+        filenames = [entry.name for entry in entries if entry.is_file()]
+
+    scope_paths = [
+        os.path.join(path, filename)
+        for filename in filenames
+        if filename.endswith("_scope.csv")
+    ]
+
+    if "results.csv" in filenames:
+        results_path = os.path.join(path, "results.csv")
+    elif scope_paths:
+        results_path = scope_paths[0]
+    else:
+        return pd.DataFrame(columns=PATHWAYS_COLUMNS)
+
+    results_df = pd.read_csv(results_path, dtype=str, keep_default_na=False)
+
+    if not len(results_df):
+        return pd.DataFrame(columns=PATHWAYS_COLUMNS)
+
+    scope_ids = set()
+    for scope_path in scope_paths:
+        scope_ids.update(
+            pd.read_csv(
+                scope_path,
+                usecols=["Transformation ID"],
+                dtype=str
+            )["Transformation ID"]
+        )
+
+    # One row per product, with its sink flag and name
+    products_df = pd.DataFrame({
+        "Transformation ID": results_df["Transformation ID"],
+        "Product": results_df["Product SMILES"].str.split("."),
+        "In sink": results_df["In Sink"].str.split("."),
+        "Sink name": results_df["Sink name"].str.split(".")
+    })
+
+    # Sink flags and names are dropped when they do not match the products
+    n_products = products_df["Product"].str.len()
+    for column in ["In sink", "Sink name"]:
+        is_aligned = products_df[column].str.len() == n_products
+        products_df.loc[~is_aligned, column] = pd.Series(
+            [[""] * n for n in n_products[~is_aligned]],
+            index=products_df.index[~is_aligned],
+            dtype=object
+        )
+
+    products_df = products_df.explode(["Product", "In sink", "Sink name"])
+
+    # One row per rule and EC number, paired if both lists are aligned
+    rules_df = pd.DataFrame({
+        "Transformation ID": results_df["Transformation ID"],
+        "Rule ID": split_values(results_df["Rule ID"]),
+        "EC number": split_values(results_df["EC number"])
+    })
+    is_paired = rules_df["Rule ID"].str.len() == rules_df["EC number"].str.len()
+    rules_df = pd.concat(
+        [
+            rules_df[is_paired].explode(["Rule ID", "EC number"]),
+            rules_df[~is_paired].explode("Rule ID").explode("EC number")
+        ],
+        ignore_index=True
+    )
+
+    pathways_df = results_df[[
+            "Transformation ID",
+            "Iteration",
+            "Substrate SMILES",
+            "Score"
+        ]]\
+        .rename(columns={"Substrate SMILES": "Substrate"})\
+        .merge(rules_df, on="Transformation ID", how="left")\
+        .merge(products_df, on="Transformation ID", how="left")
+
+    pathways_df["Source"] = name
+    pathways_df["Iteration"] = pd.to_numeric(
+            pathways_df["Iteration"],
+            errors="coerce"
+        )\
+        .fillna(-1)\
+        .astype(np.int32)
+    pathways_df["Score"] = pd.to_numeric(
+            pathways_df["Score"],
+            errors="coerce"
+        )\
+        .astype(np.float32)
+    pathways_df["In sink"] = pathways_df["In sink"].isin(["1", "True", "true"])
+    pathways_df["In scope"] = pathways_df["Transformation ID"].isin(scope_ids) \
+        if "results.csv" in filenames else True
+
+    return pathways_df[PATHWAYS_COLUMNS].replace({"": None})
+
+
+class PathwayStore:
+    """
+    Columnar store of the transformations found for all sources, indexed by
+    source, EC number and compound.
+
+    Each index sorts the row numbers by the category code of the indexed
+    column, so a lookup is a slice of the sorted rows instead of a scan of
+    the whole store.
+
+    Rows carry no pathway identifier or step order: lookups return single
+    transformations. Pathways are grouped afterwards per Source from the
+    rows "In scope", and split into ranked pathways with ordered steps by
+    biofoundry.retropath.graph.rank_pathways (see the examples).
+
+    Parameters
+    ----------
+    pathways_df : pandas.DataFrame
+        Dataframe with the columns in PATHWAYS_COLUMNS.
+    experiments : dict
+        Dictionary mapping each experiment to the signature of its files
+        when it was read (see biofoundry.retropath.plots.scan_experiments).
+
+    Examples
+    --------
+    >>> store = PathwayStore.from_experiments("experiments/")
+    >>> store.save("pathways.npz")
+    >>> store.get_by_ec("1.14.13.x")
+
+    Ranked pathways with a step of an EC class:
+
+    >>> ec_df = store.get_by_ec("1.14.13.x")
+    >>> ranking_df = rank_pathways(
+    >>>     store.df,
+    >>>     sources=ec_df.loc[ec_df["In scope"], "Source"].unique()
+    >>> )
+    >>> is_ec = ranking_df["EC number"].str.contains("(?:^|,)1[.]14[.]13[.]")
+    >>> ranked_df = ranking_df.loc[is_ec, ["Source", "Rank"]].drop_duplicates()
+    >>> ranking_df.merge(ranked_df)
+
+    """
+
+    def __init__(
+        self,
+        pathways_df: pd.DataFrame,
+        experiments: dict = None
+    ) -> None:
+        self.df = pathways_df.reset_index(drop=True)
+        self.experiments = experiments or {}
+
+        for column in CATEGORICAL_COLUMNS:
+            if not isinstance(self.df[column].dtype, pd.CategoricalDtype):
+                self.df[column] = pd.Categorical(self.df[column])
+
+        self.df = self.df.astype({
+            "Iteration": np.int32,
+            "Score": np.float32,
+            "In sink": bool,
+            "In scope": bool
+        })
+
+        self._indexes = {}
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    @classmethod
+    def from_experiments(
+        cls,
+        experiments_dir: str,
+        n_jobs: int = 1,
+        previous: "PathwayStore" = None
+    ) -> "PathwayStore":
+        """
+        Build the store by reading the results of every experiment.
+
+        Parameters
+        ----------
+        experiments_dir : str
+            The path to the experiments directory (organism partitions are
+            supported, see biofoundry.retropath.plots.scan_experiments).
+        n_jobs : int
+            The number of worker processes.
+        previous : PathwayStore
+            A previously built store, whose rows are reused for the
+            experiments whose files did not change since.
+
+        Returns
+        -------
+        _ : PathwayStore
+            The store.
+
+        Examples
+        --------
+        None
+
+        """
+
+        experiments_df = scan_experiments(experiments_dir)
+        experiments = dict(zip(
+            experiments_df["Source"],
+            experiments_df["signature"]
+        ))
+
+        is_pending = np.ones(len(experiments_df), dtype=bool)
+        frames = []
+        if previous is not None:
+            is_pending = np.array([
+                previous.experiments.get(name) != signature
+                for name, signature in experiments.items()
+            ], dtype=bool)
+
+            reused = set(experiments_df.loc[~is_pending, "Source"])
+            frames.append(
+                previous.df[previous.df["Source"].isin(reused)]\
+                    .astype({column: object for column in CATEGORICAL_COLUMNS})
+            )
+
+        LOGGER.info(
+            f"Reading the results of {is_pending.sum()}/" + \
+            f"{len(experiments_df)} experiments"
+        )
+
+        frames.extend(
+            parallel_map(
+                func=read_experiment_pathways,
+                items=zip(
+                    experiments_df.loc[is_pending, "Source"],
+                    experiments_df.loc[is_pending, "path"]
+                ),
+                n_jobs=n_jobs
+            )
+        )
+        frames = [frame for frame in frames if len(frame)]
+
+        pathways_df = pd.concat(frames, ignore_index=True) if frames \
+            else pd.DataFrame(columns=PATHWAYS_COLUMNS)
+
+        store = cls(pathways_df=pathways_df, experiments=experiments)
+
+        LOGGER.info(
+            f"Pathway store: {len(store)} rows from " + \
+            f"{store.df['Source'].nunique()} experiments"
+        )
+
+        return store
+
+    def save(self, path: str) -> None:
+        """
+        Save the store (see biofoundry.retropath.store.save_columnar).
+
+        Parameters
+        ----------
+        path : str
+            The output path (.npz).
+
+        Returns
+        -------
+        None
+
+        Examples
+        --------
+        None
+
+        """
+
+        save_columnar(
+            df=self.df,
+            path=path,
+            metadata={"experiments": self.experiments}
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "PathwayStore":
+        """
+        Load a store saved with PathwayStore.save.
+
+        Parameters
+        ----------
+        path : str
+            The path to the store (.npz).
+
+        Returns
+        -------
+        _ : PathwayStore
+            The store.
+
+        Examples
+        --------
+        None
+
+        """
+
+        return cls(
+            pathways_df=load_columnar(path),
+            experiments=load_columnar_metadata(path).get("experiments")
+        )
+
+    def get_index(self, column: str) -> tuple:
+        """
+        Get the index of a categorical column, building it on first use.
+
+        Parameters
+        ----------
+        column : str
+            The indexed column.
+
+        Returns
+        -------
+        order : numpy.ndarray
+            The row numbers sorted by category code.
+        indptr : numpy.ndarray
+            The rows of category i are order[indptr[i]:indptr[i + 1]].
+
+        Examples
+        --------
+        None
+
+        """
+
+        if column not in self._indexes:
+            codes = self.df[column].cat.codes.to_numpy()
+            n_categories = len(self.df[column].cat.categories)
+
+            order = np.argsort(codes, kind="stable")
+
+            # Rows with missing values (code -1) come first and are skipped
+            counts = np.bincount(codes[codes >= 0], minlength=n_categories)
+            indptr = np.concatenate([[0], np.cumsum(counts)]) + \
+                (codes < 0).sum()
+
+            self._indexes[column] = (order, indptr)
+
+        return self._indexes[column]
+
+    def get_rows(self, column: str, values: Iterable[str]) -> np.ndarray:
+        """
+        Get the sorted row numbers where a column takes any of the values.
+
+        Parameters
+        ----------
+        column : str
+            The indexed column.
+        values : Iterable[str]
+            The values to look up.
+
+        Returns
+        -------
+        _ : numpy.ndarray
+            The row numbers.
+
+        Examples
+        --------
+        None
+
+        """
+
+        order, indptr = self.get_index(column)
+        codes = self.df[column].cat.categories.get_indexer(list(values))
+
+        rows = [order[indptr[code]:indptr[code + 1]] for code in codes[codes >= 0]]
+
+        return np.unique(np.concatenate(rows)) if rows \
+            else np.array([], dtype=np.int64)
+
+    def get_by_source(self, sources: Iterable[str]) -> pd.DataFrame:
+        """
+        Get the transformations of the given experiments.
+
+        Parameters
+        ----------
+        sources : Iterable[str]
+            The experiment names (<organism>/<source> for partitions).
+
+        Returns
+        -------
+        _ : pandas.DataFrame
+            The matching rows of the store.
+
+        Examples
+        --------
+        None
+
+        """
+
+        if isinstance(sources, str):
+            sources = [sources]
+
+        return self.df.iloc[self.get_rows("Source", sources)]
+
+    def get_by_ec(self, ec_number: str) -> pd.DataFrame:
+        """
+        Get the transformations of an EC number or of a whole EC class.
+
+        Parameters
+        ----------
+        ec_number : str
+            The EC number. Incomplete ones (e.g. "1.14.13.x", "1.14.13.-" or
+            "1.14.13") match every EC number in the class.
+
+        Returns
+        -------
+        _ : pandas.DataFrame
+            The matching rows of the store, i.e. single transformations (see
+            PathwayStore to get whole pathways).
+
+        Examples
+        --------
+        None
+
+        """
+
+        levels = [
+            level
+            for level in ec_number.strip().split(".")
+            if level not in ["x", "-", "*", ""]
+        ]
+        prefix = ".".join(levels)
+
+        categories = self.df["EC number"].cat.categories.to_numpy(dtype=str)
+        sorted_categories = np.sort(categories)
+
+        # Categories starting with the prefix followed by a dot are
+        # contiguous once sorted
+        start, stop = np.searchsorted(
+            sorted_categories,
+            [prefix + ".", prefix + "/"] # "/" follows "." in ASCII
+        )
+        matches = list(sorted_categories[start:stop])
+        if len(levels) == 4 or prefix in categories:
+            matches.append(prefix)
+
+        return self.df.iloc[self.get_rows("EC number", matches)]
+
+    def get_by_compound(
+        self,
+        smiles: str,
+        side: str = None
+    ) -> pd.DataFrame:
+        """
+        Get the transformations consuming or producing a compound.
+
+        Parameters
+        ----------
+        smiles : str
+            The SMILES of the compound, canonicalized before the lookup.
+        side : str
+            "substrate" or "product" to restrict the lookup, both if None.
+
+        Returns
+        -------
+        _ : pandas.DataFrame
+            The matching rows of the store.
+
+        Examples
+        --------
+        None
+
+        """
+
+        smiles = [canonicalize_smiles(smiles) or smiles]
+
+        rows = []
+        if side in [None, "substrate"]:
+            rows.append(self.get_rows("Substrate", smiles))
+        if side in [None, "product"]:
+            rows.append(self.get_rows("Product", smiles))
+
+        return self.df.iloc[np.unique(np.concatenate(rows))]
+
+
+def get_pathway_store(config: dict, incremental: bool = True) -> PathwayStore:
+    """
+    Get the pathway store of the RetroPath2.0 analysis, saved in
+    interesting_metabolites/.
+
+    Parameters
+    ----------
+    config : dict
+        The configuration dictionary.
+    incremental : bool
+        Whether to reuse the saved store for the experiments whose files
+        did not change since it was built.
+
+    Returns
+    -------
+    store : PathwayStore
+        The store.
+
+    Examples
+    --------
+    >>> store = get_pathway_store(config)
+    >>> store.get_by_ec("1.14.13.x")["Source"].unique()
+
+    """
+
+    interesting_metabolites_dir = os.path.join(
+        config["paths"]["retropath"],
+        "interesting_metabolites/"
+    )
+    store_path = os.path.join(interesting_metabolites_dir, PATHWAYS_STORE)
+
+    previous = PathwayStore.load(store_path) \
+        if incremental and os.path.exists(store_path) else None
+
+    store = PathwayStore.from_experiments(
+        experiments_dir=os.path.join(
+            interesting_metabolites_dir,
+            "experiments/"
+        ),
+        n_jobs=config["retropath"].get("n_jobs", 1),
+        previous=previous
+    )
+    store.save(store_path)
+
+    LOGGER.info(f"Saved pathway store to {store_path}")
+
+    return store
@@ -1,12 +1,168 @@
+import logging
+
 import os
+from functools import lru_cache
 
 import pandas as pd
 
 import plotly
 import plotly.express as px
 
+from biofoundry.retropath.cache import TableCache
+from biofoundry.retropath.chem import parallel_map
+from biofoundry.retropath.incremental import hash_params
+from biofoundry.retropath.sources import PACKED_SOURCES_INDEX
+from biofoundry.retropath.store import (
+    load_columnar,
+    load_columnar_metadata,
+    save_columnar
+)
+
+
+# Configure logging
+logging.basicConfig(
+    filename="retropath-" + os.path.basename(__file__).replace(".py", ".log"),
+    filemode="w",
+    format="%(asctime)s - %(filename)s:%(lineno)s - %(funcName)s - " + \
+        "%(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.DEBUG
+)
+LOGGER = logging.getLogger("retropath-" + __name__)
+
+
+# Status of each experiment folder, inside interesting_metabolites/
+RESULTS_MANIFEST = "results-manifest.csv"
+
+# Compound lists and class annotations, inside the classes directory
+CLASS_FILES = [
+    ("detectables", "Detectables_list.xlsx"),
+    ("producibles", "Producibles_list.xlsx"),
+    ("annotation", "AnotacionDetectables.txt"),
+    ("annotation", "AnotacionDetectablesEnvipath.txt"),
+    ("annotation", "AnotacionProducibles.txt"),
+    ("annotation", "AnotacionProduciblesEnvipath.txt")
+]
+
+# Snapshot of the class reference, inside the cache directory
+CLASS_SNAPSHOT = "classes.npz"
+
+
+def classify_experiment(path: str) -> str:
+    """
+    Get the status of a RetroPath2.0 experiment from the files in its folder.
+
+    Only file names and sizes are inspected, plus the first two lines of
+    source-in-sink.csv when it is the only file.
+
+    Parameters
+    ----------
+    path : str
+        The path to the experiment folder.
+
+    Returns
+    -------
+    status : str
+        One of "Scope", "Results but no scope", "Source in sink",
+        "Source in sink (empty)" or "Error".
+
+    Examples
+    --------
+    None
 
-def get_retropath_results(config: dict) -> pd.DataFrame:
+    """
+
+    with os.scandir(path) as entries:
+        filenames = {
+            entry.name: entry.stat().st_size
+            for entry in entries
+            if entry.is_file()
+        }
+
+    if any(filename.endswith("_scope.csv") for filename in filenames):
+        return "Scope"
+
+    if set(filenames) == {"results.csv", "source-in-sink.csv"}:
+        return "Results but no scope"
+
+    if set(filenames) == {"source-in-sink.csv"}:
+
+        # Any line after the header
+        is_empty = True
+        if filenames["source-in-sink.csv"] > 0:
+            with open(os.path.join(path, "source-in-sink.csv")) as fh:
+                fh.readline()
+                is_empty = not fh.readline().strip()
+
+        return "Source in sink (empty)" if is_empty else "Source in sink"
+
+    return "Error"
+
+
+def scan_experiments(experiments_dir: str) -> pd.DataFrame:
+    """
+    List the experiment folders with a single pass over the experiments
+    directory. Folders containing only folders are organism partitions,
+    whose experiments are named <organism>/<source>.
+
+    Parameters
+    ----------
+    experiments_dir : str
+        The path to the experiments directory.
+
+    Returns
+    -------
+    experiments_df : pandas.DataFrame
+        Dataframe containing the experiment name, its path and the signature
+        of its files (hash of their names, sizes and modification times),
+        which changes even when a file is rewritten in place.
+
+    Examples
+    --------
+    None
+
+    """
+
+    experiments = []
+
+    def scan(path: str, prefix: str) -> None:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    continue
+
+                with os.scandir(entry.path) as children:
+                    children = list(children)
+
+                if children and all(child.is_dir() for child in children):
+                    scan(entry.path, prefix + entry.name + "/")
+                    continue
+
+                files = sorted(
+                    (child.name, stat.st_size, stat.st_mtime_ns)
+                    for child in children
+                    if child.is_file()
+                    for stat in [child.stat()]
+                )
+                experiments.append((
+                    prefix + entry.name,
+                    entry.path,
+                    hash_params(files)
+                ))
+
+    if os.path.isdir(experiments_dir):
+        scan(experiments_dir, "")
+
+    return pd.DataFrame(
+        experiments,
+        columns=["Source", "path", "signature"]
+    )
+
+
+def get_retropath_results(
+    config: dict,
+    incremental: bool = False
+) -> pd.DataFrame:
     """
     Get the results of the RetroPath2.0 analysis by inspecting each source
     folder.
@@ -15,11 +171,16 @@ def get_retropath_results(config: dict) -> pd.DataFrame:
     ----------
     config : dict
         The configuration dictionary.
+    incremental : bool
+        Whether to reuse the statuses saved in the results manifest for the
+        folders whose files did not change since, and save the updated
+        manifest.
 
     Returns
     -------
     results_df : pandas.DataFrame
-        Dataframe containing the results for each source.
+        Dataframe containing the results for each source. Experiments of
+        organism partitions are named <organism>/<source>.
 
     Examples
     --------
@@ -27,71 +188,92 @@ def get_retropath_results(config: dict) -> pd.DataFrame:
 
     """
 
-    results_df = pd.DataFrame()
-
-    experiments_dir = os.path.join(
+    interesting_metabolites_dir = os.path.join(
         config["paths"]["retropath"],
-        "interesting_metabolites/",
-        "experiments/"
+        "interesting_metabolites/"
     )
+    experiments_dir = os.path.join(interesting_metabolites_dir, "experiments/")
+    manifest_path = os.path.join(interesting_metabolites_dir, RESULTS_MANIFEST)
 
-    for source in os.listdir(experiments_dir):
-
-        # Get all files for the given source
-        source_files = os.listdir(os.path.join(experiments_dir, source))
+    experiments_df = scan_experiments(experiments_dir)
 
-        source_df = pd.DataFrame({
-            "Source": [source],
-            "Status": [None]
-        })
+    # Reuse the statuses of folders whose files did not change
+    experiments_df["Status"] = None
+    if incremental and os.path.exists(manifest_path):
+        manifest_df = pd.read_csv(
+            manifest_path,
+            usecols=lambda column: column in ["Source", "signature", "Status"]
+        )
 
-        if "_scope.csv" in "".join(source_files):
-            source_df["Status"] = "Scope"
+        # Manifests keyed by folder mtime are discarded
+        if "signature" in manifest_df.columns:
+            experiments_df = experiments_df\
+                .drop(columns="Status")\
+                .merge(
+                    manifest_df,
+                    on=["Source", "signature"],
+                    how="left"
+                )
 
-        elif sorted(source_files) == sorted(["results.csv", "source-in-sink.csv"]):
-            source_df["Status"] = "Results but no scope"
+    is_pending = experiments_df["Status"].isnull()
 
-        elif source_files == ["source-in-sink.csv"]:
-            source_sink_df = pd.read_csv(
-                os.path.join(experiments_dir, source, "source-in-sink.csv")
-            )
+    LOGGER.info(
+        f"Classifying {is_pending.sum()}/{len(experiments_df)} experiments"
+    )
 
-            if len(source_sink_df):
-                source_df["Status"] = "Source in sink"
-            else:
-                source_df["Status"] = "Source in sink (empty)"
+    experiments_df.loc[is_pending, "Status"] = parallel_map(
+        func=classify_experiment,
+        items=experiments_df.loc[is_pending, "path"],
+        n_jobs=config["retropath"].get("n_jobs", 1)
+    )
 
-        else:
-            source_df["Status"] = "Error"
-
-        results_df = pd.concat(
-            [results_df, source_df],
-            axis=0,
-            ignore_index=True
-        )
+    if incremental:
+        experiments_df[["Source", "signature", "Status"]]\
+            .to_csv(manifest_path, header=True, index=False)
 
     # Get metabolites not produced
-    all_sources = os.listdir(
-        os.path.join(
-            config["paths"]["retropath"],
-            "interesting_metabolites/",
-            "sources/"
+    sources_dir = os.path.join(interesting_metabolites_dir, "sources/")
+    if os.path.isdir(sources_dir):
+        with os.scandir(sources_dir) as entries:
+            all_sources = {
+                entry.name.replace(".csv", "")
+                for entry in entries
+            }
+    else:
+        all_sources = set(
+            pd.read_csv(
+                os.path.join(interesting_metabolites_dir, PACKED_SOURCES_INDEX)
+            )["Name"]
         )
-    )
-    all_sources = set([item.replace(".csv", "") for item in all_sources])
-
-    processed_sources = set(results_df["Source"].values)
-    not_processed_sources = all_sources - processed_sources
 
-    # TODO: log len(not_processed_sources), not_processed_sources
+    # Sources are expected in every organism partition
+    prefixes = {
+        source[:source.rfind("/") + 1]
+        for source in experiments_df["Source"]
+    } or {""}
+    all_experiments = {
+        prefix + source
+        for prefix in prefixes
+        for source in all_sources
+    }
+
+    not_processed_sources = sorted(
+        all_experiments - set(experiments_df["Source"])
+    )
 
-    not_produced_df = pd.DataFrame({
-        "Source": list(not_processed_sources),
-        "Status": "Error"
-    })
+    LOGGER.info(
+        f"Sources not processed: {len(not_processed_sources)} " + \
+        f"{not_processed_sources}"
+    )
 
     results_df = pd.concat(
-        [results_df, not_produced_df],
+        [
+            experiments_df[["Source", "Status"]],
+            pd.DataFrame({
+                "Source": not_processed_sources,
+                "Status": "Error"
+            })
+        ],
         axis=0,
         ignore_index=True
     )
@@ -149,25 +331,21 @@ def plot_retropath_results(
     return fig
 
 
-def get_classes_counts(
-    results_df: pd.DataFrame,
-    config: dict
-) -> pd.DataFrame:
+def read_class_file(item: tuple) -> pd.DataFrame:
     """
-    Get the compound classes to further analyse RetroPath results.
+    Read one of the files of the compound class reference.
 
     Parameters
     ----------
-    results_df : pandas.DataFrame
-        Dataframe containing the results for each source obtained with function
-        get_retropath_results.
-    config : dict
-        The configuration dictionary.
+    item : tuple
+        The kind of file ("detectables", "producibles" or "annotation") and
+        its path.
 
     Returns
     -------
     _ : pandas.DataFrame
-        Dataframe containing the counts per status and class.
+        Dataframe containing the columns "ID" and "Source" for compound
+        lists, or "ID" and "Class" for annotations.
 
     Examples
     --------
@@ -175,73 +353,56 @@ def get_classes_counts(
 
     """
 
-    # Load compound SMILES and names
-    detectable_df = pd.read_excel(
-        os.path.join(
-            config["paths"]["retropath_classes"],
-            "Detectables_list.xlsx"
-        ),
-        header=None,
-        names=["ID", "SMILES"] + list(range(11)) + ["Source"]
-    )
-    producible_df = pd.read_excel(
-        os.path.join(
-            config["paths"]["retropath_classes"],
-            "Producibles_list.xlsx"
-        ),
+    kind, path = item
+
+    if kind == "annotation":
+        return pd.read_table(path, names=["Index", "ID", "Class"])\
+            [["ID", "Class"]]
+
+    n_columns = 11 if kind == "detectables" else 7
+    compounds_df = pd.read_excel(
+        path,
         header=None,
-        names=["ID", "SMILES"] + list(range(7)) + ["Source"]
+        names=["ID", "SMILES"] + list(range(n_columns)) + ["Source"]
     )
 
-    # Drop separator columns
-    detectable_df = detectable_df.dropna(how="all", axis=1)
-    producible_df = producible_df.dropna(how="all", axis=1)
+    return compounds_df[["ID", "Source"]]
 
-    smiles_df = pd.concat(
-        [detectable_df, producible_df],
-        axis=0,
-        ignore_index=True
-    )
 
-    # Load compound classes
-    class_df = pd.concat(
-        [
-            pd.read_table(
-                os.path.join(
-                    config["paths"]["retropath_classes"],
-                    "AnotacionDetectables.txt"
-                ),
-                names=["Index", "ID", "Class"]
-            ),
-            pd.read_table(
-                os.path.join(
-                    config["paths"]["retropath_classes"],
-                    "AnotacionDetectablesEnvipath.txt"
-                ),
-                names=["Index", "ID", "Class"]
-            ),
-            pd.read_table(
-                os.path.join(
-                    config["paths"]["retropath_classes"],
-                    "AnotacionProducibles.txt"
-                ),
-                names=["Index", "ID", "Class"]
-            ),
-            pd.read_table(
-                os.path.join(
-                    config["paths"]["retropath_classes"],
-                    "AnotacionProduciblesEnvipath.txt"
-                ),
-                names=["Index", "ID", "Class"]
-            )
+@lru_cache(maxsize=1)
+def _load_class_reference(
+    classes_dir: str,
+    snapshot_path: str,
+    signatures: tuple,
+    n_jobs: int = 1
+) -> pd.DataFrame:
+    """
+    Load the compound class reference, shared by every call with the same
+    signatures (see load_class_reference).
+    """
+
+    metadata = {"signatures": [list(signature) for signature in signatures]}
+
+    if os.path.exists(snapshot_path) and \
+        load_columnar_metadata(snapshot_path) == metadata:
+        LOGGER.debug(f"Loading class reference snapshot {snapshot_path}")
+        return load_columnar(snapshot_path)
+
+    frames = parallel_map(
+        func=read_class_file,
+        items=[
+            (kind, os.path.join(classes_dir, filename))
+            for kind, filename in CLASS_FILES
         ],
-        axis=0,
-        ignore_index=True
+        n_jobs=n_jobs,
+        min_pool_size=2
     )
 
     # Drop potential duplicates
-    smiles_df = smiles_df.drop_duplicates()
-    class_df = class_df.drop_duplicates()
+    smiles_df = pd.concat(frames[:2], axis=0, ignore_index=True)\
+        .drop_duplicates()
+    class_df = pd.concat(frames[2:], axis=0, ignore_index=True)\
+        .drop_duplicates()
 
     merged_df = pd.merge(
         left=smiles_df,
@@ -249,21 +410,121 @@ def get_classes_counts(
         on="ID",
         how="left"
     )
-    merged_df = merged_df[["Source", "Class"]]
 
-    # Lower case to match the other dataframe
-    merged_df["Source"] = merged_df["Source"].str.lower()
-    results_df["Source"] = results_df["Source"].str.lower()
+    # Lower case to match the source names of the results
+    reference_df = pd.DataFrame({
+        "key": pd.Categorical(merged_df["Source"].str.lower()),
+        "Class": pd.Categorical(merged_df["Class"])
+    })
+
+    save_columnar(df=reference_df, path=snapshot_path, metadata=metadata)
+
+    LOGGER.info(f"Saved class reference snapshot to {snapshot_path}")
+
+    return reference_df
+
+
+def load_class_reference(
+    classes_dir: str,
+    snapshot_path: str,
+    signatures: tuple,
+    n_jobs: int = 1
+) -> pd.DataFrame:
+    """
+    Load the compound class reference, i.e. the class of each source.
+
+    The source files are read in parallel the first time and a columnar
+    snapshot is saved, which is used instead until the files change. The
+    reference is also kept in memory, and each call gets its own copy.
+
+    Parameters
+    ----------
+    classes_dir : str
+        The directory containing the compound lists and annotations.
+    snapshot_path : str
+        The path to the snapshot (.npz).
+    signatures : tuple
+        The signature of each source file (see
+        biofoundry.retropath.cache.TableCache.get_signature), which also
+        keys the in-memory cache.
+    n_jobs : int
+        The number of worker processes.
+
+    Returns
+    -------
+    reference_df : pandas.DataFrame
+        Dataframe containing the lowercase source name ("key") and its
+        class.
+
+    Examples
+    --------
+    None
+
+    """
+
+    return _load_class_reference(
+            classes_dir=classes_dir,
+            snapshot_path=snapshot_path,
+            signatures=signatures,
+            n_jobs=n_jobs
+        )\
+        .copy()
+
+
+def get_classes_counts(
+    results_df: pd.DataFrame,
+    config: dict
+) -> pd.DataFrame:
+    """
+    Get the compound classes to further analyse RetroPath results.
+
+    Parameters
+    ----------
+    results_df : pandas.DataFrame
+        Dataframe containing the results for each source obtained with function
+        get_retropath_results.
+    config : dict
+        The configuration dictionary.
 
+    Returns
+    -------
+    _ : pandas.DataFrame
+        Dataframe containing the counts per status and class.
+
+    Examples
+    --------
+    None
+
+    """
+
+    classes_dir = config["paths"]["retropath_classes"]
+
+    reference_df = load_class_reference(
+        classes_dir=classes_dir,
+        snapshot_path=os.path.join(
+            config["paths"]["retropath"],
+            config["retropath"].get("cache", {}).get("dir", "cache/"),
+            CLASS_SNAPSHOT
+        ),
+        signatures=tuple(
+            TableCache.get_signature(os.path.join(classes_dir, filename))
+            for _, filename in CLASS_FILES
+        ),
+        n_jobs=config["retropath"].get("n_jobs", 1)
+    )
+
+    # Organism partitions are named <organism>/<source>
     results_class_df = pd.merge(
-        left=results_df,
-        right=merged_df,
-        on="Source",
+        left=results_df[["Status", "Source"]].assign(
+            key=results_df["Source"].str.split("/").str[-1].str.lower()
+        ),
+        right=reference_df,
+        on="key",
         how="left"
     )
 
     return results_class_df\
-        .groupby(["Status", "Class"], as_index=False)\
+        .groupby(["Status", "Class"], as_index=False, observed=True)["Source"]\
         .count()\
         .rename(columns={"Source": "Frequency"})\
         .sort_values("Frequency", ascending=False)
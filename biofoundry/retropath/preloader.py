@@ -4,13 +4,53 @@ from typing import Iterable
 
 import os
 import json
+import glob
 
 import csv
+import numpy as np
 import pandas as pd
 
-from rdkit import Chem
-
 from biofoundry.base import BaseRetroPathPreloader
+from biofoundry.retropath.cache import TableCache
+from biofoundry.retropath.chem import (
+    ConversionCache,
+    get_inchis_from_smiles,
+    get_inchikeys,
+    get_standardized_inchis,
+    normalize_reaction_smarts
+)
+from biofoundry.retropath.expansion import (
+    EXPANSION_RESULTS,
+    UNREACHABLE,
+    get_incidence,
+    expand_network
+)
+from biofoundry.retropath.fingerprints import (
+    NEAREST_NEIGHBOURS,
+    SimilarityIndex,
+    get_fingerprints
+)
+from biofoundry.retropath.incremental import STEPS_MANIFEST, StepManifest
+from biofoundry.retropath.scheduling import (
+    COST_DESCRIPTORS,
+    get_cost_descriptors
+)
+from biofoundry.retropath.sources import (
+    EXCLUDED_SOURCES,
+    PACKED_SOURCES,
+    PACKED_SOURCES_INDEX,
+    write_source_files,
+    write_packed_sources
+)
+from biofoundry.retropath.store import (
+    SUBSTRATE,
+    PRODUCT,
+    save_columnar,
+    load_columnar,
+    load_columnar_metadata,
+    parse_chem_xref,
+    parse_stoichiometry
+)
 
 
 # Configure logging
@@ -25,6 +65,14 @@ logging.basicConfig(
 LOGGER = logging.getLogger("retropath-" + __name__)
 
 
+# Per-organism rules and sinks, inside the RetroPath2.0 folder
+PARTITIONS_DIR = "partitions/"
+
+# Sink modes: compounds of the rules, optionally restricted to the metabolites
+# of the formatted GEMs
+SINK_MODES = ["rules", "models"]
+
+
 class RetroPathPreloader(BaseRetroPathPreloader):
     """
     Auxiliary class for generating RetroPath2.0 inputs.
@@ -45,25 +93,37 @@ class RetroPathPreloader(BaseRetroPathPreloader):
 
         self.config = config
 
+        # Reference tables shared across calls
+        self.tables = TableCache(
+            max_size_mb=self.config["retropath"]\
+                .get("cache", {})\
+                .get("max_size_mb", 1024)
+        )
+
+        # Compound to organisms index, built on first use
+        self._source_index = None
+
+        # Inputs of each step, for skipping steps whose inputs did not change
+        self.steps = StepManifest(
+            path=self.get_cache_path(STEPS_MANIFEST)
+            if self.config["retropath"].get("cache", {}).get("incremental")
+            else None
+        )
+
     @staticmethod
-    def get_ec_from_model(
-        model_dict: dict,
-        modelseed_reactions: pd.DataFrame
-    ) -> pd.DataFrame:
+    def read_metanetx_reac_prop(path: str) -> pd.DataFrame:
         """
-        Get the EC numbers from a GEM model.
+        Read MetaNetX reac_prop.tsv file.
 
         Parameters
         ----------
-        model_dict : dict
-            The model as a dictionary.
-        modelseed_reactions : pandas.DataFrame
-            ModelSEED reactions mapping model IDs (RXNs) to EC numbers.
+        path : str
+            The path to the reac_prop.tsv file.
 
         Returns
         -------
-        ec_numbers_df : pandas.DataFrame
-            Dataframe containing each all EC numbers found for the model.
+        _ : pandas.DataFrame
+            Dataframe containing the MetaNetX reactions.
 
         Examples
         --------
@@ -71,46 +131,103 @@ class RetroPathPreloader(BaseRetroPathPreloader):
 
         """
 
-        # Get reaction IDs
-        reaction_ids = [
-            item["id"].split("_")[0]
-            for item in model_dict["reactions"]
-        ]
+        return pd.read_table(
+            path,
+            comment="#", # Skip comment rows
+            header=None,
+            names=[
+                "ID",
+                "mnx_equation",
+                "reference",
+                "classifs",
+                "is_balanced",
+                "is_transport"
+            ]
+        )
 
-        LOGGER.info(f"Number of reaction IDs: {len(reaction_ids)}")
+    @staticmethod
+    def read_metanetx_chem_prop(path: str) -> pd.DataFrame:
+        """
+        Read MetaNetX chem_prop.tsv file.
 
-        ec_numbers_df = modelseed_reactions[
-            modelseed_reactions["id"].isin(reaction_ids)
-        ]["ec_numbers"]
+        Parameters
+        ----------
+        path : str
+            The path to the chem_prop.tsv file.
 
-        LOGGER.info(f"Number of EC numbers (raw): {len(ec_numbers_df)}")
+        Returns
+        -------
+        _ : pandas.DataFrame
+            Dataframe containing the MetaNetX compounds.
 
-        # Explode series since there may be multiple EC numbers per reaction
-        ec_numbers_df = ec_numbers_df.str.split("|").explode()
+        Examples
+        --------
+        None
 
-        LOGGER.info(f"Number of EC numbers: {len(ec_numbers_df)}")
+        """
 
-        # Convert to frame
-        ec_numbers_df = ec_numbers_df.to_frame()
+        return pd.read_table(
+            path,
+            comment="#", # Skip comment rows
+            header=None,
+            names=[
+                "Name", # Format for sink.csv
+                "compound",
+                "reference",
+                "formula",
+                "charge",
+                "mass",
+                "InChI",
+                "InChIKey",
+                "SMILES"
+            ]
+        )
 
-        # Add model ID
-        ec_numbers_df["ID"] = model_dict["id"]
+    def load_metanetx_reac_prop(self) -> pd.DataFrame:
+        """
+        Load MetaNetX reactions through the reference tables cache.
 
-        return ec_numbers_df
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        metanetx_reac_prop : pandas.DataFrame
+            Dataframe containing the MetaNetX reactions.
+
+        Examples
+        --------
+        None
 
-    def get_ec_numbers(self, metadata: pd.DataFrame) -> pd.DataFrame:
         """
-        Get all the EC numbers for each model specified in the metadata.
+
+        metanetx_reac_path = os.path.join(
+            self.config["paths"]["metanetx"],
+            "reac_prop.tsv"
+        )
+        metanetx_reac_prop = self.tables.load(
+            path=metanetx_reac_path,
+            reader=self.read_metanetx_reac_prop
+        )
+
+        LOGGER.debug(f"Loaded MetaNetX reactions from {metanetx_reac_path}")
+        LOGGER.debug(f"Number of MetaNetX reactions: {len(metanetx_reac_prop)}")
+
+        return metanetx_reac_prop
+
+    def load_metanetx_chem_prop(self) -> pd.DataFrame:
+        """
+        Load MetaNetX compounds through the reference tables cache.
 
         Parameters
         ----------
-        metadata : pandas.DataFrame
-            The dataframe containing the models' paths.
+        None
 
         Returns
         -------
-        all_ec_numbers_df : pandas.DataFrame
-            Dataframe containing each all EC numbers found for the model.
+        metanetx_chem_prop : pandas.DataFrame
+            Dataframe containing the MetaNetX compounds.
 
         Examples
         --------
@@ -118,71 +235,115 @@ class RetroPathPreloader(BaseRetroPathPreloader):
 
         """
 
-        # Get EC numbers from reactions in ModelSEED
-        modelseed_path = os.path.join(
-            self.config["paths"]["modelseed"],
-            "reactions.tsv"
+        metanetx_chem_path = os.path.join(
+            self.config["paths"]["metanetx"],
+            "chem_prop.tsv"
+        )
+        metanetx_chem_prop = self.tables.load(
+            path=metanetx_chem_path,
+            reader=self.read_metanetx_chem_prop
         )
-        modelseed_reactions = pd.read_table(modelseed_path)
 
-        LOGGER.debug(f"Loaded ModelSEED from {modelseed_path}")
-        LOGGER.debug(
-             f"Number of ModelSEED reactions: {len(modelseed_reactions)}"
+        LOGGER.debug(f"Loaded MetaNetX compounds from {metanetx_chem_path}")
+        LOGGER.debug(f"Number of MetaNetX compounds: {len(metanetx_chem_prop)}")
+
+        return metanetx_chem_prop
+
+    @staticmethod
+    def read_metanetx_chem_xref(path: str) -> pd.DataFrame:
+        """
+        Read MetaNetX chem_xref.tsv file.
+
+        Parameters
+        ----------
+        path : str
+            The path to the chem_xref.tsv file.
+
+        Returns
+        -------
+        _ : pandas.DataFrame
+            Dataframe containing the MetaNetX cross-references.
+
+        Examples
+        --------
+        None
+
+        """
+
+        return pd.read_table(
+            path,
+            comment="#", # Skip comment rows
+            header=None,
+            names=[
+                "xref",
+                "ID",
+                "description"
+            ],
+            usecols=["xref", "ID"],
+            dtype=str
         )
 
-        # Create empty dataframe
-        all_ec_numbers_df = pd.DataFrame()
+    def load_chem_xref(self) -> pd.DataFrame:
+        """
+        Load the index of ModelSEED compounds in MetaNetX, parsing
+        chem_xref.tsv only when it changed since the last time it was parsed.
 
-        for organism in metadata["Code"]:
+        Parameters
+        ----------
+        None
 
-            LOGGER.info(f"Starting with organism {organism}")
+        Returns
+        -------
+        chem_xref_df : pandas.DataFrame
+            Dataframe with one row per ModelSEED compound (see
+            biofoundry.retropath.store.parse_chem_xref).
 
-            model_path = os.path.join(
-                self.config["paths"]["models"],
-                f"{organism}.json"
-            )
+        Examples
+        --------
+        None
 
-            # Load model
-            with open(model_path, mode="r") as fh:
-                model_dict = json.loads(fh.read())
+        """
 
-            # Append results to dataframe
-            all_ec_numbers_df = pd.concat(
-                [
-                    all_ec_numbers_df,
-                    self.get_ec_from_model(
-                        model_dict=model_dict,
-                        modelseed_reactions=modelseed_reactions
-                    )
-                ],
-                axis=0,
-                ignore_index=True
+        metanetx_xref_path = os.path.join(
+            self.config["paths"]["metanetx"],
+            "chem_xref.tsv"
+        )
+        chem_xref_path = self.get_cache_path("chem_xref.npz")
+
+        # Identify the version of chem_xref.tsv the index was built from
+        stat = os.stat(metanetx_xref_path)
+        source = {
+            "path": os.path.abspath(metanetx_xref_path),
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size
+        }
+
+        if not os.path.exists(chem_xref_path) or \
+            load_columnar_metadata(chem_xref_path).get("source") != source:
+
+            LOGGER.info(f"Building ModelSEED index from {metanetx_xref_path}")
+
+            save_columnar(
+                df=parse_chem_xref(
+                    self.read_metanetx_chem_xref(metanetx_xref_path)
+                ),
+                path=chem_xref_path,
+                metadata={"source": source}
             )
 
-        # Save to file
-        ec_path = os.path.join(
-            self.config["paths"]["retropath"],
-            self.config["retropath"]["files"]["ec_numbers"]
-        )
-        all_ec_numbers_df.to_csv(
-            ec_path,
-            header=True,
-            index=False,
-            sep=",",
-            mode="w",
-            quotechar='"',
-            quoting=csv.QUOTE_MINIMAL # Avoid errors with commas in names
+        chem_xref_df = self.tables.load(
+            path=chem_xref_path,
+            reader=load_columnar
         )
 
-        LOGGER.info(f"Saved community EC numbers to {ec_path}")
-        LOGGER.info(f"Total amount of EC numbers: {len(all_ec_numbers_df)}")
+        LOGGER.debug(f"Loaded ModelSEED index from {chem_xref_path}")
+        LOGGER.debug(f"Number of ModelSEED compounds: {len(chem_xref_df)}")
 
-        return all_ec_numbers_df
+        return chem_xref_df
 
-    def get_rules(self) -> pd.DataFrame:
+    def load_ec_numbers(self) -> pd.DataFrame:
         """
-        Get the rules by filtering RetroRules database by the EC numbers found
-        in the community.
+        Load the community EC numbers through the reference tables cache.
 
         Parameters
         ----------
@@ -190,8 +351,8 @@ class RetroPathPreloader(BaseRetroPathPreloader):
 
         Returns
         -------
-        rules_df : pandas.DataFrame
-            Dataframe containing all rules found in the community.
+        ec_num_df : pandas.DataFrame
+            Dataframe containing the EC numbers of each organism.
 
         Examples
         --------
@@ -199,68 +360,83 @@ class RetroPathPreloader(BaseRetroPathPreloader):
 
         """
 
-        # Load EC numbers in the community
         ec_numbers_path = os.path.join(
             self.config["paths"]["retropath"],
             self.config["retropath"]["files"]["ec_numbers"]
         )
-        ec_num_df = pd.read_csv(ec_numbers_path, sep=",")
+        ec_num_df = self.tables.load(
+            path=ec_numbers_path,
+            reader=lambda path: pd.read_csv(path, sep=",")
+        )
 
         LOGGER.debug(f"Loaded community EC numbers from {ec_numbers_path}")
         LOGGER.debug(f"Number of ECs: {len(ec_num_df)}")
 
-        # Load RetroRules database
-        retrorules_path = self.config["paths"]["retrorules"]
-        retrorules_df = pd.read_csv(retrorules_path, sep=",")
-
-        LOGGER.debug(f"Loaded RetroRules from {retrorules_path}")
-        LOGGER.debug(f"Number of RetroRules: {len(retrorules_df)}")
-
-        # Drop potential duplicates (more than one species with the same EC)
-        ec_numbers = ec_num_df["ec_numbers"].unique()
+        return ec_num_df
 
-        LOGGER.debug(f"Dropped duplicates in ECs: {len(ec_numbers)} unique")
+    def load_rules(self) -> pd.DataFrame:
+        """
+        Load the community rules through the reference tables cache.
 
-        # Explode rules with multiple EC numbers
-        retrorules_df["EC number"] = retrorules_df["EC number"].str.split(";")
-        retrorules_df = retrorules_df\
-            .explode("EC number")\
-            .reset_index(drop=True)
+        Parameters
+        ----------
+        None
 
-        LOGGER.debug(f"Exploded ECs in RetroRules: {len(retrorules_df)} total")
+        Returns
+        -------
+        rules_df : pandas.DataFrame
+            Dataframe containing the rules found in the community.
 
-        # Filter by found EC numbers in the community
-        rules_df = retrorules_df[
-            retrorules_df["EC number"].isin(ec_numbers)
-        ]
+        Examples
+        --------
+        None
 
-        LOGGER.info(
-            f"Retrieved rules by ECs present in the community: {len(rules_df)}"
-        )
+        """
 
-        # Save to file
         rules_path = os.path.join(
             self.config["paths"]["retropath"],
             self.config["retropath"]["files"]["rules"]
         )
-        rules_df.to_csv(
-            rules_path,
-            header=True,
-            index=False,
-            sep=",",
-            quotechar='"',
-            quoting=csv.QUOTE_MINIMAL # Avoid errors with commas in names
+        rules_df = self.tables.load(
+            path=rules_path,
+            reader=lambda path: pd.read_csv(path, sep=",")
         )
 
-        LOGGER.info(f"Saved community rules to {rules_path}")
+        LOGGER.debug(f"Loaded community rules from {rules_path}")
+        LOGGER.debug(f"Number of community rules: {len(rules_df)}")
 
         return rules_df
 
-    def get_sink(self) -> pd.DataFrame:
+    def get_cache_path(self, filename: str) -> str:
+        """
+        Get the path of a file inside the cache directory.
+
+        Parameters
+        ----------
+        filename : str
+            The name of the cached file.
+
+        Returns
+        -------
+        _ : str
+            The path to the cached file.
+
+        Examples
+        --------
+        None
+
         """
-        Get the sink by extracting compounds from the rules when:
-            - They appear in the reactants
-            - They appear in the products if their rule is reversible
+
+        return os.path.join(
+            self.config["paths"]["retropath"],
+            self.config["retropath"].get("cache", {}).get("dir", "cache/"),
+            filename
+        )
+
+    def load_stoichiometry(self) -> pd.DataFrame:
+        """
+        Load the stoichiometry of MetaNetX reactions, parsing reac_prop.tsv
+        only when it changed since the last time it was parsed.
 
         Parameters
         ----------
@@ -268,8 +444,9 @@ class RetroPathPreloader(BaseRetroPathPreloader):
 
         Returns
         -------
-        sink_df : pandas.DataFrame
-            Dataframe containing as the compounds found for the given rules.
+        stoichiometry_df : pandas.DataFrame
+            Dataframe with one row per reaction and compound (see
+            biofoundry.retropath.store.parse_stoichiometry).
 
         Examples
         --------
@@ -277,64 +454,589 @@ class RetroPathPreloader(BaseRetroPathPreloader):
 
         """
 
-        # Read MetaNetX reac_prop.tsv file
         metanetx_reac_path = os.path.join(
             self.config["paths"]["metanetx"],
             "reac_prop.tsv"
         )
-        metanetx_reac_prop = pd.read_table(
-            metanetx_reac_path,
-            comment="#", # Skip comment rows
-            header=None,
-            names=[
-                "ID",
-                "mnx_equation",
-                "reference",
-                "classifs",
-                "is_balanced",
-                "is_transport"
+        stoichiometry_path = self.get_cache_path("reac_stoichiometry.npz")
+
+        # Identify the version of reac_prop.tsv the store was built from
+        stat = os.stat(metanetx_reac_path)
+        source = {
+            "path": os.path.abspath(metanetx_reac_path),
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size
+        }
+
+        if not os.path.exists(stoichiometry_path) or \
+            load_columnar_metadata(stoichiometry_path).get("source") != source:
+
+            LOGGER.info(f"Building stoichiometry store from {metanetx_reac_path}")
+
+            save_columnar(
+                df=parse_stoichiometry(self.load_metanetx_reac_prop()),
+                path=stoichiometry_path,
+                metadata={"source": source}
+            )
+
+        stoichiometry_df = self.tables.load(
+            path=stoichiometry_path,
+            reader=load_columnar
+        )
+
+        LOGGER.debug(f"Loaded stoichiometry store from {stoichiometry_path}")
+        LOGGER.debug(f"Number of stoichiometry rows: {len(stoichiometry_df)}")
+
+        return stoichiometry_df
+
+    @staticmethod
+    def get_reaction_codes(
+        stoichiometry_df: pd.DataFrame,
+        reaction_ids: pd.Series
+    ) -> np.ndarray:
+        """
+        Map MetaNetX reaction IDs to the integer codes of the stoichiometry
+        store.
+
+        Parameters
+        ----------
+        stoichiometry_df : pandas.DataFrame
+            The stoichiometry store.
+        reaction_ids : pandas.Series
+            The MetaNetX reaction IDs (MNXR).
+
+        Returns
+        -------
+        _ : numpy.ndarray
+            The reaction codes, -1 for reactions missing in MetaNetX.
+
+        Examples
+        --------
+        None
+
+        """
+
+        return stoichiometry_df["reaction"].cat.categories\
+            .get_indexer(reaction_ids)
+
+    @staticmethod
+    def get_ec_from_model(
+        model_dict: dict,
+        modelseed_reactions: pd.DataFrame
+    ) -> pd.DataFrame:
+        """
+        Get the EC numbers from a GEM model.
+
+        Parameters
+        ----------
+        model_dict : dict
+            The model as a dictionary.
+        modelseed_reactions : pandas.DataFrame
+            ModelSEED reactions mapping model IDs (RXNs) to EC numbers.
+
+        Returns
+        -------
+        ec_numbers_df : pandas.DataFrame
+            Dataframe containing each all EC numbers found for the model.
+
+        Examples
+        --------
+        None
+
+        """
+
+        # Get reaction IDs
+        reaction_ids = [
+            item["id"].split("_")[0]
+            for item in model_dict["reactions"]
+        ]
+
+        LOGGER.info(f"Number of reaction IDs: {len(reaction_ids)}")
+
+        ec_numbers_df = modelseed_reactions[
+            modelseed_reactions["id"].isin(reaction_ids)
+        ]["ec_numbers"]
+
+        LOGGER.info(f"Number of EC numbers (raw): {len(ec_numbers_df)}")
+
+        # Explode series since there may be multiple EC numbers per reaction
+        ec_numbers_df = ec_numbers_df.str.split("|").explode()
+
+        LOGGER.info(f"Number of EC numbers: {len(ec_numbers_df)}")
+
+        # Convert to frame
+        ec_numbers_df = ec_numbers_df.to_frame()
+
+        # Add model ID
+        ec_numbers_df["ID"] = model_dict["id"]
+
+        return ec_numbers_df
+
+    @staticmethod
+    def get_metabolites_from_model(model_dict: dict) -> list:
+        """
+        Get the ModelSEED compound IDs of the metabolites of a GEM model.
+
+        Parameters
+        ----------
+        model_dict : dict
+            The model as a dictionary, formatted or not.
+
+        Returns
+        -------
+        _ : list
+            The unique ModelSEED compound IDs (cpds), without compartments.
+
+        Examples
+        --------
+        >>> RetroPathPreloader.get_metabolites_from_model(
+        >>>     {"metabolites": [{"id": "cpd00001=H2O_c"}, {"id": "cpd00001_e0"}]}
+        >>> )
+        ['cpd00001']
+
+        """
+
+        # Formatted models append the abbreviation, e.g. cpd00001=H2O_c
+        return list(dict.fromkeys(
+            item["id"].split("=")[0].rsplit("_", 1)[0]
+            for item in model_dict["metabolites"]
+        ))
+
+    def get_model_paths(self) -> list:
+        """
+        Get the paths to the formatted GEM models.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        _ : list
+            The sorted paths to the formatted models.
+
+        Examples
+        --------
+        None
+
+        """
+
+        return sorted(glob.glob(
+            os.path.join(
+                self.config["paths"]["models"],
+                "*_formatted.json"
+            )
+        ))
+
+    def get_model_compounds(
+        self,
+        stoichiometry_df: pd.DataFrame
+    ) -> pd.DataFrame:
+        """
+        Get the compounds of the stoichiometry store found in each formatted
+        GEM model, mapping their ModelSEED metabolites to MetaNetX through
+        the cross-references index.
+
+        Parameters
+        ----------
+        stoichiometry_df : pandas.DataFrame
+            The stoichiometry store.
+
+        Returns
+        -------
+        model_compounds_df : pandas.DataFrame
+            Dataframe with the columns "Organism" (model ID, as in the EC
+            numbers file) and "compound" (integer code of the stoichiometry
+            store).
+
+        Examples
+        --------
+        None
+
+        """
+
+        chem_xref_df = self.load_chem_xref()
+
+        xref_ids = chem_xref_df["xref"].cat.categories
+        compound_ids = chem_xref_df["compound"].cat.categories
+
+        # Rows follow the order of the ModelSEED categories
+        xref_compounds = chem_xref_df["compound"].cat.codes.to_numpy()
+
+        stoichiometry_ids = stoichiometry_df["compound"].cat.categories
+
+        model_compounds = []
+        for model_path in self.get_model_paths():
+
+            with open(model_path, mode="r") as fh:
+                model_dict = json.loads(fh.read())
+
+            metabolites = self.get_metabolites_from_model(model_dict)
+
+            positions = xref_ids.get_indexer(metabolites)
+            positions = positions[positions >= 0]
+
+            codes = stoichiometry_ids.get_indexer(
+                compound_ids[np.unique(xref_compounds[positions])]
+            )
+            codes = codes[codes >= 0]
+
+            LOGGER.debug(
+                f"Model {model_dict['id']}: {len(positions)}/" + \
+                f"{len(metabolites)} metabolites mapped to MetaNetX, " + \
+                f"{len(codes)} in MetaNetX reactions"
+            )
+
+            model_compounds.append(pd.DataFrame({
+                "Organism": model_dict["id"],
+                "compound": codes
+            }))
+
+        if not model_compounds:
+            LOGGER.warning(
+                "No formatted models found in " + \
+                self.config["paths"]["models"]
+            )
+
+            return pd.DataFrame({
+                "Organism": pd.Series(dtype=str),
+                "compound": pd.Series(dtype=np.intp)
+            })
+
+        return pd.concat(model_compounds, axis=0, ignore_index=True)
+
+    def get_ec_numbers(self, metadata: pd.DataFrame) -> pd.DataFrame:
+        """
+        Get all the EC numbers for each model specified in the metadata.
+
+        Parameters
+        ----------
+        metadata : pandas.DataFrame
+            The dataframe containing the models' paths.
+
+        Returns
+        -------
+        all_ec_numbers_df : pandas.DataFrame
+            Dataframe containing each all EC numbers found for the model.
+            If the models and ModelSEED did not change since the last call
+            (and the cache is incremental), the saved EC numbers are returned.
+
+        Examples
+        --------
+        None
+
+        """
+
+        modelseed_path = os.path.join(
+            self.config["paths"]["modelseed"],
+            "reactions.tsv"
+        )
+        model_paths = {
+            organism: os.path.join(
+                self.config["paths"]["models"],
+                f"{organism}.json"
+            )
+            for organism in metadata["Code"]
+        }
+        ec_path = os.path.join(
+            self.config["paths"]["retropath"],
+            self.config["retropath"]["files"]["ec_numbers"]
+        )
+
+        fingerprint = self.steps.get_fingerprint(
+            files=[modelseed_path, *model_paths.values()],
+            params={"organisms": list(model_paths)}
+        )
+        if self.steps.is_fresh("ec_numbers", fingerprint):
+            return self.load_ec_numbers()
+
+        # ModelSEED is only loaded if any model changed
+        modelseed_reactions = None
+
+        # Create empty dataframe
+        all_ec_numbers_df = pd.DataFrame()
+
+        for organism, model_path in model_paths.items():
+
+            LOGGER.info(f"Starting with organism {organism}")
+
+            # Reuse the EC numbers of unchanged models
+            model_step = f"ec_numbers/{organism}"
+            model_ec_path = self.get_cache_path(
+                os.path.join("ec_numbers", f"{organism}.csv")
+            )
+            model_fingerprint = self.steps.get_fingerprint(
+                files=[modelseed_path, model_path]
+            )
+
+            if self.steps.is_fresh(model_step, model_fingerprint):
+                ec_numbers_df = pd.read_csv(model_ec_path, dtype=str)
+
+            else:
+                # Get EC numbers from reactions in ModelSEED
+                if modelseed_reactions is None:
+                    modelseed_reactions = self.tables.load(
+                        path=modelseed_path,
+                        reader=pd.read_table
+                    )
+
+                    LOGGER.debug(f"Loaded ModelSEED from {modelseed_path}")
+                    LOGGER.debug(
+                        "Number of ModelSEED reactions: " + \
+                        str(len(modelseed_reactions))
+                    )
+
+                # Load model
+                with open(model_path, mode="r") as fh:
+                    model_dict = json.loads(fh.read())
+
+                ec_numbers_df = self.get_ec_from_model(
+                    model_dict=model_dict,
+                    modelseed_reactions=modelseed_reactions
+                )
+
+                if self.steps.enabled:
+                    os.makedirs(os.path.dirname(model_ec_path), exist_ok=True)
+                    ec_numbers_df.to_csv(model_ec_path, header=True, index=False)
+
+                    self.steps.record(
+                        step=model_step,
+                        fingerprint=model_fingerprint,
+                        outputs=[model_ec_path]
+                    )
+
+            # Append results to dataframe
+            all_ec_numbers_df = pd.concat(
+                [all_ec_numbers_df, ec_numbers_df],
+                axis=0,
+                ignore_index=True
+            )
+
+        # Save to file
+        all_ec_numbers_df.to_csv(
+            ec_path,
+            header=True,
+            index=False,
+            sep=",",
+            mode="w",
+            quotechar='"',
+            quoting=csv.QUOTE_MINIMAL # Avoid errors with commas in names
+        )
+
+        LOGGER.info(f"Saved community EC numbers to {ec_path}")
+        LOGGER.info(f"Total amount of EC numbers: {len(all_ec_numbers_df)}")
+
+        self.steps.record(
+            step="ec_numbers",
+            fingerprint=fingerprint,
+            outputs=[ec_path]
+        )
+
+        return all_ec_numbers_df
+
+    def filter_rules(self, rules_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Filter rules by the diameter window of RetroPath2.0 (dmin and dmax
+        parameters) and by rule usage, optionally dropping duplicated rules.
+        Duplicates must share the MetaNetX reaction (MNXR) of their rule ID,
+        so deduplication never removes a reaction from the sink compounds.
+
+        Parameters
+        ----------
+        rules_df : pandas.DataFrame
+            Dataframe containing RetroRules rules.
+
+        Returns
+        -------
+        rules_df : pandas.DataFrame
+            Dataframe containing the filtered rules.
+
+        Examples
+        --------
+        None
+
+        """
+
+        params = self.config["retropath"]["params"]
+        rules_config = self.config["retropath"].get("rules", {})
+
+        # Keep only the diameters used by RetroPath2.0
+        if "Diameter" in rules_df.columns:
+            rules_df = rules_df[
+                rules_df["Diameter"].between(params["dmin"], params["dmax"])
             ]
+
+            LOGGER.info(
+                f"Rules with diameters between {params['dmin']} and " + \
+                f"{params['dmax']}: {len(rules_df)}"
+            )
+
+        else:
+            LOGGER.warning(
+                "No Diameter column in RetroRules, skipping diameter filter"
+            )
+
+        # Keep only the requested rule usages (e.g. "both" and "retro")
+        usage = rules_config.get("usage")
+        if usage is not None:
+            rules_df = rules_df[rules_df["Rule usage"].isin(usage)]
+
+            LOGGER.info(f"Rules with usage in {usage}: {len(rules_df)}")
+
+        # Drop rules sharing the same reaction SMARTS for the same EC number
+        # and MetaNetX reaction, the sink is built from the rules' MNXRs
+        if rules_config.get("deduplicate", False):
+            normalized = rules_df["Rule"].map(normalize_reaction_smarts)
+
+            duplicated = pd.DataFrame({
+                    "MNXR": rules_df["Rule ID"].str.split("_").str[0],
+                    "EC number": rules_df["EC number"],
+                    "Rule usage": rules_df["Rule usage"],
+                    "Rule": normalized
+                })\
+                .duplicated(keep="first")
+
+            rules_df = rules_df[~duplicated.to_numpy()]
+
+            LOGGER.info(
+                f"Dropped {duplicated.sum()} duplicated rules: " + \
+                f"{len(rules_df)} remaining"
+            )
+
+        return rules_df.reset_index(drop=True)
+
+    def get_rules(self) -> pd.DataFrame:
+        """
+        Get the rules by filtering RetroRules database by the EC numbers found
+        in the community.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        rules_df : pandas.DataFrame
+            Dataframe containing all rules found in the community.
+
+        Examples
+        --------
+        None
+
+        """
+
+        ec_numbers_path = os.path.join(
+            self.config["paths"]["retropath"],
+            self.config["retropath"]["files"]["ec_numbers"]
+        )
+        retrorules_path = self.config["paths"]["retrorules"]
+        rules_path = os.path.join(
+            self.config["paths"]["retropath"],
+            self.config["retropath"]["files"]["rules"]
+        )
+
+        fingerprint = self.steps.get_fingerprint(
+            files=[ec_numbers_path, retrorules_path],
+            params={
+                "dmin": self.config["retropath"]["params"]["dmin"],
+                "dmax": self.config["retropath"]["params"]["dmax"],
+                "rules": self.config["retropath"].get("rules", {})
+            },
+            outputs=[rules_path]
         )
 
-        LOGGER.debug(f"Loaded MetaNetX reactions from {metanetx_reac_path}")
-        LOGGER.debug(f"Number of MetaNetX reactions: {len(metanetx_reac_prop)}")
+        # Each rules file (e.g. of each sweep window) is a step of its own
+        step = f"rules/{self.config['retropath']['files']['rules']}"
+        if self.steps.is_fresh(step, fingerprint):
+            return self.load_rules()
+
+        # Load EC numbers in the community
+        ec_num_df = self.load_ec_numbers()
+
+        # Load RetroRules database
+        retrorules_df = self.tables.load(
+            path=retrorules_path,
+            reader=lambda path: pd.read_csv(path, sep=",")
+        )
+
+        LOGGER.debug(f"Loaded RetroRules from {retrorules_path}")
+        LOGGER.debug(f"Number of RetroRules: {len(retrorules_df)}")
+
+        # Drop potential duplicates (more than one species with the same EC)
+        ec_numbers = ec_num_df["ec_numbers"].unique()
+
+        LOGGER.debug(f"Dropped duplicates in ECs: {len(ec_numbers)} unique")
 
-        # Read MetaNetX chem_prop.tsv file
-        metanetx_chem_path = os.path.join(
-            self.config["paths"]["metanetx"],
-            "chem_prop.tsv"
+        # Explode rules with multiple EC numbers
+        retrorules_df["EC number"] = retrorules_df["EC number"].str.split(";")
+        retrorules_df = retrorules_df\
+            .explode("EC number")\
+            .reset_index(drop=True)
+
+        LOGGER.debug(f"Exploded ECs in RetroRules: {len(retrorules_df)} total")
+
+        # Filter by found EC numbers in the community
+        rules_df = retrorules_df[
+            retrorules_df["EC number"].isin(ec_numbers)
+        ]
+
+        LOGGER.info(
+            f"Retrieved rules by ECs present in the community: {len(rules_df)}"
         )
-        metanetx_chem_prop = pd.read_table(
-            metanetx_chem_path,
-            comment="#", # Skip comment rows
-            header=None,
-            names=[
-                "Name", # Format for sink.csv
-                "compound",
-                "reference",
-                "formula",
-                "charge",
-                "mass",
-                "InChI",
-                "InChIKey",
-                "SMILES"
-            ]
+
+        rules_df = self.filter_rules(rules_df)
+
+        # Save to file
+        rules_df.to_csv(
+            rules_path,
+            header=True,
+            index=False,
+            sep=",",
+            quotechar='"',
+            quoting=csv.QUOTE_MINIMAL # Avoid errors with commas in names
         )
 
-        LOGGER.debug(f"Loaded MetaNetX compounds from {metanetx_chem_path}")
-        LOGGER.debug(f"Number of MetaNetX compounds: {len(metanetx_chem_prop)}")
+        LOGGER.info(f"Saved community rules to {rules_path}")
 
-        # Load rules extracted by mapping ECs to RetroRules DB
-        rules_path = os.path.join(
-            self.config["paths"]["retropath"],
-            self.config["retropath"]["files"]["rules"]
+        self.steps.record(
+            step=step,
+            fingerprint=fingerprint,
+            outputs=[rules_path]
         )
-        rules_df = pd.read_csv(rules_path, sep=",")
 
-        LOGGER.debug(f"Loaded community rules from {rules_path}")
-        LOGGER.debug(f"Number of community rules: {len(rules_df)}")
+        return rules_df
+
+    def get_sink_compounds(
+        self,
+        stoichiometry_df: pd.DataFrame,
+        rules_df: pd.DataFrame
+    ) -> pd.DataFrame:
+        """
+        Get the sink compounds of each rule reaction, i.e. the substrates of
+        the reactions plus the products of reversible ones.
+
+        Parameters
+        ----------
+        stoichiometry_df : pandas.DataFrame
+            The stoichiometry store.
+        rules_df : pandas.DataFrame
+            Dataframe containing the rules.
+
+        Returns
+        -------
+        compounds_df : pandas.DataFrame
+            Dataframe with the columns "MNXR", "Rule usage" and "compound"
+            (integer code of the stoichiometry store), substrates first. Only
+            MetaNetX compounds (MNXM) are kept.
+
+        Examples
+        --------
+        None
+
+        """
 
         # Get all MetaNetX reaction IDs
+        rules_df = rules_df.copy()
         rules_df[["MNXR", "MNXM"]]  = rules_df["Rule ID"]\
             .str.split("_", expand=True)
 
@@ -347,72 +1049,108 @@ class RetroPathPreloader(BaseRetroPathPreloader):
             str(len(unique_rules_df))
         )
 
-        # Get all reaction information by MNXR
-        reactions_df = pd.merge(
-            left=metanetx_reac_prop,
-            right=unique_rules_df,
-            left_on="ID",
-            right_on="MNXR",
-            how="outer",
-            indicator=True
+        # Map reactions to the integer codes of the stoichiometry store
+        unique_rules_df = unique_rules_df.assign(
+            reaction=self.get_reaction_codes(
+                stoichiometry_df=stoichiometry_df,
+                reaction_ids=unique_rules_df["MNXR"]
+            )
         )
 
-        LOGGER.debug(
-            "Number of reactions only present in MetaNetX: " + \
-            str(len(reactions_df[reactions_df["_merge"] == "right_only"]))
-        )
+        is_shared = unique_rules_df["reaction"] >= 0
+
         LOGGER.debug(
             "Number of reactions only present in the community: " + \
-            str(len(reactions_df[reactions_df["_merge"] == "left_only"]))
+            str(unique_rules_df.loc[~is_shared, "MNXR"].nunique())
         )
         LOGGER.debug(
             "Number of reactions shared: " + \
-            str(len(reactions_df[reactions_df["_merge"] == "both"]))
+            str(unique_rules_df.loc[is_shared, "MNXR"].nunique())
         )
 
-        # Finally, get reactions that could be mapped to METANETX
-        reactions_df = reactions_df[reactions_df["_merge"] == "both"]
+        # Finally, get compounds of reactions that could be mapped to METANETX
+        compounds_df = pd.merge(
+            left=pd.DataFrame({
+                "reaction": stoichiometry_df["reaction"].cat.codes,
+                "compound": stoichiometry_df["compound"].cat.codes,
+                "side": stoichiometry_df["side"]
+            }),
+            right=unique_rules_df[["reaction", "MNXR", "Rule usage"]],
+            on="reaction",
+            how="inner"
+        )
 
         # NOTE: METANETX reactions are in forward format. Therefore, we should 
         # get the substrates for the sink.
-        compounds_forward = reactions_df["mnx_equation"]\
-            .str.split("=").str[0]\
-            .str.extractall(r"(MNXM\d+)")\
-            .reset_index(drop=True)\
-            .rename(columns={0: "Name"})
+        is_forward = compounds_df["side"] == SUBSTRATE
 
         LOGGER.debug(
             "Number of compounds in forward rules: " + \
-            str(len(compounds_forward))
+            str(is_forward.sum())
         )
 
         # Add products of reversible reactions
-        compounds_reverse = reactions_df[
-                reactions_df["Rule usage"] == "both"
-            ]["mnx_equation"]\
-            .str.split("=").str[-1]\
-            .str.extractall(r"(MNXM\d+)")\
-            .reset_index(drop=True)\
-            .rename(columns={0: "Name"})
+        is_reverse = (compounds_df["side"] == PRODUCT) & \
+            (compounds_df["Rule usage"] == "both")
 
         LOGGER.debug(
             "Number of compounds in reversible rules: " + \
-            str(len(compounds_reverse))
+            str(is_reverse.sum())
         )
 
         # Merge substrates and products (reversible reactions)
-        sink_df = pd.concat(
-            [compounds_forward, compounds_reverse],
+        compounds_df = pd.concat(
+            [compounds_df[is_forward], compounds_df[is_reverse]],
             axis=0,
             ignore_index=True
         )
 
-        LOGGER.debug(f"Number of compounds in sink (raw): {len(sink_df)}")
+        # Keep only MetaNetX compounds (e.g. skip generic ones like BIOMASS)
+        compound_ids = stoichiometry_df["compound"].cat.categories
+        is_mnxm = np.asarray(compound_ids.str.fullmatch(r"MNXM\d+"))
 
-        # Drop potential duplicates (compounds in more than one reation)
-        sink_df = sink_df.drop_duplicates()
+        compounds_df = compounds_df[
+            is_mnxm[compounds_df["compound"].to_numpy()]
+        ]
+
+        return compounds_df[["MNXR", "Rule usage", "compound"]]\
+            .reset_index(drop=True)
+
+    def get_sink_inchis(
+        self,
+        stoichiometry_df: pd.DataFrame,
+        compound_codes: pd.Series
+    ) -> pd.DataFrame:
+        """
+        Get the MetaNetX IDs and InChIs of sink compounds.
+
+        Parameters
+        ----------
+        stoichiometry_df : pandas.DataFrame
+            The stoichiometry store.
+        compound_codes : pandas.Series
+            The integer codes of the compounds in the stoichiometry store.
+
+        Returns
+        -------
+        sink_df : pandas.DataFrame
+            Dataframe with the columns "Name" and "InChI" in sink.csv format,
+            with "None" for compounds without InChI.
+
+        Examples
+        --------
+        None
+
+        """
+
+        # Read MetaNetX chem_prop.tsv file
+        metanetx_chem_prop = self.load_metanetx_chem_prop()
+
+        compound_ids = stoichiometry_df["compound"].cat.categories
 
-        LOGGER.debug(f"Dropped duplicates in sink (raw): {len(sink_df)}")
+        sink_df = pd.DataFrame({
+            "Name": compound_ids[np.asarray(compound_codes)]
+        })
 
         # Get InChIs for the extracted compound IDs
         sink_df = pd.merge(
@@ -423,42 +1161,377 @@ class RetroPathPreloader(BaseRetroPathPreloader):
         )
         sink_df = sink_df[["Name", "InChI"]]
 
+        # Fill missing InChIs and match sink.csv format
+        return sink_df.fillna("None")
+
+    def standardize_sink(
+        self,
+        sink_df: pd.DataFrame,
+        subset: list = None
+    ) -> pd.DataFrame:
+        """
+        Standardize the InChIs of sink compounds, dropping invalid ones and
+        duplicates with the same InChIKey.
+
+        Parameters
+        ----------
+        sink_df : pandas.DataFrame
+            Dataframe with the columns "Name" and "InChI", with "None" for
+            compounds without InChI.
+        subset : list
+            Other columns identifying duplicates besides the InChIKey (e.g.
+            the organism of partitioned sinks).
+
+        Returns
+        -------
+        sink_df : pandas.DataFrame
+            The sink with standardized, valid and unique InChIs.
+
+        Examples
+        --------
+        None
+
+        """
+
+        n_jobs = self.config["retropath"].get("n_jobs", 1)
+
+        # Standardize only InChIs not seen in previous runs
+        inchis = get_standardized_inchis(
+            inchis=sink_df["InChI"].where(sink_df["InChI"] != "None"),
+            cache=ConversionCache(self.get_cache_path("sink_inchi.csv")),
+            n_jobs=n_jobs
+        )
+
+        sink_df = sink_df.assign(InChI=inchis)
+        sink_df = sink_df.dropna(subset="InChI")
+
+        sink_df = sink_df.assign(
+            InChIKey=get_inchikeys(inchis=sink_df["InChI"], n_jobs=n_jobs)
+        )
+        unique_sink_df = sink_df\
+            .dropna(subset="InChIKey")\
+            .drop_duplicates(subset=[*(subset or []), "InChIKey"])
+
+        LOGGER.info(
+            f"Number of standardized sink compounds: {len(unique_sink_df)} " + \
+            f"({len(sink_df) - len(unique_sink_df)} duplicated or invalid)"
+        )
+
+        return unique_sink_df\
+            .drop(columns="InChIKey")\
+            .reset_index(drop=True)
+
+    def get_sink_mode(self) -> str:
+        """
+        Get the configured sink mode (see SINK_MODES).
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        mode : str
+            The sink mode, "rules" by default.
+
+        Examples
+        --------
+        None
+
+        """
+
+        mode = self.config["retropath"].get("sink", {}).get("mode", "rules")
+
+        if mode not in SINK_MODES:
+            raise ValueError(
+                f"Unknown sink mode: {mode} (expected one of {SINK_MODES})"
+            )
+
+        return mode
+
+    def get_sink(self) -> pd.DataFrame:
+        """
+        Get the sink by extracting compounds from the rules when:
+            - They appear in the reactants
+            - They appear in the products if their rule is reversible
+
+        With the "models" sink mode (retropath.sink.mode), only compounds
+        present in the formatted GEM models are kept. With
+        retropath.sink.standardize, InChIs are standardized and only valid and
+        unique compounds are kept (see standardize_sink).
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        sink_df : pandas.DataFrame
+            Dataframe containing as the compounds found for the given rules.
+
+        Examples
+        --------
+        None
+
+        """
+
+        sink_path = os.path.join(
+            self.config["paths"]["retropath"],
+            self.config["retropath"]["files"]["sink"]
+        )
+
+        mode = self.get_sink_mode()
+
+        files = [
+            os.path.join(
+                self.config["paths"]["retropath"],
+                self.config["retropath"]["files"]["rules"]
+            ),
+            os.path.join(self.config["paths"]["metanetx"], "reac_prop.tsv"),
+            os.path.join(self.config["paths"]["metanetx"], "chem_prop.tsv")
+        ]
+        if mode == "models":
+            files += [
+                os.path.join(self.config["paths"]["metanetx"], "chem_xref.tsv"),
+                *self.get_model_paths()
+            ]
+
+        standardize = self.config["retropath"]\
+            .get("sink", {})\
+            .get("standardize", False)
+
+        fingerprint = self.steps.get_fingerprint(
+            files=files,
+            params={"mode": mode, "standardize": standardize},
+            outputs=[sink_path]
+        )
+
+        # Each sink file (e.g. of each sweep window) is a step of its own
+        step = f"sink/{self.config['retropath']['files']['sink']}"
+        if self.steps.is_fresh(step, fingerprint):
+            return pd.read_csv(sink_path, keep_default_na=False)
+
+        # Load MetaNetX reactions parsed as stoichiometry rows
+        stoichiometry_df = self.load_stoichiometry()
+
+        # Load rules extracted by mapping ECs to RetroRules DB
+        rules_df = self.load_rules()
+
+        compounds_df = self.get_sink_compounds(
+            stoichiometry_df=stoichiometry_df,
+            rules_df=rules_df
+        )
+
+        LOGGER.debug(f"Number of compounds in sink (raw): {len(compounds_df)}")
+
+        # Drop potential duplicates (compounds in more than one reation)
+        compound_codes = compounds_df["compound"].drop_duplicates()
+
+        LOGGER.debug(f"Dropped duplicates in sink (raw): {len(compound_codes)}")
+
+        if mode == "models":
+            model_compounds_df = self.get_model_compounds(stoichiometry_df)
+
+            compound_codes = compound_codes[
+                compound_codes.isin(model_compounds_df["compound"])
+            ]
+
+            LOGGER.info(
+                "Number of compounds in sink present in the models: " + \
+                str(len(compound_codes))
+            )
+
+        sink_df = self.get_sink_inchis(
+            stoichiometry_df=stoichiometry_df,
+            compound_codes=compound_codes
+        )
+
         LOGGER.warning(
             "Number of compounds without InChI: " + \
-            str(len(sink_df[sink_df["InChI"].isnull()])) + "/" + \
+            str(len(sink_df[sink_df["InChI"] == "None"])) + "/" + \
             str(len(sink_df))
         )
 
-        # Fill missing InChIs and match sink.csv format
-        sink_df = sink_df.fillna("None")
+        # Keep only valid and unique structures
+        if standardize:
+            sink_df = self.standardize_sink(sink_df)
+
+        # Save to file
+        sink_df.to_csv(
+            sink_path,
+            header=True,
+            index=False,
+            sep=",",
+            mode="w",
+            quotechar='"',
+            quoting=csv.QUOTE_ALL # Fit sink.csv format for RetroPath2.0
+        )
+
+        LOGGER.info(f"Saved community sink to {sink_path}")
+
+        self.steps.record(
+            step=step,
+            fingerprint=fingerprint,
+            outputs=[sink_path]
+        )
+
+        return sink_df
+
+    def get_partitions(self, organisms: Iterable[str] = None) -> pd.DataFrame:
+        """
+        Get the rules and sink of each organism in a single pass over the
+        community rules, saving them to partitions/<organism>/ so each
+        organism can be run on its own.
+
+        Parameters
+        ----------
+        organisms : Iterable[str]
+            The organisms (model IDs in the EC numbers file) to partition.
+            Defaults to all organisms.
+
+        Returns
+        -------
+        partitions_df : pandas.DataFrame
+            Dataframe containing the number of rules and sink compounds of
+            each organism.
+
+        Examples
+        --------
+        None
+
+        """
+
+        # Load EC numbers and rules in the community
+        ec_num_df = self.load_ec_numbers()
+        rules_df = self.load_rules()
+
+        organisms_df = ec_num_df[["ec_numbers", "ID"]]\
+            .drop_duplicates()\
+            .rename(columns={"ec_numbers": "EC number", "ID": "Organism"})
+
+        if organisms is not None:
+            organisms_df = organisms_df[
+                organisms_df["Organism"].isin(set(organisms))
+            ]
+
+        # Assign the rules to the organisms with their EC numbers
+        org_rules_df = pd.merge(
+            left=rules_df,
+            right=organisms_df,
+            on="EC number",
+            how="inner"
+        )
+        org_rules_df["MNXR"] = org_rules_df["Rule ID"].str.split("_").str[0]
+
+        # Get the sink compounds of all community reactions at once
+        stoichiometry_df = self.load_stoichiometry()
+        compounds_df = self.get_sink_compounds(
+            stoichiometry_df=stoichiometry_df,
+            rules_df=rules_df
+        )
+
+        org_compounds_df = pd.merge(
+                left=org_rules_df[["Organism", "MNXR", "Rule usage"]]\
+                    .drop_duplicates(),
+                right=compounds_df,
+                on=["MNXR", "Rule usage"],
+                how="inner"
+            )\
+            .drop_duplicates(subset=["Organism", "compound"])
+
+        # Restrict each sink to the metabolites of the organism's model
+        if self.get_sink_mode() == "models":
+            org_compounds_df = pd.merge(
+                left=org_compounds_df,
+                right=self.get_model_compounds(stoichiometry_df),
+                on=["Organism", "compound"],
+                how="inner"
+            )
+
+        sink_df = self.get_sink_inchis(
+            stoichiometry_df=stoichiometry_df,
+            compound_codes=org_compounds_df["compound"]
+        )
+        sink_df["Organism"] = org_compounds_df["Organism"].to_numpy()
+
+        if self.config["retropath"].get("sink", {}).get("standardize", False):
+            sink_df = self.standardize_sink(sink_df, subset=["Organism"])
+
+        sinks = dict(tuple(sink_df.groupby("Organism", sort=False)))
+
+        partitions = []
+        for organism, organism_rules_df in org_rules_df.groupby("Organism"):
+            partition_dir = os.path.join(
+                self.config["paths"]["retropath"],
+                PARTITIONS_DIR,
+                organism
+            )
+            os.makedirs(partition_dir, exist_ok=True)
+
+            organism_rules_df[rules_df.columns].to_csv(
+                os.path.join(
+                    partition_dir,
+                    os.path.basename(self.config["retropath"]["files"]["rules"])
+                ),
+                header=True,
+                index=False,
+                sep=",",
+                quotechar='"',
+                quoting=csv.QUOTE_MINIMAL # Avoid errors with commas in names
+            )
+
+            organism_sink_df = sinks.get(
+                organism,
+                pd.DataFrame(columns=["Name", "InChI"])
+            )
+            organism_sink_df[["Name", "InChI"]].to_csv(
+                os.path.join(
+                    partition_dir,
+                    os.path.basename(self.config["retropath"]["files"]["sink"])
+                ),
+                header=True,
+                index=False,
+                sep=",",
+                mode="w",
+                quotechar='"',
+                quoting=csv.QUOTE_ALL # Fit sink.csv format for RetroPath2.0
+            )
 
-        # Save to file
-        sink_path = os.path.join(
-            self.config["paths"]["retropath"],
-            self.config["retropath"]["files"]["sink"]
-        )
-        sink_df.to_csv(
-            sink_path,
-            header=True,
-            index=False,
-            sep=",",
-            mode="w",
-            quotechar='"',
-            quoting=csv.QUOTE_ALL # Fit sink.csv format for RetroPath2.0
+            partitions.append({
+                "Organism": organism,
+                "Rules": len(organism_rules_df),
+                "Sink": len(organism_sink_df)
+            })
+
+        partitions_df = pd.DataFrame(
+            partitions,
+            columns=["Organism", "Rules", "Sink"]
         )
 
-        LOGGER.info(f"Saved community sink to {sink_path}")
+        LOGGER.info(
+            f"Saved rules and sink of {len(partitions_df)} organisms to " + \
+            os.path.join(self.config["paths"]["retropath"], PARTITIONS_DIR)
+        )
 
-        return sink_df
+        return partitions_df
 
-    def get_sources(self) -> pd.DataFrame:
+    def get_sources(
+        self,
+        write_files: bool = True,
+        pack: bool = False
+    ) -> pd.DataFrame:
         """
         Get the sources by creating a folder and CSV file for each compound
         in the specified sources file.
 
         Parameters
         ----------
-        None
+        write_files : bool
+            Whether to write one source file per compound in the sources
+            folder.
+        pack : bool
+            Whether to write all compounds to a single packed file with an
+            index (see biofoundry.retropath.sources.write_packed_sources).
 
         Returns
         -------
@@ -477,20 +1550,31 @@ class RetroPathPreloader(BaseRetroPathPreloader):
             "interesting_metabolites/",
             self.config["retropath"]["files"]["sources"]
         )
+        sources_cache_path = self.get_cache_path("sources.csv")
+
+        fingerprint = self.steps.get_fingerprint(
+            files=[sources_path],
+            params={
+                "mwmax_source": \
+                    self.config["retropath"]["params"].get("mwmax_source"),
+                "sources": self.config["retropath"].get("sources", {}),
+                "write_files": write_files,
+                "pack": pack
+            }
+        )
+        if self.steps.is_fresh("sources", fingerprint):
+            return pd.read_csv(sources_cache_path)
+
         sources_df = pd.read_csv(sources_path)
 
         LOGGER.debug(f"Loaded sources from {sources_path}")
 
-        # Get InChIs
-        sources_df["InChI"] = \
-            sources_df["Smile"]\
-            .dropna(how="all")\
-            .apply(
-                lambda row: Chem.MolToInchi(
-                    Chem.MolFromSmiles(row),
-                    options="-SNon"
-                )
-            )
+        # Get InChIs, converting only molecules not seen in previous runs
+        sources_df["InChI"] = get_inchis_from_smiles(
+            smiles=sources_df["Smile"],
+            cache=ConversionCache(self.get_cache_path("smiles_inchi.csv")),
+            n_jobs=self.config["retropath"].get("n_jobs", 1)
+        )
 
         LOGGER.warning(
             "Number of compounds without InChI: " + \
@@ -509,45 +1593,77 @@ class RetroPathPreloader(BaseRetroPathPreloader):
             .str.lower()\
             .str.replace(" ", "_")
 
-        # Create a source file for each compound
-        for _, row in sources_df.iterrows():
-            compound_name = row["Name"]
+        sources_dir = os.path.join(
+            self.config["paths"]["retropath"],
+            "interesting_metabolites/"
+        )
+
+        # Drop or flag sources too heavy for RetroPath2.0
+        sources_df = self.filter_sources(
+            sources_df=sources_df,
+            excluded_path=os.path.join(sources_dir, EXCLUDED_SOURCES)
+        )
 
-            row = row.to_frame().T[["Name", "InChI"]]
+        output_paths = []
 
-            compound_path = os.path.join(
-                self.config["paths"]["retropath"],
-                "interesting_metabolites/",
-                "sources/",
-                f"{compound_name}.csv"
+        # Create a source file for each compound
+        if write_files:
+            output_paths += write_source_files(
+                sources_df=sources_df,
+                sources_dir=os.path.join(sources_dir, "sources/")
             )
-            row.to_csv(
-                compound_path,
-                header=True,
-                index=False
+
+        # Create a single file with all compounds
+        if pack:
+            write_packed_sources(
+                sources_df=sources_df,
+                packed_path=os.path.join(sources_dir, PACKED_SOURCES),
+                index_path=os.path.join(sources_dir, PACKED_SOURCES_INDEX)
             )
 
-            LOGGER.info(f"Saved compound to {compound_path}")
+            output_paths += [
+                os.path.join(sources_dir, PACKED_SOURCES),
+                os.path.join(sources_dir, PACKED_SOURCES_INDEX)
+            ]
+
+        if self.steps.enabled:
+            os.makedirs(os.path.dirname(sources_cache_path), exist_ok=True)
+            sources_df.to_csv(sources_cache_path, header=True, index=False)
+
+            self.steps.record(
+                step="sources",
+                fingerprint=fingerprint,
+                outputs=[sources_cache_path, *output_paths]
+            )
 
         return sources_df
 
-    def get_orgs_with_source_in_sink(
+    def filter_sources(
         self,
-        source_ids: Iterable[str]
+        sources_df: pd.DataFrame,
+        excluded_path: str
     ) -> pd.DataFrame:
         """
-        Get the organisms containing the source already in the sink.
+        Exclude sources exceeding the maximum molecular weight (mwmax_source
+        parameter) or any other configured descriptor threshold, which would
+        most likely make RetroPath2.0 time out. Thresholds can only be set on
+        the descriptors in COST_DESCRIPTORS.
 
         Parameters
         ----------
-        source_ids : Iterable[str]
-            The list of possible source's IDs (e.g. enantiomers have different
-            IDs).
+        sources_df : pandas.DataFrame
+            Dataframe containing the columns "Name" and "InChI".
+        excluded_path : str
+            The path to the summary of the excluded sources. It is removed if
+            no sources are excluded.
 
         Returns
         -------
-        reactions_df : pandas.DataFrame
-            Dataframe containing the organism code and the found ID.
+        sources_df : pandas.DataFrame
+            Dataframe containing the sources to run. If the configured action
+            is "flag", all sources are kept and the reason for the exclusion
+            is given in the column "Excluded". The runner reads the flags
+            from the summary of excluded sources and runs those sources last.
 
         Examples
         --------
@@ -555,34 +1671,123 @@ class RetroPathPreloader(BaseRetroPathPreloader):
 
         """
 
-        source_str = r"|".join(source_ids)
+        sources_config = self.config["retropath"].get("sources", {})
 
-        # Load EC numbers and rules in the community
-        ec_numbers_path = os.path.join(
-            self.config["paths"]["retropath"],
-            self.config["retropath"]["files"]["ec_numbers"]
+        max_descriptors = sources_config.get("max_descriptors") or {}
+
+        unknown = sorted(set(max_descriptors) - set(COST_DESCRIPTORS))
+        if unknown:
+            raise ValueError(
+                f"Unknown descriptors in max_descriptors: {unknown} " + \
+                f"(expected any of {COST_DESCRIPTORS})"
+            )
+
+        thresholds = {
+            "Molecular weight": \
+                self.config["retropath"]["params"].get("mwmax_source"),
+            **max_descriptors
+        }
+        thresholds = {
+            descriptor: threshold
+            for descriptor, threshold in thresholds.items()
+            if threshold is not None
+        }
+
+        if not thresholds:
+            return sources_df
+
+        descriptors_df = get_cost_descriptors(
+            inchis=sources_df["InChI"],
+            n_jobs=self.config["retropath"].get("n_jobs", 1)
         )
-        ec_num_df = pd.read_csv(ec_numbers_path, sep=",")
 
-        LOGGER.debug(f"Loaded community EC numbers from {ec_numbers_path}")
-        LOGGER.debug(f"Number of ECs: {len(ec_num_df)}")
+        # Name the exceeded thresholds of each source
+        reasons = pd.Series("", index=sources_df.index)
+        for descriptor, threshold in thresholds.items():
+            exceeded = descriptors_df[descriptor] > threshold
+            reasons[exceeded] += f"{descriptor} > {threshold};"
 
-        rules_path = os.path.join(
-            self.config["paths"]["retropath"],
-            self.config["retropath"]["files"]["rules"]
+        reasons = reasons.str.rstrip(";")
+        is_excluded = reasons != ""
+
+        LOGGER.info(
+            f"Number of sources exceeding thresholds {thresholds}: " + \
+            f"{is_excluded.sum()}/{len(sources_df)}"
         )
-        rules_df = pd.read_csv(rules_path, sep=",")
 
-        LOGGER.debug(f"Loaded community rules from {rules_path}")
-        LOGGER.debug(f"Number of community rules: {len(rules_df)}")
+        if is_excluded.any():
+            pd.concat([
+                    sources_df.loc[is_excluded, ["Name", "InChI"]],
+                    descriptors_df[is_excluded],
+                    reasons[is_excluded].rename("Reason")
+                ], axis=1)\
+                .to_csv(excluded_path, header=True, index=False)
 
-        # Drop potential duplicates (more than one species with the same EC)
-        ec_numbers = ec_num_df["ec_numbers"].unique()
+            LOGGER.info(f"Saved excluded sources to {excluded_path}")
 
-        LOGGER.debug(f"Dropped duplicates in ECs: {len(ec_numbers)} unique")
+        elif os.path.exists(excluded_path):
+            os.remove(excluded_path)
+
+        if sources_config.get("action", "drop") == "flag":
+            return sources_df.assign(Excluded=reasons.where(is_excluded))
+
+        return sources_df[~is_excluded]
+
+    def get_source_index(self) -> pd.DataFrame:
+        """
+        Get the inverted index mapping each compound to the community
+        reactions it takes part in and the organisms catalysing them.
+
+        The index is built once and reused until the EC numbers, the rules or
+        MetaNetX reactions change.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        index_df : pandas.DataFrame
+            Dataframe sorted by compound code with the columns "compound",
+            "reaction" (integer codes of the stoichiometry store), "position"
+            (row in the stoichiometry store) and "Organism".
+
+        Examples
+        --------
+        None
+
+        """
+
+        signature = tuple(
+            TableCache.get_signature(path)
+            for path in (
+                os.path.join(
+                    self.config["paths"]["retropath"],
+                    self.config["retropath"]["files"]["ec_numbers"]
+                ),
+                os.path.join(
+                    self.config["paths"]["retropath"],
+                    self.config["retropath"]["files"]["rules"]
+                ),
+                os.path.join(
+                    self.config["paths"]["metanetx"],
+                    "reac_prop.tsv"
+                )
+            )
+        )
+
+        if self._source_index is not None and \
+            self._source_index[0] == signature:
+            return self._source_index[1]
+
+        LOGGER.info("Building compound to organisms index")
+
+        # Load EC numbers and rules in the community
+        ec_num_df = self.load_ec_numbers()
+        rules_df = self.load_rules()
 
         # Avoid duplicates because of different rule usages and diameters
-        rules_df = rules_df.drop(["Diameter", "Rule usage"], axis=1)
+        rules_df = rules_df[["Rule ID", "EC number"]].drop_duplicates()
 
         LOGGER.debug(
             "Dropped duplicated rules (diameter and usage columns): " + \
@@ -599,69 +1804,411 @@ class RetroPathPreloader(BaseRetroPathPreloader):
         )
         rules_df = rules_df.rename(columns={"ID": "Organism"})
 
-        # Read MetaNetX reac_prop.tsv file
-        metanetx_reac_path = os.path.join(
-            self.config["paths"]["metanetx"],
-            "reac_prop.tsv"
+        # Load MetaNetX reactions parsed as stoichiometry rows
+        stoichiometry_df = self.load_stoichiometry()
+
+        # Map reactions to the integer codes of the stoichiometry store
+        rules_df["reaction"] = self.get_reaction_codes(
+            stoichiometry_df=stoichiometry_df,
+            reaction_ids=rules_df["Rule ID"].str.split("_").str[0]
         )
-        metanetx_reac_prop = pd.read_table(
-            metanetx_reac_path,
-            comment="#", # Skip comment rows
-            header=None,
-            names=[
-                "ID",
-                "mnx_equation",
-                "reference",
-                "classifs",
-                "is_balanced",
-                "is_transport"
-            ]
+        reaction_orgs_df = rules_df.loc[
+                rules_df["reaction"] >= 0,
+                ["reaction", "Organism"]
+            ]\
+            .drop_duplicates()
+
+        LOGGER.debug(
+            "Number of community reactions mapped to MetaNetX: " + \
+            str(reaction_orgs_df["reaction"].nunique())
         )
 
-        LOGGER.debug(f"Loaded MetaNetX reactions from {metanetx_reac_path}")
-        LOGGER.debug(f"Number of MetaNetX reactions: {len(metanetx_reac_prop)}")
+        # Get compounds of community reactions
+        compounds_df = pd.DataFrame({
+            "compound": stoichiometry_df["compound"].cat.codes,
+            "reaction": stoichiometry_df["reaction"].cat.codes,
+            "position": np.arange(len(stoichiometry_df))
+        })
+        compounds_df = compounds_df[
+            compounds_df["reaction"].isin(reaction_orgs_df["reaction"])
+        ]
 
-        # Get all MetaNetX reaction IDs
-        rules_df[["MNXR", "MNXM"]]  = rules_df["Rule ID"]\
-            .str.split("_", expand=True)
+        index_df = pd.merge(
+                left=compounds_df,
+                right=reaction_orgs_df,
+                on="reaction",
+                how="inner"
+            )\
+            .sort_values(["compound", "position"])\
+            .reset_index(drop=True)
+
+        LOGGER.info(f"Number of entries in compound index: {len(index_df)}")
+
+        self._source_index = (signature, index_df)
+
+        return index_df
+
+    def get_orgs_with_sources_in_sink(
+        self,
+        sources: dict
+    ) -> pd.DataFrame:
+        """
+        Get the organisms containing each source already in the sink.
+
+        Parameters
+        ----------
+        sources : dict
+            Dictionary mapping each source name to the list of its possible
+            IDs (e.g. enantiomers have different IDs).
+
+        Returns
+        -------
+        reactions_df : pandas.DataFrame
+            Dataframe containing the source name, the organism code and the
+            found IDs (comma-separated, in equation order).
+
+        Examples
+        --------
+        >>> preloader.get_orgs_with_sources_in_sink({
+        >>>     "3-hydroxybutyrate": ["MNXM1104965", "MNXM1104966"],
+        >>>     "glucose": ["MNXM1137670"]
+        >>> })
+
+        """
 
-        # Get all reaction information by MNXR
-        reactions_df = pd.merge(
-            left=metanetx_reac_prop,
-            right=rules_df,
-            left_on="ID",
-            right_on="MNXR",
-            how="outer",
-            indicator=True
+        index_df = self.get_source_index()
+        compound_ids = self.load_stoichiometry()["compound"].cat.categories
+
+        # Flatten groups into (source, compound code) pairs
+        query_df = pd.DataFrame(
+            [
+                (source, source_id)
+                for source, source_ids in sources.items()
+                for source_id in source_ids
+            ],
+            columns=["Source", "compound"]
         )
+        query_df["compound"] = compound_ids.get_indexer(query_df["compound"])
+        query_df = query_df[query_df["compound"] >= 0].drop_duplicates()
 
         LOGGER.debug(
-            "Number of reactions only present in MetaNetX: " + \
-            str(len(reactions_df[reactions_df["_merge"] == "right_only"]))
+            f"Number of source IDs found in MetaNetX: {len(query_df)}"
         )
-        LOGGER.debug(
-            "Number of reactions only present in the community: " + \
-            str(len(reactions_df[reactions_df["_merge"] == "left_only"]))
+
+        # Look up the compounds in the index
+        matches_df = pd.merge(
+                left=query_df,
+                right=index_df,
+                on="compound",
+                how="inner"
+            )\
+            .sort_values(["Source", "position"], kind="stable")
+
+        matches_df["Source match"] = \
+            compound_ids[matches_df["compound"].to_numpy()]
+
+        # Join all matches of a reaction, keeping the equation order
+        reactions_df = matches_df\
+            .groupby(
+                ["Source", "Organism", "reaction"],
+                sort=False,
+                dropna=False
+            )["Source match"]\
+            .agg(",".join)\
+            .reset_index()
+
+        reactions_df = reactions_df[["Source", "Organism", "Source match"]]\
+            .drop_duplicates()\
+            .reset_index(drop=True)
+
+        LOGGER.debug(f"Dropped duplicates in matches: {len(reactions_df)}")
+
+        return reactions_df
+
+    def get_reachable_sources(
+        self,
+        sources_df: pd.DataFrame,
+        seeds: Iterable[str] = None
+    ) -> pd.DataFrame:
+        """
+        Screen the sources by network expansion before running RetroPath2.0:
+        starting from the seed compounds, community reactions (reversible
+        ones in both directions) are fired while all their substrates are
+        available, until no new compounds are produced.
+
+        Sources are matched to MetaNetX compounds by the connectivity block
+        of their InChIKeys. Sources never produced can be skipped, and the
+        round in which the others were reached can be used to prioritise
+        them.
+
+        Parameters
+        ----------
+        sources_df : pandas.DataFrame
+            Dataframe containing the columns "Name" and "InChI".
+        seeds : Iterable[str]
+            The MetaNetX IDs of the initially available compounds, besides
+            the generic (non-MNXM) ones, which are always available. Defaults
+            to the compounds in the sink, which include every rule substrate
+            unless the sink is restricted to the GEM metabolites
+            (retropath.sink.mode).
+
+        Returns
+        -------
+        expansion_df : pandas.DataFrame
+            Dataframe containing the source name, the matched MetaNetX IDs
+            (comma-separated), whether it is reachable and the round in which
+            it was first reached. Unmatched sources get missing values.
+
+        Examples
+        --------
+        None
+
+        """
+
+        stoichiometry_df = self.load_stoichiometry()
+        compound_ids = stoichiometry_df["compound"].cat.categories
+
+        # Community reactions and whether any of their rules is reversible
+        rules_df = self.load_rules()
+        reactions_df = pd.DataFrame({
+            "reaction": self.get_reaction_codes(
+                stoichiometry_df=stoichiometry_df,
+                reaction_ids=rules_df["Rule ID"].str.split("_").str[0]
+            ),
+            "Reversible": (rules_df["Rule usage"] == "both").to_numpy()
+        })
+        reactions_df = reactions_df[reactions_df["reaction"] >= 0]
+
+        substrates, products, _ = get_incidence(
+            stoichiometry_df=stoichiometry_df,
+            reactions_df=reactions_df
         )
-        LOGGER.debug(
-            "Number of reactions shared: " + \
-            str(len(reactions_df[reactions_df["_merge"] == "both"]))
+
+        if seeds is None:
+            seeds = pd.read_csv(
+                os.path.join(
+                    self.config["paths"]["retropath"],
+                    self.config["retropath"]["files"]["sink"]
+                )
+            )["Name"]
+
+        seed_codes = compound_ids.get_indexer(pd.Index(seeds).unique())
+        is_seed = np.zeros(len(compound_ids), dtype=bool)
+        is_seed[seed_codes[seed_codes >= 0]] = True
+
+        # Generic compounds (e.g. WATER) are never in the sink, which only
+        # keeps MNXM compounds, but are always available. Otherwise no
+        # reaction consuming them (e.g. hydrolases) would ever fire
+        is_seed |= ~np.asarray(compound_ids.str.fullmatch(r"MNXM\d+"))
+
+        rounds = expand_network(
+            substrates=substrates,
+            products=products,
+            seeds=is_seed
         )
 
-        # Finally, get reactions that could be mapped to METANETX
-        reactions_df = reactions_df[reactions_df["_merge"] == "both"]
-        reactions_df["Source match"] = reactions_df["mnx_equation"]\
-            .str.findall(source_str)\
-            .apply(",".join)
+        # Match sources to MetaNetX compounds by InChIKey connectivity
+        metanetx_chem_prop = self.load_metanetx_chem_prop()
+        n_jobs = self.config["retropath"].get("n_jobs", 1)
+
+        matches_df = pd.merge(
+                left=pd.DataFrame({
+                    "Source": sources_df["Name"].to_numpy(),
+                    "key": get_inchikeys(
+                        inchis=sources_df["InChI"],
+                        connectivity=True,
+                        n_jobs=n_jobs
+                    ).to_numpy()
+                }).dropna(),
+                right=pd.DataFrame({
+                    "Compound": metanetx_chem_prop["Name"].to_numpy(),
+                    "key": metanetx_chem_prop["InChIKey"]\
+                        .astype("string")\
+                        .str.split("-").str[0]\
+                        .to_numpy()
+                }).dropna(),
+                on="key",
+                how="inner"
+            )
 
-        # Get only matches
-        reactions_df = reactions_df[
-            reactions_df["Source match"] != ""
-        ]
+        matches_df["code"] = compound_ids.get_indexer(matches_df["Compound"])
+        matches_df = matches_df[matches_df["code"] >= 0]
+
+        # Keep the earliest round among the compounds matching each source
+        matches_df["Round"] = rounds[matches_df["code"].to_numpy()]
+        matches_df["Round"] = matches_df["Round"]\
+            .where(matches_df["Round"] != UNREACHABLE)\
+            .astype("Int64")
+
+        expansion_df = matches_df\
+            .groupby("Source", sort=False)\
+            .agg(Compound=("Compound", ",".join), Round=("Round", "min"))\
+            .reindex(sources_df["Name"].unique())\
+            .rename_axis("Source")\
+            .reset_index()
+
+        expansion_df.insert(
+            2,
+            "Reachable",
+            pd.array(
+                expansion_df["Round"].notnull().to_numpy(),
+                dtype="boolean"
+            )
+        )
+        expansion_df.loc[expansion_df["Compound"].isnull(), "Reachable"] = pd.NA
 
-        reactions_df = reactions_df[["Organism", "Source match"]]\
-            .drop_duplicates()
+        LOGGER.info(
+            "Reachable sources by network expansion: " + \
+            f"{expansion_df['Reachable'].sum()}/{len(expansion_df)} " + \
+            f"({expansion_df['Compound'].isnull().sum()} not in MetaNetX)"
+        )
 
-        LOGGER.debug(f"Dropped duplicates in matches: {len(reactions_df)}")
+        # Save to file
+        expansion_path = os.path.join(
+            self.config["paths"]["retropath"],
+            "interesting_metabolites/",
+            EXPANSION_RESULTS
+        )
+        expansion_df.to_csv(expansion_path, header=True, index=False)
 
-        return reactions_df
+        LOGGER.info(f"Saved network expansion screen to {expansion_path}")
+
+        return expansion_df
+
+    def get_nearest_neighbours(
+        self,
+        sources_df: pd.DataFrame,
+        k: int = None,
+        kind: str = None
+    ) -> pd.DataFrame:
+        """
+        Get the most similar sink compounds and sources of every source, by
+        the Tanimoto similarity of their fingerprints.
+
+        Sources whose nearest sink compound is closer are more likely to be
+        reached by short pathways, so this can be used to rank them before
+        running RetroPath2.0.
+
+        Parameters
+        ----------
+        sources_df : pandas.DataFrame
+            Dataframe containing the columns "Name" and "InChI".
+        k : int
+            The number of neighbours per source and origin. Defaults to the
+            value in the config.
+        kind : str
+            The fingerprint type ("morgan" or "maccs"). Defaults to the value
+            in the config.
+
+        Returns
+        -------
+        neighbours_df : pandas.DataFrame
+            Dataframe containing the source, the origin of the neighbour
+            ("sink" or "source"), the rank, the neighbour and the Tanimoto
+            similarity.
+
+        Examples
+        --------
+        None
+
+        """
+
+        similarity_config = self.config["retropath"]\
+            .get("sources", {})\
+            .get("similarity", {})
+        k = k or similarity_config.get("k", 5)
+        kind = kind or similarity_config.get("kind", "morgan")
+        n_jobs = self.config["retropath"].get("n_jobs", 1)
+
+        sink_df = pd.read_csv(
+            os.path.join(
+                self.config["paths"]["retropath"],
+                self.config["retropath"]["files"]["sink"]
+            ),
+            keep_default_na=False
+        )
+        sink_df = sink_df[sink_df["InChI"] != "None"]
+
+        sink_index = SimilarityIndex.from_inchis(
+            names=sink_df["Name"],
+            inchis=sink_df["InChI"],
+            n_jobs=n_jobs,
+            kind=kind
+        )
+
+        # Fingerprints of the sources are computed once for both searches
+        names, fingerprints = get_fingerprints(
+            names=sources_df["Name"],
+            inchis=sources_df["InChI"],
+            n_jobs=n_jobs,
+            kind=kind
+        )
+        sources_index = SimilarityIndex(names=names, fingerprints=fingerprints)
+
+        neighbours_df = pd.concat(
+            [
+                sink_index\
+                    .query(names=names, fingerprints=fingerprints, k=k)\
+                    .assign(Origin="sink"),
+                sources_index\
+                    .query(
+                        names=names,
+                        fingerprints=fingerprints,
+                        k=k,
+                        exclude_self=True
+                    )\
+                    .assign(Origin="source")
+            ],
+            ignore_index=True
+        )\
+            .rename(columns={"Query": "Source"})\
+            [["Source", "Origin", "Rank", "Neighbour", "Similarity"]]\
+            .sort_values(["Source", "Origin", "Rank"], kind="stable")\
+            .reset_index(drop=True)
+
+        LOGGER.info(
+            f"Nearest neighbours ({kind}) of {len(names)} sources among " + \
+            f"{len(sink_index)} sink compounds and {len(sources_index)} sources"
+        )
+
+        # Save to file
+        neighbours_path = os.path.join(
+            self.config["paths"]["retropath"],
+            "interesting_metabolites/",
+            NEAREST_NEIGHBOURS
+        )
+        neighbours_df.to_csv(neighbours_path, header=True, index=False)
+
+        LOGGER.info(f"Saved nearest neighbours to {neighbours_path}")
+
+        return neighbours_df
+
+    def get_orgs_with_source_in_sink(
+        self,
+        source_ids: Iterable[str]
+    ) -> pd.DataFrame:
+        """
+        Get the organisms containing the source already in the sink.
+
+        Parameters
+        ----------
+        source_ids : Iterable[str]
+            The list of possible source's IDs (e.g. enantiomers have different
+            IDs).
+
+        Returns
+        -------
+        reactions_df : pandas.DataFrame
+            Dataframe containing the organism code and the found ID.
+
+        Examples
+        --------
+        None
+
+        """
+
+        reactions_df = self.get_orgs_with_sources_in_sink(
+            sources={"source": source_ids}
+        )
+
+        return reactions_df[["Organism", "Source match"]]
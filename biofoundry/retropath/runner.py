@@ -0,0 +1,1135 @@
+import logging
+
+from typing import Iterable
+
+import os
+import io
+import sys
+import csv
+import time
+import signal
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from importlib import metadata
+from multiprocessing.connection import Connection
+from dataclasses import dataclass, field
+from queue import Queue, Empty
+
+import numpy as np
+import pandas as pd
+
+from biofoundry.base import BaseRetroPathBackend, BaseRetroPathRunner
+from biofoundry.retropath.cache import ResultCache
+from biofoundry.retropath.chem import get_inchikeys
+from biofoundry.retropath.preloader import PARTITIONS_DIR
+from biofoundry.retropath.scope import ScopeBackend
+from biofoundry.retropath.scheduling import (
+    COST_FEATURES,
+    CostModel,
+    get_cost_descriptors
+)
+from biofoundry.retropath.sources import (
+    EXCLUDED_SOURCES,
+    PACKED_SOURCES,
+    PACKED_SOURCES_INDEX,
+    read_packed_source
+)
+
+
+# Configure logging
+logging.basicConfig(
+    filename="retropath-" + os.path.basename(__file__).replace(".py", ".log"),
+    filemode="w",
+    format="%(asctime)s - %(filename)s:%(lineno)s - %(funcName)s - " + \
+        "%(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.DEBUG
+)
+LOGGER = logging.getLogger("retropath-" + __name__)
+
+
+# Status manifest of the runs, inside interesting_metabolites/
+RUNS_MANIFEST = "runs-manifest.csv"
+RUNS_MANIFEST_COLUMNS = [
+    "Experiment",
+    "Source",
+    "Status",
+    "Return code",
+    "Runtime (s)",
+    "Predicted runtime (s)",
+    "Timeout (s)",
+    "Finished at",
+    "Cache key"
+]
+
+# Exit code of runs killed by the memory limit
+MEMORY_ERROR_CODE = 99
+
+# Return codes of repeatable outcomes, the only ones stored in the result
+# cache (others, e.g. JavaError or TimeLimit, may not happen again)
+CACHEABLE_CODES = {"OK", "NoSolution", "SrcInSink"}
+
+
+@dataclass
+class RetroPathJob:
+    """
+    A single RetroPath2.0 run.
+
+    Parameters
+    ----------
+    experiment : str
+        The experiment name, unique within a manifest.
+    source : str
+        The source name.
+    source_path : str
+        The path to the source file. If None, source_text is used instead.
+    sink_path : str
+        The path to the sink file.
+    rules_path : str
+        The path to the rules file.
+    outdir : str
+        The output directory of the run.
+    params : dict
+        RetroPath2.0 parameters (dmin, dmax, max_steps, topx, ...).
+    timeout : float
+        Wall-clock limit (in seconds) of the run. If None, the runner's
+        default is used.
+    source_text : str
+        The contents of the source file, used when source_path is None (e.g.
+        when reading from a packed sources file).
+    predicted_runtime : float
+        The runtime (in seconds) estimated by the cost model.
+    cache_key : str
+        The key of the run inputs (see ResultCache.get_key). A finished run
+        is only skipped when its recorded key matches.
+    excluded : str
+        The descriptor thresholds exceeded by the source, if it was flagged
+        by RetroPathPreloader.filter_sources. Flagged jobs are run last.
+
+    Examples
+    --------
+    None
+
+    """
+
+    experiment: str
+    source: str
+    source_path: str
+    sink_path: str
+    rules_path: str
+    outdir: str
+    params: dict = field(default_factory=dict)
+    timeout: float = None
+    source_text: str = None
+    predicted_runtime: float = None
+    cache_key: str = None
+    excluded: str = None
+
+
+class RetroPath2WrapperBackend(BaseRetroPathBackend):
+    """
+    Backend launching RetroPath2.0 through retropath2_wrapper.
+
+    Parameters
+    ----------
+    None
+
+    Examples
+    --------
+    None
+
+    """
+
+    @property
+    def version(self) -> str:
+        """
+        Version of retropath2_wrapper, None if it is not installed.
+        """
+
+        try:
+            return metadata.version("retropath2_wrapper")
+        except metadata.PackageNotFoundError:
+            return None
+
+    def run(
+        self,
+        source_path: str,
+        sink_path: str,
+        rules_path: str,
+        outdir: str,
+        params: dict
+    ) -> str:
+        """
+        Run RetroPath2.0 for a single source.
+
+        Parameters
+        ----------
+        source_path : str
+            The path to the source file.
+        sink_path : str
+            The path to the sink file.
+        rules_path : str
+            The path to the rules file.
+        outdir : str
+            The output directory.
+        params : dict
+            RetroPath2.0 parameters (dmin, dmax, max_steps, topx, ...).
+
+        Returns
+        -------
+        r_code : str
+            The return code of retropath2_wrapper.
+
+        Examples
+        --------
+        None
+
+        """
+
+        # Imported here since it is only available in the RetroPath2.0 env
+        from retropath2_wrapper import retropath2
+
+        r_code = retropath2(
+            rules_file=os.path.abspath(rules_path),
+            sink_file=os.path.abspath(sink_path),
+            source_file=os.path.abspath(source_path),
+            outdir=os.path.abspath(outdir),
+            **params
+        )
+
+        # Newer versions also return the result files
+        if isinstance(r_code, tuple):
+            r_code = r_code[0]
+
+        return str(r_code)
+
+
+def _run_job(
+    backend: BaseRetroPathBackend,
+    job: RetroPathJob,
+    max_memory_mb: float,
+    connection: Connection
+) -> None:
+    """
+    Run a job inside a child process, enforcing the memory limit.
+    """
+
+    # New process group, so the whole tree (e.g. Java) can be killed
+    os.setsid()
+
+    if max_memory_mb:
+        import resource
+
+        limit = int(max_memory_mb * 1024 ** 2)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    tmp_dir = None
+
+    try:
+        source_path = job.source_path
+
+        if source_path is None:
+            tmp_dir = tempfile.mkdtemp()
+            source_path = os.path.join(tmp_dir, f"{job.source}.csv")
+
+            with open(source_path, mode="w") as fh:
+                fh.write(job.source_text)
+
+        r_code = backend.run(
+            source_path=source_path,
+            sink_path=job.sink_path,
+            rules_path=job.rules_path,
+            outdir=job.outdir,
+            params=job.params
+        )
+
+    except MemoryError:
+        os._exit(MEMORY_ERROR_CODE)
+
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    connection.send(r_code)
+    connection.close()
+
+    sys.exit(0)
+
+
+class RetroPathRunner(BaseRetroPathRunner):
+    """
+    Run RetroPath2.0 for each source across a pool of workers, with
+    wall-clock and memory limits per run.
+
+    Every run is recorded in a status manifest together with the key of its
+    inputs, so finished sources are skipped when the runner is restarted
+    unless their rules, sink, source or parameters changed.
+
+    Parameters
+    ----------
+    config : dict
+        The configuration dictionary.
+    backend : BaseRetroPathBackend
+        The backend performing each run. Defaults to ScopeBackend if the
+        configured backend is "scope" and RetroPath2WrapperBackend otherwise.
+
+    Examples
+    --------
+    >>> runner = RetroPathRunner(config)
+    >>> manifest_df = runner.run()
+
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        backend: BaseRetroPathBackend = None
+    ) -> None:
+        super().__init__()
+
+        self.config = config
+
+        runner_config = self.config["retropath"].get("runner", {})
+
+        if backend is None:
+            backend = ScopeBackend() \
+                if runner_config.get("backend") == "scope" \
+                else RetroPath2WrapperBackend()
+
+        self.backend = backend
+
+        self.n_workers = runner_config.get("n_workers", 1)
+        self.timeout = runner_config.get("timeout", None)
+        self.max_memory_mb = runner_config.get("max_memory_mb", None)
+
+        # Cost-model scheduling
+        self.schedule = runner_config.get("schedule", True)
+        self.timeout_factor = runner_config.get("timeout_factor", 5)
+        self.min_timeout = runner_config.get("min_timeout", 0)
+
+        # Skip sources already in the sink ("connectivity", "inchikey" or None)
+        self.precheck = runner_config.get("precheck", "connectivity")
+
+        # Keys of the run inputs, also used to restore finished runs whose
+        # inputs did not change if the result cache is enabled
+        cache_config = self.config["retropath"].get("cache", {})
+        self.keys = ResultCache(
+            path=os.path.join(
+                self.config["paths"]["retropath"],
+                cache_config.get("dir", "cache/"),
+                "results/"
+            ),
+            max_size_mb=cache_config.get("results_max_size_mb", 10240)
+        )
+        self.results = self.keys \
+            if cache_config.get("results", False) else None
+
+        self.sources_dir = os.path.join(
+            self.config["paths"]["retropath"],
+            "interesting_metabolites/",
+            "sources/"
+        )
+        self.experiments_dir = os.path.join(
+            self.config["paths"]["retropath"],
+            "interesting_metabolites/",
+            "experiments/"
+        )
+        self.manifest_path = os.path.join(
+            self.config["paths"]["retropath"],
+            "interesting_metabolites/",
+            RUNS_MANIFEST
+        )
+
+        self._lock = threading.Lock()
+
+    def get_manifest(self) -> pd.DataFrame:
+        """
+        Get the latest status of each experiment.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        manifest_df : pandas.DataFrame
+            Dataframe containing the last record of each experiment.
+
+        Examples
+        --------
+        None
+
+        """
+
+        if not os.path.exists(self.manifest_path):
+            return pd.DataFrame(columns=RUNS_MANIFEST_COLUMNS)
+
+        manifest_df = pd.read_csv(
+            self.manifest_path,
+            dtype={"Return code": str, "Cache key": str}
+        )
+
+        # Manifests of older versions are upgraded to the current columns,
+        # so new records are appended consistently
+        if manifest_df.columns.tolist() != RUNS_MANIFEST_COLUMNS:
+            manifest_df = manifest_df.reindex(columns=RUNS_MANIFEST_COLUMNS)
+            with self._lock:
+                manifest_df.to_csv(self.manifest_path, index=False)
+
+        manifest_df = manifest_df\
+            .drop_duplicates(subset="Experiment", keep="last")\
+            .reset_index(drop=True)
+
+        return manifest_df
+
+    def record(self, record: dict) -> None:
+        """
+        Append a run record to the manifest.
+
+        Parameters
+        ----------
+        record : dict
+            The record, with the keys in RUNS_MANIFEST_COLUMNS.
+
+        Returns
+        -------
+        None
+
+        Examples
+        --------
+        None
+
+        """
+
+        with self._lock:
+            is_new = not os.path.exists(self.manifest_path)
+
+            with open(self.manifest_path, mode="a", newline="") as fh:
+                writer = csv.DictWriter(fh, fieldnames=RUNS_MANIFEST_COLUMNS)
+
+                if is_new:
+                    writer.writeheader()
+
+                writer.writerow(record)
+
+    def get_params(self) -> dict:
+        """
+        Get the RetroPath2.0 parameters from the configuration.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        _ : dict
+            The RetroPath2.0 parameters.
+
+        Examples
+        --------
+        None
+
+        """
+
+        return dict(self.config["retropath"]["params"])
+
+    def get_partitions(self) -> dict:
+        """
+        Get the rules and sink of each organism written by
+        RetroPathPreloader.get_partitions.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        partitions : dict
+            Dictionary mapping each organism to the paths to its rules and
+            sink files.
+
+        Examples
+        --------
+        None
+
+        """
+
+        partitions_dir = os.path.join(
+            self.config["paths"]["retropath"],
+            PARTITIONS_DIR
+        )
+
+        partitions = {}
+        for organism in sorted(os.listdir(partitions_dir)):
+            rules_path = os.path.join(
+                partitions_dir,
+                organism,
+                os.path.basename(self.config["retropath"]["files"]["rules"])
+            )
+            sink_path = os.path.join(
+                partitions_dir,
+                organism,
+                os.path.basename(self.config["retropath"]["files"]["sink"])
+            )
+
+            if os.path.exists(rules_path) and os.path.exists(sink_path):
+                partitions[organism] = {
+                    "rules_path": rules_path,
+                    "sink_path": sink_path
+                }
+
+        LOGGER.debug(f"Number of organism partitions: {len(partitions)}")
+
+        return partitions
+
+    def get_jobs(
+        self,
+        sources: Iterable[str] = None,
+        packed: bool = False,
+        partitions: bool = False
+    ) -> list:
+        """
+        Get one job per source, or per organism and source if running the
+        organism partitions.
+
+        Parameters
+        ----------
+        sources : Iterable[str]
+            The names of the sources to run. Defaults to all sources.
+        packed : bool
+            Whether to read the sources from the packed sources file instead
+            of the sources folder.
+        partitions : bool
+            Whether to run each source against the rules and sink of each
+            organism (see RetroPathPreloader.get_partitions) instead of the
+            community ones. Experiments are named <organism>/<source>.
+
+        Returns
+        -------
+        jobs : list
+            The list of RetroPathJob.
+
+        Examples
+        --------
+        None
+
+        """
+
+        if partitions:
+            inputs = {
+                f"{organism}/": paths
+                for organism, paths in self.get_partitions().items()
+            }
+        else:
+            inputs = {
+                "": {
+                    "rules_path": os.path.join(
+                        self.config["paths"]["retropath"],
+                        self.config["retropath"]["files"]["rules"]
+                    ),
+                    "sink_path": os.path.join(
+                        self.config["paths"]["retropath"],
+                        self.config["retropath"]["files"]["sink"]
+                    )
+                }
+            }
+        params = self.get_params()
+
+        if packed:
+            packed_path = os.path.join(
+                self.config["paths"]["retropath"],
+                "interesting_metabolites/",
+                PACKED_SOURCES
+            )
+            index_df = pd.read_csv(
+                os.path.join(
+                    self.config["paths"]["retropath"],
+                    "interesting_metabolites/",
+                    PACKED_SOURCES_INDEX
+                ),
+                index_col="Name"
+            )
+            all_sources = index_df.index.tolist()
+        else:
+            all_sources = sorted(
+                os.path.splitext(filename)[0]
+                for filename in os.listdir(self.sources_dir)
+                if filename.endswith(".csv")
+            )
+
+        if sources is not None:
+            sources = set(sources)
+            all_sources = [item for item in all_sources if item in sources]
+
+        # Sources flagged as too heavy (sources.action = "flag")
+        excluded_path = os.path.join(
+            self.config["paths"]["retropath"],
+            "interesting_metabolites/",
+            EXCLUDED_SOURCES
+        )
+        excluded = pd.read_csv(excluded_path, index_col="Name")["Reason"]\
+            .to_dict() if os.path.exists(excluded_path) else {}
+
+        jobs = [
+            RetroPathJob(
+                experiment=prefix + source,
+                source=source,
+                source_path=None if packed \
+                    else os.path.join(self.sources_dir, f"{source}.csv"),
+                sink_path=paths["sink_path"],
+                rules_path=paths["rules_path"],
+                outdir=os.path.join(self.experiments_dir, prefix + source),
+                params=params,
+                source_text=read_packed_source(
+                    packed_path=packed_path,
+                    name=source,
+                    index_df=index_df
+                ) if packed else None,
+                excluded=excluded.get(source)
+            )
+            for prefix, paths in inputs.items()
+            for source in all_sources
+        ]
+
+        LOGGER.debug(f"Number of jobs: {len(jobs)}")
+
+        return jobs
+
+    @staticmethod
+    def read_job_source(job: RetroPathJob) -> pd.DataFrame:
+        """
+        Read the source of a job.
+
+        Parameters
+        ----------
+        job : RetroPathJob
+            The job.
+
+        Returns
+        -------
+        _ : pandas.DataFrame
+            Dataframe containing the columns "Name" and "InChI".
+
+        Examples
+        --------
+        None
+
+        """
+
+        if job.source_path is None:
+            return pd.read_csv(io.StringIO(job.source_text))
+
+        return pd.read_csv(job.source_path)
+
+    def get_job_features(self, jobs: Iterable[RetroPathJob]) -> pd.DataFrame:
+        """
+        Get the cost features of the jobs (see
+        biofoundry.retropath.scheduling.COST_FEATURES).
+
+        Parameters
+        ----------
+        jobs : Iterable[RetroPathJob]
+            The jobs.
+
+        Returns
+        -------
+        features_df : pandas.DataFrame
+            Dataframe containing the cost features, indexed by experiment.
+
+        Examples
+        --------
+        None
+
+        """
+
+        jobs = list(jobs)
+
+        # Count rules once per rules file
+        n_rules = {}
+        for rules_path in set(job.rules_path for job in jobs):
+            with open(rules_path, mode="r") as fh:
+                n_rules[rules_path] = sum(1 for _ in fh) - 1
+
+        inchis = pd.Series(
+            [self.read_job_source(job)["InChI"].iloc[0] for job in jobs],
+            index=[job.experiment for job in jobs]
+        )
+
+        features_df = get_cost_descriptors(
+            inchis=inchis,
+            n_jobs=self.config["retropath"].get("n_jobs", 1)
+        )
+        features_df["max_steps"] = [
+            job.params.get("max_steps", np.nan) for job in jobs
+        ]
+        features_df["Rules"] = [n_rules[job.rules_path] for job in jobs]
+
+        return features_df[COST_FEATURES]
+
+    def schedule_jobs(
+        self,
+        jobs: Iterable[RetroPathJob],
+        pending: Iterable[RetroPathJob]
+    ) -> list:
+        """
+        Estimate the runtime of the pending jobs with a cost model fitted on
+        the runtimes of finished ones, set adaptive timeouts and sort them
+        longest first.
+
+        Parameters
+        ----------
+        jobs : Iterable[RetroPathJob]
+            All jobs, including finished ones (used for fitting the model).
+        pending : Iterable[RetroPathJob]
+            The jobs to schedule.
+
+        Returns
+        -------
+        pending : list
+            The pending jobs, sorted by decreasing predicted runtime.
+
+        Examples
+        --------
+        None
+
+        """
+
+        pending = list(pending)
+
+        if not pending:
+            return pending
+
+        features_df = self.get_job_features(jobs)
+
+        # Fit the model on the runtimes of finished runs
+        manifest_df = self.get_manifest()
+        runtimes = manifest_df.loc[
+                manifest_df["Status"] == "Finished"
+            ]\
+            .set_index("Experiment")["Runtime (s)"]\
+            .reindex(features_df.index)\
+            .astype(float)
+
+        model = CostModel().fit(features_df=features_df, runtimes=runtimes)
+
+        experiments = [job.experiment for job in pending]
+        predicted = model.predict(features_df.loc[experiments])
+        timeouts = model.get_timeouts(
+            predicted=predicted,
+            factor=self.timeout_factor,
+            min_timeout=self.min_timeout,
+            max_timeout=self.timeout
+        )
+
+        for job in pending:
+            job.predicted_runtime = float(predicted[job.experiment])
+
+            if job.timeout is None and pd.notnull(timeouts[job.experiment]):
+                job.timeout = float(timeouts[job.experiment])
+
+        # Longest processing time first
+        pending = sorted(
+            pending,
+            key=lambda job: job.predicted_runtime,
+            reverse=True
+        )
+
+        LOGGER.info(
+            "Total predicted runtime: " + \
+            f"{sum(job.predicted_runtime for job in pending):.1f} s"
+        )
+
+        return pending
+
+    def precheck_jobs(self, jobs: Iterable[RetroPathJob]) -> list:
+        """
+        Find the jobs whose source is already in the sink by matching
+        InChIKeys, write their source-in-sink.csv file (as RetroPath2.0
+        would do) and record them as finished.
+
+        Parameters
+        ----------
+        jobs : Iterable[RetroPathJob]
+            The jobs to check.
+
+        Returns
+        -------
+        pending : list
+            The jobs whose source is not in the sink.
+
+        Examples
+        --------
+        None
+
+        """
+
+        jobs = list(jobs)
+        connectivity = self.precheck == "connectivity"
+        n_jobs = self.config["retropath"].get("n_jobs", 1)
+
+        # Hash set of sink keys, once per sink file
+        sink_keys = {}
+        for sink_path in set(job.sink_path for job in jobs):
+            sink_keys[sink_path] = set(
+                get_inchikeys(
+                    inchis=pd.read_csv(sink_path)["InChI"],
+                    connectivity=connectivity,
+                    n_jobs=n_jobs
+                ).dropna()
+            )
+
+        sources_df = pd.concat(
+            [self.read_job_source(job) for job in jobs],
+            axis=0,
+            ignore_index=True
+        ) if jobs else pd.DataFrame(columns=["Name", "InChI"])
+        source_keys = get_inchikeys(
+            inchis=sources_df["InChI"],
+            connectivity=connectivity,
+            n_jobs=n_jobs
+        )
+
+        pending = []
+        for i, job in enumerate(jobs):
+            if source_keys[i] not in sink_keys[job.sink_path]:
+                pending.append(job)
+                continue
+
+            shutil.rmtree(job.outdir, ignore_errors=True)
+            os.makedirs(job.outdir)
+
+            sources_df.iloc[[i]].to_csv(
+                os.path.join(job.outdir, "source-in-sink.csv"),
+                header=True,
+                index=False
+            )
+
+            self.record({
+                "Experiment": job.experiment,
+                "Source": job.source,
+                "Status": "Finished",
+                "Return code": "SrcInSink",
+                "Runtime (s)": 0,
+                "Finished at": pd.Timestamp.now().isoformat(timespec="seconds"),
+                "Cache key": job.cache_key
+            })
+
+        LOGGER.info(
+            f"Sources already in the sink: {len(jobs) - len(pending)}/" + \
+            f"{len(jobs)}"
+        )
+
+        return pending
+
+    def restore_jobs(self, jobs: Iterable[RetroPathJob]) -> list:
+        """
+        Restore the jobs found in the result cache and record them as
+        finished, with the runtime of the original run.
+
+        Parameters
+        ----------
+        jobs : Iterable[RetroPathJob]
+            The jobs to look up.
+
+        Returns
+        -------
+        pending : list
+            The jobs not found in the cache.
+
+        Examples
+        --------
+        None
+
+        """
+
+        jobs = list(jobs)
+
+        pending = []
+        for job in jobs:
+            entry = self.results.restore(job.cache_key, job.outdir)
+            if entry is None:
+                pending.append(job)
+                continue
+
+            self.record({
+                "Experiment": job.experiment,
+                "Source": job.source,
+                "Status": "Finished",
+                "Return code": entry.get("Return code"),
+                "Runtime (s)": entry.get("Runtime (s)"),
+                "Finished at": pd.Timestamp.now().isoformat(timespec="seconds"),
+                "Cache key": job.cache_key
+            })
+
+        LOGGER.info(
+            f"Runs restored from the result cache: {len(jobs) - len(pending)}" + \
+            f"/{len(jobs)}"
+        )
+
+        return pending
+
+    def get_cache_key(self, job: RetroPathJob) -> str:
+        """
+        Get the key of the inputs of a job: the rules and sink files, the
+        source, the parameters and the backend performing the run.
+
+        Parameters
+        ----------
+        job : RetroPathJob
+            The job.
+
+        Returns
+        -------
+        _ : str
+            The hexadecimal key.
+
+        Examples
+        --------
+        None
+
+        """
+
+        return self.keys.get_key(
+            rules_path=job.rules_path,
+            sink_path=job.sink_path,
+            source_name=job.source,
+            source_inchi=self.read_job_source(job)["InChI"].iloc[0],
+            params=job.params,
+            backend={
+                "name": type(self.backend).__name__,
+                "version": getattr(self.backend, "version", None)
+            }
+        )
+
+    def run_job(self, job: RetroPathJob) -> dict:
+        """
+        Run a single job in a child process and record its status.
+
+        Parameters
+        ----------
+        job : RetroPathJob
+            The job to run.
+
+        Returns
+        -------
+        record : dict
+            The record saved to the manifest.
+
+        Examples
+        --------
+        None
+
+        """
+
+        LOGGER.info(f"Starting experiment {job.experiment}")
+
+        # Remove outputs of interrupted runs
+        shutil.rmtree(job.outdir, ignore_errors=True)
+        os.makedirs(job.outdir)
+
+        timeout = job.timeout if job.timeout is not None else self.timeout
+
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(
+            target=_run_job,
+            args=(self.backend, job, self.max_memory_mb, sender)
+        )
+
+        start = time.monotonic()
+        process.start()
+        sender.close()
+
+        process.join(timeout)
+
+        if process.is_alive():
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                process.kill()
+
+            process.join()
+            status = "Timeout"
+
+        elif process.exitcode == 0:
+            status = "Finished"
+
+        elif process.exitcode == MEMORY_ERROR_CODE:
+            status = "Out of memory"
+
+        else:
+            status = "Failed"
+
+        runtime = time.monotonic() - start
+
+        r_code = receiver.recv() if status == "Finished" \
+            and receiver.poll() else None
+        receiver.close()
+
+        record = {
+            "Experiment": job.experiment,
+            "Source": job.source,
+            "Status": status,
+            "Return code": r_code,
+            "Runtime (s)": round(runtime, 3),
+            "Predicted runtime (s)": None if job.predicted_runtime is None \
+                else round(job.predicted_runtime, 3),
+            "Timeout (s)": timeout,
+            "Finished at": pd.Timestamp.now().isoformat(timespec="seconds"),
+            "Cache key": job.cache_key
+        }
+        self.record(record)
+
+        if self.results is not None and job.cache_key is not None and \
+            status == "Finished" and r_code in CACHEABLE_CODES:
+            self.results.store(
+                key=job.cache_key,
+                outdir=job.outdir,
+                metadata={
+                    "Return code": r_code,
+                    "Runtime (s)": record["Runtime (s)"]
+                }
+            )
+
+        LOGGER.info(
+            f"Experiment {job.experiment}: {status} ({runtime:.1f} s, " + \
+            f"return code {r_code})"
+        )
+
+        return record
+
+    def run_jobs(self, jobs: Iterable[RetroPathJob]) -> pd.DataFrame:
+        """
+        Run the jobs across the pool of workers, skipping those already
+        finished according to the manifest with the same inputs.
+
+        Parameters
+        ----------
+        jobs : Iterable[RetroPathJob]
+            The jobs to run.
+
+        Returns
+        -------
+        _ : pandas.DataFrame
+            The manifest with the latest status of each experiment.
+
+        Examples
+        --------
+        None
+
+        """
+
+        jobs = list(jobs)
+        for job in jobs:
+            job.cache_key = self.get_cache_key(job)
+
+        # Key of the inputs of each finished experiment
+        manifest_df = self.get_manifest()
+        is_finished = manifest_df["Status"] == "Finished"
+        finished = dict(zip(
+            manifest_df.loc[is_finished, "Experiment"],
+            manifest_df.loc[is_finished, "Cache key"]
+        ))
+
+        pending = [
+            job for job in jobs if finished.get(job.experiment) != job.cache_key
+        ]
+        n_changed = sum(job.experiment in finished for job in pending)
+        if n_changed:
+            LOGGER.warning(
+                f"Experiments run again since their inputs changed: {n_changed}"
+            )
+        n_finished = len(jobs) - len(pending)
+
+        if self.results is not None:
+            pending = self.restore_jobs(pending)
+
+        if self.precheck:
+            pending = self.precheck_jobs(pending)
+
+        if self.schedule:
+            pending = self.schedule_jobs(jobs=jobs, pending=pending)
+
+        # Sources exceeding descriptor thresholds would most likely time out,
+        # so they only run once the others are done
+        pending = sorted(pending, key=lambda job: job.excluded is not None)
+
+        LOGGER.info(
+            "Flagged jobs run last: " + \
+            str(sum(job.excluded is not None for job in pending))
+        )
+
+        LOGGER.info(
+            f"Running {len(pending)} jobs with {self.n_workers} workers " + \
+            f"({n_finished} already finished)"
+        )
+
+        # Shared inputs are loaded once here and inherited by every child
+        self.backend.prepare(pending)
+
+        queue = Queue()
+        for job in pending:
+            queue.put(job)
+
+        def worker() -> None:
+            while True:
+                try:
+                    job = queue.get_nowait()
+                except Empty:
+                    return
+
+                self.run_job(job)
+
+        # Threads only wait for the child processes doing the actual work.
+        # NOTE: ThreadPoolExecutor is avoided since its exit hooks make
+        # processes forked from its threads fail on exit.
+        workers = [
+            threading.Thread(target=worker)
+            for _ in range(min(self.n_workers, len(pending)))
+        ]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        return self.get_manifest()
+
+    def run(
+        self,
+        sources: Iterable[str] = None,
+        packed: bool = False,
+        partitions: bool = False
+    ) -> pd.DataFrame:
+        """
+        Run RetroPath2.0 for the sources, skipping those already finished.
+
+        Parameters
+        ----------
+        sources : Iterable[str]
+            The names of the sources to run. Defaults to all sources.
+        packed : bool
+            Whether to read the sources from the packed sources file instead
+            of the sources folder.
+        partitions : bool
+            Whether to run the sources for each organism partition instead of
+            the whole community.
+
+        Returns
+        -------
+        _ : pandas.DataFrame
+            The manifest with the latest status of each experiment.
+
+        Examples
+        --------
+        None
+
+        """
+
+        return self.run_jobs(
+            self.get_jobs(
+                sources=sources,
+                packed=packed,
+                partitions=partitions
+            )
+        )
@@ -0,0 +1,286 @@
+import logging
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from rdkit import Chem
+from rdkit.Chem import Descriptors, rdMolDescriptors
+
+from biofoundry.retropath.chem import parallel_map
+
+
+# Configure logging
+logging.basicConfig(
+    filename="retropath-" + os.path.basename(__file__).replace(".py", ".log"),
+    filemode="w",
+    format="%(asctime)s - %(filename)s:%(lineno)s - %(funcName)s - " + \
+        "%(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.DEBUG
+)
+LOGGER = logging.getLogger("retropath-" + __name__)
+
+
+COST_DESCRIPTORS = ["Heavy atoms", "Molecular weight", "Rings"]
+COST_FEATURES = COST_DESCRIPTORS + ["max_steps", "Rules"]
+
+
+def get_inchi_descriptors(inchi: str) -> tuple:
+    """
+    Get the descriptors used for estimating the cost of a RetroPath2.0 run.
+
+    Parameters
+    ----------
+    inchi : str
+        The InChI of the source.
+
+    Returns
+    -------
+    _ : tuple
+        The number of heavy atoms, the molecular weight and the number of
+        rings, or NaNs if the InChI cannot be parsed.
+
+    Examples
+    --------
+    >>> get_inchi_descriptors("InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3")
+    (3, 46.069, 0)
+
+    """
+
+    mol = Chem.MolFromInchi(inchi) if isinstance(inchi, str) else None
+
+    if mol is None:
+        return np.nan, np.nan, np.nan
+
+    return (
+        mol.GetNumHeavyAtoms(),
+        Descriptors.MolWt(mol),
+        rdMolDescriptors.CalcNumRings(mol)
+    )
+
+
+def get_cost_descriptors(
+    inchis: pd.Series,
+    n_jobs: int = 1
+) -> pd.DataFrame:
+    """
+    Get the cost descriptors of several sources.
+
+    Parameters
+    ----------
+    inchis : pandas.Series
+        The InChIs of the sources.
+    n_jobs : int
+        The number of worker processes.
+
+    Returns
+    -------
+    _ : pandas.DataFrame
+        Dataframe with the columns in COST_DESCRIPTORS, with the same index
+        as inchis.
+
+    Examples
+    --------
+    None
+
+    """
+
+    return pd.DataFrame(
+        parallel_map(
+            func=get_inchi_descriptors,
+            items=inchis,
+            n_jobs=n_jobs
+        ),
+        columns=COST_DESCRIPTORS,
+        index=inchis.index,
+        dtype=float
+    )
+
+
+class CostModel:
+    """
+    Log-linear model of the runtime of RetroPath2.0 runs.
+
+    The log-runtime is modelled as a linear function of the log-transformed
+    cost features (see COST_FEATURES) and fitted with ridge regression on
+    past runtimes. Until enough runtimes are available, a heuristic prior
+    growing with the size of the source is used, which is only meaningful
+    for ranking sources.
+
+    Parameters
+    ----------
+    min_history : int
+        Minimum number of past runs needed for fitting the model.
+    alpha : float
+        The ridge regularization strength.
+
+    Examples
+    --------
+    >>> model = CostModel().fit(features_df, runtimes)
+    >>> model.predict(features_df)
+
+    """
+
+    # Heuristic prior: intercept and coefficients of the transformed features
+    PRIOR = np.array([np.log(10), 1.5, 0.5, 0.2, 0.1, 0.2])
+
+    def __init__(self, min_history: int = 10, alpha: float = 1.0) -> None:
+        self.min_history = min_history
+        self.alpha = alpha
+
+        self.coefficients = self.PRIOR
+        self.residual_std = None
+        self.is_fitted = False
+
+    @staticmethod
+    def transform(features_df: pd.DataFrame) -> np.ndarray:
+        """
+        Get the design matrix from the cost features.
+
+        Parameters
+        ----------
+        features_df : pandas.DataFrame
+            Dataframe with the columns in COST_FEATURES.
+
+        Returns
+        -------
+        _ : numpy.ndarray
+            The design matrix, with a leading intercept column.
+
+        Examples
+        --------
+        None
+
+        """
+
+        features = features_df[COST_FEATURES].astype(float)
+
+        # Unknown descriptors are assumed to be typical
+        features = features.fillna(features.median()).fillna(0)
+
+        return np.column_stack([
+            np.ones(len(features)),
+            np.log1p(features.to_numpy())
+        ])
+
+    def fit(
+        self,
+        features_df: pd.DataFrame,
+        runtimes: pd.Series
+    ) -> "CostModel":
+        """
+        Fit the model to past runtimes.
+
+        Parameters
+        ----------
+        features_df : pandas.DataFrame
+            Dataframe with the columns in COST_FEATURES.
+        runtimes : pandas.Series
+            The runtimes (in seconds), with the same index as features_df.
+
+        Returns
+        -------
+        self : CostModel
+            The fitted model. The prior is kept if there are not enough runs.
+
+        Examples
+        --------
+        None
+
+        """
+
+        is_valid = runtimes.notnull() & (runtimes > 0)
+
+        if is_valid.sum() < self.min_history:
+            LOGGER.info(
+                f"Not enough runtimes for fitting ({is_valid.sum()}/" + \
+                f"{self.min_history}), using the prior cost model"
+            )
+            return self
+
+        X = self.transform(features_df[is_valid])
+        y = np.log(runtimes[is_valid].to_numpy(dtype=float))
+
+        # Ridge regression shrinking towards the prior
+        penalty = self.alpha * np.eye(X.shape[1])
+        self.coefficients = np.linalg.solve(
+            X.T @ X + penalty,
+            X.T @ y + penalty @ self.PRIOR
+        )
+
+        self.residual_std = float(np.std(y - X @ self.coefficients))
+        self.is_fitted = True
+
+        LOGGER.info(
+            f"Fitted cost model on {len(y)} runs " + \
+            f"(residual std of log-runtime: {self.residual_std:.3f})"
+        )
+
+        return self
+
+    def predict(self, features_df: pd.DataFrame) -> pd.Series:
+        """
+        Predict the runtime of RetroPath2.0 runs.
+
+        Parameters
+        ----------
+        features_df : pandas.DataFrame
+            Dataframe with the columns in COST_FEATURES.
+
+        Returns
+        -------
+        _ : pandas.Series
+            The predicted runtimes (in seconds).
+
+        Examples
+        --------
+        None
+
+        """
+
+        return pd.Series(
+            np.exp(self.transform(features_df) @ self.coefficients),
+            index=features_df.index
+        )
+
+    def get_timeouts(
+        self,
+        predicted: pd.Series,
+        factor: float = 5,
+        min_timeout: float = 0,
+        max_timeout: float = None
+    ) -> pd.Series:
+        """
+        Get adaptive timeouts from the predicted runtimes.
+
+        Parameters
+        ----------
+        predicted : pandas.Series
+            The predicted runtimes (in seconds).
+        factor : float
+            Multiplier applied to the upper estimate of each runtime.
+        min_timeout : float
+            Lower bound of the timeouts (in seconds).
+        max_timeout : float
+            Upper bound of the timeouts (in seconds).
+
+        Returns
+        -------
+        _ : pandas.Series
+            The timeouts (in seconds), or None if the model is not fitted.
+
+        Examples
+        --------
+        None
+
+        """
+
+        if not self.is_fitted:
+            return pd.Series(None, index=predicted.index, dtype=object)
+
+        # Account for the uncertainty of the model (two standard deviations)
+        upper = predicted * np.exp(2 * self.residual_std)
+
+        return (factor * upper).clip(lower=min_timeout, upper=max_timeout)
@@ -0,0 +1,828 @@
+import logging
+
+from typing import Iterable
+
+import os
+import csv
+from functools import lru_cache, partial
+
+import pandas as pd
+
+import rdkit
+from rdkit import Chem
+from rdkit.Chem import AllChem
+
+from biofoundry.base import BaseRetroPathBackend
+from biofoundry.retropath.cache import TableCache
+from biofoundry.retropath.chem import inchi_to_inchikey, parallel_map
+from biofoundry.retropath.fingerprints import RuleScreen
+
+
+# Configure logging
+logging.basicConfig(
+    filename="retropath-" + os.path.basename(__file__).replace(".py", ".log"),
+    filemode="w",
+    format="%(asctime)s - %(filename)s:%(lineno)s - %(funcName)s - " + \
+        "%(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.DEBUG
+)
+LOGGER = logging.getLogger("retropath-" + __name__)
+
+
+# Return codes, as in retropath2_wrapper
+SCOPE_FOUND = "OK"
+SOURCE_IN_SINK = "SrcInSink"
+NO_SOLUTION = "NoSolution"
+INVALID_SOURCE = "InvalidSource"
+
+RESULTS_COLUMNS = [
+    "Initial source",
+    "Transformation ID",
+    "Reaction SMILES",
+    "Substrate SMILES",
+    "Product SMILES",
+    "In Sink",
+    "Sink name",
+    "Rule ID",
+    "EC number",
+    "Diameter",
+    "Score",
+    "Iteration"
+]
+
+
+@lru_cache(maxsize=8)
+def load_reactions(
+    rules_path: str,
+    signature: tuple,
+    dmin: int = None,
+    dmax: int = None
+) -> tuple:
+    """
+    Load and compile the rules, sorted by decreasing score. Compiled rules
+    are cached per process and rules file version (see signature).
+
+    Parameters
+    ----------
+    rules_path : str
+        The path to the rules file.
+    signature : tuple
+        The signature of the rules file (see TableCache.get_signature).
+    dmin : int
+        Minimum rule diameter.
+    dmax : int
+        Maximum rule diameter.
+
+    Returns
+    -------
+    _ : tuple
+        Tuples of rule ID, EC number, diameter, score and the compiled
+        reaction (rdkit.Chem.rdChemReactions.ChemicalReaction).
+
+    Examples
+    --------
+    None
+
+    """
+
+    rules_df = pd.read_csv(rules_path, sep=",")
+
+    if "Diameter" in rules_df.columns and None not in (dmin, dmax):
+        rules_df = rules_df[rules_df["Diameter"].between(dmin, dmax)]
+
+    # Best rules first, so topx keeps them
+    for score_column in ("Score normalized", "Score"):
+        if score_column in rules_df.columns:
+            rules_df = rules_df.sort_values(
+                score_column,
+                ascending=False,
+                kind="stable"
+            )
+            break
+    else:
+        score_column = None
+
+    reactions = []
+    n_invalid = 0
+    for row in rules_df.to_dict("records"):
+        try:
+            reaction = AllChem.ReactionFromSmarts(row["Rule"])
+            reaction.Initialize()
+        except ValueError:
+            n_invalid += 1
+            continue
+
+        # Rules are applied to a single compound
+        if reaction.GetNumReactantTemplates() != 1:
+            n_invalid += 1
+            continue
+
+        reactions.append((
+            row["Rule ID"],
+            row.get("EC number"),
+            row.get("Diameter"),
+            row.get(score_column) if score_column else None,
+            reaction
+        ))
+
+    if n_invalid:
+        LOGGER.warning(f"Skipped {n_invalid} invalid rules in {rules_path}")
+
+    LOGGER.debug(f"Compiled {len(reactions)} rules from {rules_path}")
+
+    return tuple(reactions)
+
+
+@lru_cache(maxsize=8)
+def load_rule_screen(
+    rules_path: str,
+    signature: tuple,
+    dmin: int = None,
+    dmax: int = None
+) -> RuleScreen:
+    """
+    Load the substructure screen of the rules returned by load_reactions,
+    cached per process and rules file version.
+
+    Parameters
+    ----------
+    rules_path : str
+        The path to the rules file.
+    signature : tuple
+        The signature of the rules file (see TableCache.get_signature).
+    dmin : int
+        Minimum rule diameter.
+    dmax : int
+        Maximum rule diameter.
+
+    Returns
+    -------
+    _ : RuleScreen
+        The screen, indexed as the rules returned by load_reactions.
+
+    Examples
+    --------
+    None
+
+    """
+
+    reactions = load_reactions(
+        rules_path=rules_path,
+        signature=signature,
+        dmin=dmin,
+        dmax=dmax
+    )
+
+    return RuleScreen([reaction for *_, reaction in reactions])
+
+
+@lru_cache(maxsize=8)
+def load_sink_keys(sink_path: str, signature: tuple) -> dict:
+    """
+    Load the sink as a hash map from InChIKey connectivity blocks to
+    compound names, cached per process and sink file version.
+
+    Parameters
+    ----------
+    sink_path : str
+        The path to the sink file.
+    signature : tuple
+        The signature of the sink file (see TableCache.get_signature).
+
+    Returns
+    -------
+    _ : dict
+        Dictionary mapping InChIKey connectivity blocks to sink names.
+
+    Examples
+    --------
+    None
+
+    """
+
+    sink_df = pd.read_csv(sink_path)
+
+    keys = {}
+    for name, inchi in zip(sink_df["Name"], sink_df["InChI"]):
+        key = inchi_to_inchikey(inchi, connectivity=True)
+        if key is not None:
+            keys.setdefault(key, name)
+
+    return keys
+
+
+def get_fragments(mol: Chem.Mol) -> dict:
+    """
+    Get the fragments of a rule product by canonical SMILES, dropping bare
+    hydrogens.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The product, with explicit hydrogens.
+
+    Returns
+    -------
+    _ : dict
+        The sanitized fragment (without explicit hydrogens) of each
+        canonical SMILES, or None if the product cannot be sanitized. The
+        fragments are kept since some canonical SMILES cannot be parsed
+        back (e.g. aromatic rings that fail to kekulize).
+
+    Examples
+    --------
+    None
+
+    """
+
+    try:
+        Chem.SanitizeMol(mol)
+    except (ValueError, RuntimeError):
+        return None
+
+    fragments = {}
+    for fragment in Chem.GetMolFrags(mol, asMols=True, sanitizeFrags=False):
+        if all(atom.GetAtomicNum() == 1 for atom in fragment.GetAtoms()):
+            continue
+
+        try:
+            fragment = Chem.RemoveHs(fragment)
+            fragments[Chem.MolToSmiles(fragment)] = fragment
+        except (ValueError, RuntimeError):
+            return None
+
+    return fragments
+
+
+def get_smiles_key(smiles: str) -> str:
+    """
+    Get the InChIKey connectivity block of a SMILES string, used for
+    matching compounds against the sink.
+
+    Parameters
+    ----------
+    smiles : str
+        The SMILES string.
+
+    Returns
+    -------
+    _ : str
+        The connectivity block of the InChIKey or None.
+
+    Examples
+    --------
+    >>> get_smiles_key("CC=O")
+    'IKHGUXGNUITLKF'
+
+    """
+
+    mol = Chem.MolFromSmiles(smiles)
+
+    if mol is None:
+        return None
+
+    return inchi_to_inchikey(
+        Chem.MolToInchi(mol, options="-SNon"),
+        connectivity=True
+    )
+
+
+def get_scope(transformations: list, source_smiles: str) -> list:
+    """
+    Get the transformations linking the source to the sink, i.e. those
+    reachable from the source whose products are all in the sink or can be
+    produced from it.
+
+    Parameters
+    ----------
+    transformations : list
+        The transformations (dicts with "Substrate SMILES", "Products" and
+        "In Sink" keys).
+    source_smiles : str
+        The canonical SMILES of the source.
+
+    Returns
+    -------
+    _ : list
+        The transformations in the scope, empty if the source is not solved.
+
+    Examples
+    --------
+    None
+
+    """
+
+    solved = set()
+    for transformation in transformations:
+        for product, in_sink in zip(
+            transformation["Products"],
+            transformation["In Sink"]
+        ):
+            if in_sink:
+                solved.add(product)
+
+    # A compound is solved if any of its transformations has solved products
+    changed = True
+    while changed:
+        changed = False
+        for transformation in transformations:
+            substrate = transformation["Substrate SMILES"]
+            if substrate not in solved and \
+                all(product in solved for product in transformation["Products"]):
+                solved.add(substrate)
+                changed = True
+
+    if source_smiles not in solved:
+        return []
+
+    # Keep the solved transformations reachable from the source
+    scope = []
+    reached = {source_smiles}
+    pending = [source_smiles]
+    while pending:
+        substrate = pending.pop()
+        for transformation in transformations:
+            if transformation["Substrate SMILES"] != substrate or \
+                not all(
+                    product in solved for product in transformation["Products"]
+                ):
+                continue
+
+            scope.append(transformation)
+
+            for product, in_sink in zip(
+                transformation["Products"],
+                transformation["In Sink"]
+            ):
+                if not in_sink and product not in reached:
+                    reached.add(product)
+                    pending.append(product)
+
+    return scope
+
+
+def run_scope(
+    source_name: str,
+    source_inchi: str,
+    sink_path: str,
+    rules_path: str,
+    outdir: str,
+    params: dict
+) -> str:
+    """
+    Compute the scope of a source by applying the rules iteratively from the
+    source towards the sink, in-process with RDKit.
+
+    As in RetroPath2.0, rules are filtered by diameter (dmin and dmax), at
+    most topx transformations are kept per compound and iteration, and
+    compounds are expanded for at most max_steps iterations. Compounds are
+    deduplicated by canonical SMILES and matched against the sink by the
+    connectivity block of their InChIKeys. Outputs follow RetroPath2.0
+    layout: source-in-sink.csv, results.csv and <source>_scope.csv.
+
+    Parameters
+    ----------
+    source_name : str
+        The name of the source.
+    source_inchi : str
+        The InChI of the source.
+    sink_path : str
+        The path to the sink file.
+    rules_path : str
+        The path to the rules file (reaction SMARTS with explicit hydrogens,
+        as in RetroRules).
+    outdir : str
+        The output directory.
+    params : dict
+        RetroPath2.0 parameters (dmin, dmax, max_steps and topx).
+
+    Returns
+    -------
+    _ : str
+        The return code: SCOPE_FOUND, SOURCE_IN_SINK, NO_SOLUTION or
+        INVALID_SOURCE.
+
+    Examples
+    --------
+    >>> run_scope(
+    >>>     source_name="ethanol",
+    >>>     source_inchi="InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3",
+    >>>     sink_path="sink.csv",
+    >>>     rules_path="rules.csv",
+    >>>     outdir="experiments/ethanol",
+    >>>     params={"dmin": 6, "dmax": 16, "max_steps": 3, "topx": 100}
+    >>> )
+
+    """
+
+    os.makedirs(outdir, exist_ok=True)
+
+    rules_signature = TableCache.get_signature(rules_path)
+    reactions = load_reactions(
+        rules_path=rules_path,
+        signature=rules_signature,
+        dmin=params.get("dmin"),
+        dmax=params.get("dmax")
+    )
+    screen = load_rule_screen(
+        rules_path=rules_path,
+        signature=rules_signature,
+        dmin=params.get("dmin"),
+        dmax=params.get("dmax")
+    )
+    sink_keys = load_sink_keys(
+        sink_path=sink_path,
+        signature=TableCache.get_signature(sink_path)
+    )
+
+    source_in_sink_path = os.path.join(outdir, "source-in-sink.csv")
+    source_df = pd.DataFrame({"Name": [source_name], "InChI": [source_inchi]})
+
+    source_mol = Chem.MolFromInchi(source_inchi) \
+        if isinstance(source_inchi, str) else None
+
+    if source_mol is None:
+        LOGGER.warning(f"Invalid InChI for source {source_name}")
+        return INVALID_SOURCE
+
+    if inchi_to_inchikey(source_inchi, connectivity=True) in sink_keys:
+        source_df.to_csv(source_in_sink_path, header=True, index=False)
+        return SOURCE_IN_SINK
+
+    source_df.iloc[:0].to_csv(source_in_sink_path, header=True, index=False)
+
+    source_smiles = Chem.MolToSmiles(source_mol)
+
+    # Sink name of each visited compound (None if not in the sink)
+    visited = {source_smiles: None}
+    # Compounds to expand, with their molecules (not parsed from SMILES again)
+    frontier = {source_smiles: source_mol}
+    transformations = []
+
+    for iteration in range(1, params.get("max_steps", 3) + 1):
+        next_frontier = {}
+
+        for substrate, substrate_mol in frontier.items():
+            mol = Chem.AddHs(substrate_mol)
+
+            # Only try the rules whose reaction centre may match
+            n_kept = 0
+            for i in screen.get_candidates(mol):
+                rule_id, ec_number, diameter, score, reaction = reactions[i]
+
+                if n_kept >= params.get("topx", 100):
+                    break
+
+                seen = set()
+                for outcome in reaction.RunReactants((mol, )):
+                    product_mols = {}
+                    for product in outcome:
+                        fragments = get_fragments(product)
+                        if fragments is None:
+                            break
+                        product_mols.update(fragments)
+                    else:
+                        products = tuple(sorted(product_mols))
+
+                        if not products or products in seen:
+                            continue
+                        seen.add(products)
+
+                        for product in products:
+                            if product not in visited:
+                                visited[product] = sink_keys.get(
+                                    get_smiles_key(product)
+                                )
+                                if visited[product] is None:
+                                    next_frontier[product] = \
+                                        product_mols[product]
+
+                        transformations.append({
+                            "Initial source": source_name,
+                            "Transformation ID": \
+                                f"TRS_{iteration}_{len(transformations)}",
+                            "Reaction SMILES": \
+                                f"{substrate}>>{'.'.join(products)}",
+                            "Substrate SMILES": substrate,
+                            "Products": products,
+                            "In Sink": [
+                                visited[product] is not None
+                                for product in products
+                            ],
+                            "Rule ID": rule_id,
+                            "EC number": ec_number,
+                            "Diameter": diameter,
+                            "Score": score,
+                            "Iteration": iteration
+                        })
+                        n_kept += 1
+
+                        if n_kept >= params.get("topx", 100):
+                            break
+
+        if not next_frontier:
+            break
+
+        frontier = next_frontier
+
+    def to_frame(items: list) -> pd.DataFrame:
+        return pd.DataFrame(
+            [
+                {
+                    **item,
+                    "Product SMILES": ".".join(item["Products"]),
+                    "In Sink": ".".join(
+                        str(int(in_sink)) for in_sink in item["In Sink"]
+                    ),
+                    "Sink name": ".".join(
+                        visited[product] or "" for product in item["Products"]
+                    )
+                }
+                for item in items
+            ],
+            columns=RESULTS_COLUMNS
+        )
+
+    to_frame(transformations).to_csv(
+        os.path.join(outdir, "results.csv"),
+        header=True,
+        index=False,
+        quoting=csv.QUOTE_MINIMAL
+    )
+
+    scope = get_scope(transformations, source_smiles)
+
+    LOGGER.info(
+        f"Source {source_name}: {len(transformations)} transformations, " + \
+        f"{len(scope)} in scope"
+    )
+
+    if not scope:
+        return NO_SOLUTION
+
+    to_frame(scope).to_csv(
+        os.path.join(outdir, f"{source_name}_scope.csv"),
+        header=True,
+        index=False,
+        quoting=csv.QUOTE_MINIMAL
+    )
+
+    return SCOPE_FOUND
+
+
+def screen_rules(
+    sources_df: pd.DataFrame,
+    rules_path: str,
+    params: dict
+) -> pd.DataFrame:
+    """
+    Screen the rules against the sources with the substructure index,
+    without applying them, for estimating how many rules are pruned.
+
+    Parameters
+    ----------
+    sources_df : pandas.DataFrame
+        Dataframe containing the columns "Name" and "InChI".
+    rules_path : str
+        The path to the rules file.
+    params : dict
+        RetroPath2.0 parameters (dmin and dmax).
+
+    Returns
+    -------
+    screen_df : pandas.DataFrame
+        Dataframe containing the number of candidate rules and the pruning
+        ratio of each source.
+
+    Examples
+    --------
+    None
+
+    """
+
+    screen = load_rule_screen(
+        rules_path=rules_path,
+        signature=TableCache.get_signature(rules_path),
+        dmin=params.get("dmin"),
+        dmax=params.get("dmax")
+    )
+
+    n_candidates = []
+    for inchi in sources_df["InChI"]:
+        mol = Chem.MolFromInchi(inchi) if isinstance(inchi, str) else None
+
+        n_candidates.append(
+            screen.get_mask(Chem.AddHs(mol)).sum() if mol is not None \
+                else None
+        )
+
+    screen_df = pd.DataFrame({
+        "Source": sources_df["Name"].to_numpy(),
+        "Candidate rules": pd.array(n_candidates, dtype="Int64"),
+        "Rules": len(screen)
+    })
+    screen_df["Pruning ratio"] = \
+        1 - screen_df["Candidate rules"] / max(len(screen), 1)
+
+    LOGGER.info(
+        "Rules pruned by the substructure screen: " + \
+        f"{screen_df['Pruning ratio'].mean():.1%} on average over " + \
+        f"{len(screen_df)} sources and {len(screen)} rules"
+    )
+
+    return screen_df
+
+
+def _run_source_scope(source: tuple, **kwargs) -> str:
+    """
+    Run the scope of a (name, InChI, outdir) source tuple in a worker.
+    """
+
+    source_name, source_inchi, outdir = source
+
+    return run_scope(
+        source_name=source_name,
+        source_inchi=source_inchi,
+        outdir=outdir,
+        **kwargs
+    )
+
+
+def run_scopes(
+    sources_df: pd.DataFrame,
+    sink_path: str,
+    rules_path: str,
+    experiments_dir: str,
+    params: dict,
+    n_jobs: int = 1
+) -> pd.DataFrame:
+    """
+    Compute the scope of several sources across a pool of processes, each
+    compiling the rules once.
+
+    Parameters
+    ----------
+    sources_df : pandas.DataFrame
+        Dataframe containing the columns "Name" and "InChI".
+    sink_path : str
+        The path to the sink file.
+    rules_path : str
+        The path to the rules file.
+    experiments_dir : str
+        The directory where one folder per source is created.
+    params : dict
+        RetroPath2.0 parameters (dmin, dmax, max_steps and topx).
+    n_jobs : int
+        The number of worker processes.
+
+    Returns
+    -------
+    _ : pandas.DataFrame
+        Dataframe containing the return code of each source.
+
+    Examples
+    --------
+    None
+
+    """
+
+    r_codes = parallel_map(
+        func=partial(
+            _run_source_scope,
+            sink_path=sink_path,
+            rules_path=rules_path,
+            params=params
+        ),
+        items=[
+            (name, inchi, os.path.join(experiments_dir, name))
+            for name, inchi in zip(sources_df["Name"], sources_df["InChI"])
+        ],
+        n_jobs=n_jobs,
+        min_pool_size=2
+    )
+
+    return pd.DataFrame({
+        "Source": sources_df["Name"].to_numpy(),
+        "Return code": r_codes
+    })
+
+
+class ScopeBackend(BaseRetroPathBackend):
+    """
+    Backend computing the scope in-process with RDKit instead of launching
+    RetroPath2.0, for use with RetroPathRunner.
+
+    Parameters
+    ----------
+    None
+
+    Examples
+    --------
+    >>> runner = RetroPathRunner(config, backend=ScopeBackend())
+
+    """
+
+    @property
+    def version(self) -> str:
+        """
+        Version of RDKit, which performs the rule matching.
+        """
+
+        return rdkit.__version__
+
+    def run(
+        self,
+        source_path: str,
+        sink_path: str,
+        rules_path: str,
+        outdir: str,
+        params: dict
+    ) -> str:
+        """
+        Compute the scope of a single source.
+
+        Parameters
+        ----------
+        source_path : str
+            The path to the source file.
+        sink_path : str
+            The path to the sink file.
+        rules_path : str
+            The path to the rules file.
+        outdir : str
+            The output directory.
+        params : dict
+            RetroPath2.0 parameters (dmin, dmax, max_steps and topx).
+
+        Returns
+        -------
+        _ : str
+            The return code (see run_scope).
+
+        Examples
+        --------
+        None
+
+        """
+
+        source_df = pd.read_csv(source_path)
+
+        return run_scope(
+            source_name=source_df["Name"].iloc[0],
+            source_inchi=source_df["InChI"].iloc[0],
+            sink_path=sink_path,
+            rules_path=rules_path,
+            outdir=outdir,
+            params=params
+        )
+
+    def prepare(self, jobs: Iterable) -> None:
+        """
+        Compile the rules and load the sinks of the jobs in the current
+        process. RetroPathRunner calls it before forking a process per job,
+        so every child inherits the caches instead of compiling the rules
+        again.
+
+        Parameters
+        ----------
+        jobs : Iterable[RetroPathJob]
+            The jobs about to run.
+
+        Returns
+        -------
+        None
+
+        Examples
+        --------
+        None
+
+        """
+
+        inputs = {
+            (
+                job.rules_path,
+                job.sink_path,
+                job.params.get("dmin"),
+                job.params.get("dmax")
+            )
+            for job in jobs
+        }
+
+        for rules_path, sink_path, dmin, dmax in sorted(inputs, key=str):
+            rules_signature = TableCache.get_signature(rules_path)
+
+            _ = load_rule_screen(
+                rules_path=rules_path,
+                signature=rules_signature,
+                dmin=dmin,
+                dmax=dmax
+            )
+            _ = load_sink_keys(
+                sink_path=sink_path,
+                signature=TableCache.get_signature(sink_path)
+            )
+
+        LOGGER.debug(
+            f"Loaded {len(inputs)} rules and sink inputs before forking"
+        )
@@ -0,0 +1,250 @@
+import logging
+
+import os
+
+import pandas as pd
+
+
+# Configure logging
+logging.basicConfig(
+    filename="retropath-" + os.path.basename(__file__).replace(".py", ".log"),
+    filemode="w",
+    format="%(asctime)s - %(filename)s:%(lineno)s - %(funcName)s - " + \
+        "%(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.DEBUG
+)
+LOGGER = logging.getLogger("retropath-" + __name__)
+
+
+# Header of RetroPath2.0 source files
+SOURCE_HEADER = "Name,InChI\n"
+
+# Packed sources file and its index, inside interesting_metabolites/
+PACKED_SOURCES = "sources-packed.csv"
+PACKED_SOURCES_INDEX = "sources-packed.index.csv"
+
+# Summary of the sources excluded by descriptor thresholds
+EXCLUDED_SOURCES = "excluded_sources.csv"
+
+
+def quote_csv_field(values: pd.Series) -> pd.Series:
+    """
+    Quote CSV fields only when needed (as csv.QUOTE_MINIMAL does).
+
+    Parameters
+    ----------
+    values : pandas.Series
+        The string values to quote.
+
+    Returns
+    -------
+    _ : pandas.Series
+        The values ready to be written as CSV fields.
+
+    Examples
+    --------
+    None
+
+    """
+
+    values = values.astype(str)
+    needs_quotes = values.str.contains(r'[",\r\n]', regex=True)
+
+    return values.where(
+        ~needs_quotes,
+        '"' + values.str.replace('"', '""', regex=False) + '"'
+    )
+
+
+def get_source_rows(sources_df: pd.DataFrame) -> pd.Series:
+    """
+    Get the CSV row (with line terminator) of each source.
+
+    Parameters
+    ----------
+    sources_df : pandas.DataFrame
+        Dataframe containing the columns "Name" and "InChI".
+
+    Returns
+    -------
+    _ : pandas.Series
+        The CSV rows, indexed by source name.
+
+    Examples
+    --------
+    None
+
+    """
+
+    rows = quote_csv_field(sources_df["Name"]) + "," + \
+        quote_csv_field(sources_df["InChI"]) + "\n"
+
+    return pd.Series(rows.to_numpy(), index=sources_df["Name"].to_numpy())
+
+
+def drop_duplicated_sources(sources_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drop sources sharing the same name, keeping the last one (as it would
+    overwrite the others' files).
+
+    Parameters
+    ----------
+    sources_df : pandas.DataFrame
+        Dataframe containing the column "Name".
+
+    Returns
+    -------
+    _ : pandas.DataFrame
+        The sources with unique names.
+
+    Examples
+    --------
+    None
+
+    """
+
+    duplicated = sources_df["Name"].duplicated(keep="last")
+
+    if duplicated.any():
+        LOGGER.warning(
+            f"Dropped {duplicated.sum()} sources with duplicated names: " + \
+            ", ".join(sources_df.loc[duplicated, "Name"].unique())
+        )
+
+    return sources_df[~duplicated]
+
+
+def write_source_files(
+    sources_df: pd.DataFrame,
+    sources_dir: str
+) -> list:
+    """
+    Write one RetroPath2.0 source file per compound, formatting all of them
+    in a single vectorised pass.
+
+    Parameters
+    ----------
+    sources_df : pandas.DataFrame
+        Dataframe containing the columns "Name" and "InChI".
+    sources_dir : str
+        The output directory.
+
+    Returns
+    -------
+    source_paths : list
+        The paths to the written files.
+
+    Examples
+    --------
+    None
+
+    """
+
+    os.makedirs(sources_dir, exist_ok=True)
+
+    rows = get_source_rows(drop_duplicated_sources(sources_df))
+
+    source_paths = []
+    for name, row in zip(rows.index, rows.to_numpy()):
+        source_path = os.path.join(sources_dir, f"{name}.csv")
+
+        with open(source_path, mode="w") as fh:
+            fh.write(SOURCE_HEADER + row)
+
+        source_paths.append(source_path)
+
+    LOGGER.info(f"Saved {len(source_paths)} source files to {sources_dir}")
+
+    return source_paths
+
+
+def write_packed_sources(
+    sources_df: pd.DataFrame,
+    packed_path: str,
+    index_path: str
+) -> pd.DataFrame:
+    """
+    Write all sources to a single CSV file together with an index of the
+    byte range of each source, so single sources can be read without
+    parsing the whole file.
+
+    Parameters
+    ----------
+    sources_df : pandas.DataFrame
+        Dataframe containing the columns "Name" and "InChI".
+    packed_path : str
+        The path to the packed sources file.
+    index_path : str
+        The path to the index file.
+
+    Returns
+    -------
+    index_df : pandas.DataFrame
+        Dataframe containing the name, byte offset and length of each source.
+
+    Examples
+    --------
+    None
+
+    """
+
+    rows = get_source_rows(drop_duplicated_sources(sources_df))
+    lengths = rows.str.encode("utf-8").str.len()
+
+    index_df = pd.DataFrame({
+        "Name": rows.index,
+        "offset": len(SOURCE_HEADER) + lengths.cumsum().to_numpy() - \
+            lengths.to_numpy(),
+        "length": lengths.to_numpy()
+    })
+
+    with open(packed_path, mode="w", encoding="utf-8") as fh:
+        fh.write(SOURCE_HEADER + "".join(rows.to_numpy()))
+
+    index_df.to_csv(index_path, header=True, index=False)
+
+    LOGGER.info(f"Saved {len(index_df)} packed sources to {packed_path}")
+
+    return index_df
+
+
+def read_packed_source(
+    packed_path: str,
+    name: str,
+    index_df: pd.DataFrame
+) -> str:
+    """
+    Read a single source from a packed sources file.
+
+    Parameters
+    ----------
+    packed_path : str
+        The path to the packed sources file.
+    name : str
+        The name of the source.
+    index_df : pandas.DataFrame
+        The index returned by write_packed_sources.
+
+    Returns
+    -------
+    _ : str
+        The contents of the RetroPath2.0 source file for the source.
+
+    Examples
+    --------
+    >>> index_df = pd.read_csv("sources-packed.index.csv", index_col="Name")
+    >>> read_packed_source("sources-packed.csv", "glucose", index_df)
+
+    """
+
+    if index_df.index.name != "Name":
+        index_df = index_df.set_index("Name")
+
+    offset, length = index_df.loc[name, ["offset", "length"]]
+
+    with open(packed_path, mode="rb") as fh:
+        fh.seek(int(offset))
+        row = fh.read(int(length)).decode("utf-8")
+
+    return SOURCE_HEADER + row
@@ -0,0 +1,270 @@
+import logging
+
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+
+# Configure logging
+logging.basicConfig(
+    filename="retropath-" + os.path.basename(__file__).replace(".py", ".log"),
+    filemode="w",
+    format="%(asctime)s - %(filename)s:%(lineno)s - %(funcName)s - " + \
+        "%(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.DEBUG
+)
+LOGGER = logging.getLogger("retropath-" + __name__)
+
+
+# Sides of a MetaNetX equation
+SUBSTRATE = 0
+PRODUCT = 1
+
+# A term is an optional coefficient, a compound and an optional compartment,
+# e.g. "2 MNXM1@MNXD1"
+TERM_PATTERN = r"(?:^|\+)\s*(?:(?P<coefficient>\d+(?:\.\d+)?)\s+)?" + \
+    r"(?P<compound>[^\s@+]+)(?:@(?P<compartment>[^\s+]+))?\s*"
+
+# Prefixes of ModelSEED compounds in MetaNetX chem_xref.tsv, depending on the
+# MetaNetX release
+MODELSEED_PREFIXES = ["seed.compound", "seedM", "seed"]
+
+
+def save_columnar(
+    df: pd.DataFrame,
+    path: str,
+    metadata: dict = None
+) -> None:
+    """
+    Save a dataframe as a compressed set of column arrays.
+
+    Categorical columns are stored as integer codes plus their categories, so
+    the file stays compact for highly repetitive columns.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The dataframe to save.
+    path : str
+        The output path (.npz).
+    metadata : dict
+        Optional JSON-serializable metadata stored along with the columns.
+
+    Returns
+    -------
+    None
+
+    Examples
+    --------
+    None
+
+    """
+
+    arrays = {}
+
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            arrays[f"codes:{column}"] = df[column].cat.codes.to_numpy()
+            arrays[f"categories:{column}"] = \
+                df[column].cat.categories.to_numpy(dtype=str)
+        else:
+            arrays[f"values:{column}"] = df[column].to_numpy()
+
+    arrays["columns"] = np.array(df.columns, dtype=str)
+    arrays["metadata"] = np.array(json.dumps(metadata or {}))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    # Write to a temporal file first to avoid partially written stores
+    tmp_path = path + ".tmp.npz"
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+    LOGGER.debug(f"Saved {len(df)} rows to {path}")
+
+
+def load_columnar(path: str) -> pd.DataFrame:
+    """
+    Load a dataframe saved with save_columnar.
+
+    Parameters
+    ----------
+    path : str
+        The path to the store (.npz).
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The loaded dataframe.
+
+    Examples
+    --------
+    None
+
+    """
+
+    with np.load(path, allow_pickle=False) as arrays:
+        columns = {}
+
+        for column in arrays["columns"]:
+            if f"codes:{column}" in arrays:
+                columns[column] = pd.Categorical.from_codes(
+                    codes=arrays[f"codes:{column}"],
+                    categories=arrays[f"categories:{column}"]
+                )
+            else:
+                columns[column] = arrays[f"values:{column}"]
+
+    df = pd.DataFrame(columns)
+
+    LOGGER.debug(f"Loaded {len(df)} rows from {path}")
+
+    return df
+
+
+def load_columnar_metadata(path: str) -> dict:
+    """
+    Load the metadata of a store saved with save_columnar.
+
+    Parameters
+    ----------
+    path : str
+        The path to the store (.npz).
+
+    Returns
+    -------
+    _ : dict
+        The stored metadata.
+
+    Examples
+    --------
+    None
+
+    """
+
+    with np.load(path, allow_pickle=False) as arrays:
+        return json.loads(str(arrays["metadata"]))
+
+
+def parse_stoichiometry(metanetx_reac_prop: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parse MetaNetX equations into a long stoichiometry table.
+
+    Parameters
+    ----------
+    metanetx_reac_prop : pandas.DataFrame
+        Dataframe containing the MetaNetX reactions (reac_prop.tsv).
+
+    Returns
+    -------
+    stoichiometry_df : pandas.DataFrame
+        Dataframe with one row per reaction and compound, containing the
+        columns "reaction", "compound", "coefficient", "compartment" and
+        "side" (SUBSTRATE or PRODUCT). Rows keep the order of the equations.
+
+    Examples
+    --------
+    >>> parse_stoichiometry(
+    >>>     pd.DataFrame({
+    >>>         "ID": ["MNXR1"],
+    >>>         "mnx_equation": ["2 MNXM1@MNXD1 = 1 MNXM2@MNXD1"]
+    >>>     })
+    >>> )
+
+    """
+
+    reaction_ids = metanetx_reac_prop["ID"].reset_index(drop=True)
+
+    # Split equations into substrates (0) and products (1)
+    sides = metanetx_reac_prop["mnx_equation"]\
+        .reset_index(drop=True)\
+        .str.split(r"\s*=\s*", n=1, expand=True, regex=True)\
+        .stack()
+
+    terms = sides.str.extractall(TERM_PATTERN)
+
+    reaction_codes = terms.index.get_level_values(0).to_numpy()
+
+    stoichiometry_df = pd.DataFrame({
+        "reaction": pd.Categorical.from_codes(
+            codes=reaction_codes.astype(np.int32),
+            categories=reaction_ids.astype(str) # MetaNetX IDs are unique
+        ),
+        "compound": pd.Categorical(terms["compound"].to_numpy()),
+        "coefficient": terms["coefficient"]\
+            .fillna("1")\
+            .astype(np.float32)\
+            .to_numpy(),
+        "compartment": pd.Categorical(
+            terms["compartment"].fillna("").to_numpy()
+        ),
+        "side": terms.index.get_level_values(1).to_numpy(dtype=np.int8)
+    })
+
+    LOGGER.info(
+        f"Parsed {len(reaction_ids)} MetaNetX equations into " + \
+        f"{len(stoichiometry_df)} stoichiometry rows"
+    )
+
+    return stoichiometry_df
+
+
+def parse_chem_xref(metanetx_chem_xref: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parse MetaNetX cross-references into an index of ModelSEED compounds.
+
+    Parameters
+    ----------
+    metanetx_chem_xref : pandas.DataFrame
+        Dataframe containing the MetaNetX cross-references (chem_xref.tsv).
+
+    Returns
+    -------
+    chem_xref_df : pandas.DataFrame
+        Dataframe with one row per ModelSEED compound, containing the columns
+        "xref" (ModelSEED ID) and "compound" (MetaNetX ID). Rows are sorted
+        by ModelSEED ID and follow the order of the "xref" categories, so the
+        position of an ID in the categories is its row.
+
+    Examples
+    --------
+    >>> parse_chem_xref(
+    >>>     pd.DataFrame({
+    >>>         "xref": ["seed.compound:cpd00001"],
+    >>>         "ID": ["MNXM2"]
+    >>>     })
+    >>> )
+
+    """
+
+    xrefs = metanetx_chem_xref["xref"]\
+        .astype(str)\
+        .str.split(":", n=1, expand=True)\
+        .reindex(columns=[0, 1])
+
+    is_modelseed = xrefs[0].isin(MODELSEED_PREFIXES) & xrefs[1].notna()
+
+    # A ModelSEED compound may appear under several prefixes
+    chem_xref_df = pd.DataFrame({
+            "xref": xrefs.loc[is_modelseed, 1].to_numpy(dtype=str),
+            "compound": metanetx_chem_xref.loc[is_modelseed, "ID"]\
+                .to_numpy(dtype=str)
+        })\
+        .drop_duplicates(subset="xref")\
+        .sort_values("xref", ignore_index=True)
+
+    chem_xref_df["xref"] = pd.Categorical(
+        chem_xref_df["xref"],
+        categories=chem_xref_df["xref"] # Unique and sorted
+    )
+    chem_xref_df["compound"] = pd.Categorical(chem_xref_df["compound"])
+
+    LOGGER.info(
+        f"Indexed {len(chem_xref_df)} ModelSEED compounds out of " + \
+        f"{len(metanetx_chem_xref)} MetaNetX cross-references"
+    )
+
+    return chem_xref_df
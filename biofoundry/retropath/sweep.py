@@ -0,0 +1,279 @@
+import logging
+
+from typing import Iterable
+
+import os
+import copy
+import itertools
+from dataclasses import replace
+
+import pandas as pd
+
+from biofoundry.retropath.plots import classify_experiment
+from biofoundry.retropath.preloader import RetroPathPreloader
+from biofoundry.retropath.runner import RetroPathRunner
+
+
+# Configure logging
+logging.basicConfig(
+    filename="retropath-" + os.path.basename(__file__).replace(".py", ".log"),
+    filemode="w",
+    format="%(asctime)s - %(filename)s:%(lineno)s - %(funcName)s - " + \
+        "%(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.DEBUG
+)
+LOGGER = logging.getLogger("retropath-" + __name__)
+
+
+# Sweep inputs and experiments, inside interesting_metabolites/
+SWEEPS_DIR = "sweeps/"
+SWEEP_RESULTS = "sweep-results.csv"
+
+# Parameters that can be swept. Diameters change the rules and the sink,
+# the others only the runs
+SWEEP_PARAMS = ["dmin", "dmax", "max_steps", "topx"]
+
+
+def get_sweep_settings(grid: dict, params: dict) -> list:
+    """
+    Get the settings of a parameter sweep, i.e. the combinations of the
+    values in the grid.
+
+    Parameters
+    ----------
+    grid : dict
+        Dictionary mapping each swept parameter to its values.
+    params : dict
+        The base RetroPath2.0 parameters, used for those not in the grid.
+
+    Returns
+    -------
+    settings : list
+        Pairs of setting name and parameters.
+
+    Examples
+    --------
+    >>> settings = get_sweep_settings({"max_steps": [3, 5]}, {"dmin": 6})
+    >>> [name for name, _ in settings]
+    ['max_steps-3', 'max_steps-5']
+
+    """
+
+    unknown = set(grid) - set(SWEEP_PARAMS)
+    if unknown:
+        raise ValueError(
+            f"Parameters that cannot be swept: {sorted(unknown)}"
+        )
+
+    settings = []
+    for values in itertools.product(*grid.values()):
+        setting = dict(zip(grid, values))
+        name = "_".join(f"{key}-{value}" for key, value in setting.items())
+
+        settings.append((name, {**params, **setting}))
+
+    return settings
+
+
+def get_window_inputs(
+    preloader: RetroPathPreloader,
+    windows: Iterable[tuple]
+) -> dict:
+    """
+    Get the rules and sink of each diameter window, reusing the community
+    ones for the configured window.
+
+    The other windows are written to interesting_metabolites/sweeps/ with the
+    same preloader, so the tables it memoizes (RetroRules, MetaNetX) are only
+    parsed once and the EC numbers are shared.
+
+    Parameters
+    ----------
+    preloader : RetroPathPreloader
+        The preloader of the community.
+    windows : Iterable[tuple]
+        The (dmin, dmax) windows.
+
+    Returns
+    -------
+    inputs : dict
+        Dictionary mapping each window to the paths to its rules and sink
+        files.
+
+    Examples
+    --------
+    None
+
+    """
+
+    config = preloader.config
+    params = config["retropath"]["params"]
+
+    inputs = {}
+    for dmin, dmax in sorted(set(windows)):
+        if (dmin, dmax) == (params["dmin"], params["dmax"]):
+            window_config = config
+        else:
+            window_dir = os.path.join(
+                "interesting_metabolites/",
+                SWEEPS_DIR,
+                f"windows/dmin-{dmin}_dmax-{dmax}"
+            )
+            os.makedirs(
+                os.path.join(config["paths"]["retropath"], window_dir),
+                exist_ok=True
+            )
+
+            window_config = copy.deepcopy(config)
+            window_config["retropath"]["params"].update(dmin=dmin, dmax=dmax)
+            for key in ["rules", "sink"]:
+                window_config["retropath"]["files"][key] = os.path.join(
+                    window_dir,
+                    os.path.basename(config["retropath"]["files"][key])
+                )
+
+        rules_path, sink_path = [
+            os.path.join(
+                config["paths"]["retropath"],
+                window_config["retropath"]["files"][key]
+            )
+            for key in ["rules", "sink"]
+        ]
+
+        if window_config is not config or not os.path.exists(sink_path):
+            LOGGER.info(
+                f"Preparing rules and sink for dmin={dmin}, dmax={dmax}"
+            )
+
+            preloader.config = window_config
+            try:
+                preloader.get_rules()
+                preloader.get_sink()
+            finally:
+                preloader.config = config
+
+        inputs[(dmin, dmax)] = {
+            "rules_path": rules_path,
+            "sink_path": sink_path
+        }
+
+    return inputs
+
+
+def run_sweep(
+    config: dict,
+    grid: dict,
+    sources: Iterable[str] = None,
+    packed: bool = False,
+    runner: RetroPathRunner = None,
+    preloader: RetroPathPreloader = None
+) -> pd.DataFrame:
+    """
+    Run RetroPath2.0 for every combination of the parameters in the grid.
+
+    Preprocessing is shared across settings: EC numbers and sources are
+    reused as they are, and rules and sink are only prepared once per
+    diameter window. The runs of all settings are scheduled together in the
+    runner's pool, skipping those already finished, and their outputs are
+    written to interesting_metabolites/sweeps/<setting>/<source>.
+
+    Parameters
+    ----------
+    config : dict
+        The configuration dictionary.
+    grid : dict
+        Dictionary mapping each swept parameter (see SWEEP_PARAMS) to its
+        values.
+    sources : Iterable[str]
+        The names of the sources to run. Defaults to all sources.
+    packed : bool
+        Whether to read the sources from the packed sources file.
+    runner : RetroPathRunner
+        The runner. Defaults to one built from the configuration.
+    preloader : RetroPathPreloader
+        The preloader. Defaults to one built from the configuration.
+
+    Returns
+    -------
+    results_df : pandas.DataFrame
+        Dataframe with one row per source and setting, containing the source,
+        the setting, the value of each swept parameter, the status of the
+        results (see biofoundry.retropath.plots.classify_experiment), the run
+        status and return code, and the runtime.
+
+    Examples
+    --------
+    >>> run_sweep(config, grid={"max_steps": [3, 5], "dmin": [2, 6]})
+
+    """
+
+    runner = runner or RetroPathRunner(config)
+    preloader = preloader or RetroPathPreloader(config)
+
+    settings = get_sweep_settings(
+        grid=grid,
+        params=runner.get_params()
+    )
+
+    inputs = get_window_inputs(
+        preloader=preloader,
+        windows=[
+            (params["dmin"], params["dmax"])
+            for _, params in settings
+        ]
+    )
+
+    # Sources are read once and shared by all settings
+    base_jobs = runner.get_jobs(sources=sources, packed=packed)
+
+    sweeps_dir = os.path.join(
+        config["paths"]["retropath"],
+        "interesting_metabolites/",
+        SWEEPS_DIR
+    )
+
+    jobs = [
+        replace(
+            job,
+            experiment=f"{SWEEPS_DIR}{name}/{job.source}",
+            outdir=os.path.join(sweeps_dir, name, job.source),
+            params=params,
+            **inputs[(params["dmin"], params["dmax"])]
+        )
+        for name, params in settings
+        for job in base_jobs
+    ]
+
+    LOGGER.info(
+        f"Sweeping {len(settings)} settings over {len(base_jobs)} sources " + \
+        f"({len(inputs)} diameter windows)"
+    )
+
+    manifest_df = runner.run_jobs(jobs)\
+        .set_index("Experiment")\
+        .reindex([job.experiment for job in jobs])
+
+    results_df = pd.DataFrame({
+        "Source": [job.source for job in jobs],
+        "Setting": [job.experiment.split("/")[-2] for job in jobs]
+    })
+    for key in grid:
+        results_df[key] = [job.params[key] for job in jobs]
+
+    results_df["Status"] = [
+        classify_experiment(job.outdir) if os.path.isdir(job.outdir) \
+            else "Error"
+        for job in jobs
+    ]
+    results_df["Run status"] = manifest_df["Status"].to_numpy()
+    results_df["Return code"] = manifest_df["Return code"].to_numpy()
+    results_df["Runtime (s)"] = manifest_df["Runtime (s)"].to_numpy()
+
+    # Save to file
+    results_path = os.path.join(sweeps_dir, SWEEP_RESULTS)
+    results_df.to_csv(results_path, header=True, index=False)
+
+    LOGGER.info(f"Saved sweep results to {results_path}")
+
+    return results_df
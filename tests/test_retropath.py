@@ -1,15 +1,105 @@
 import os
 
 import copy
+import time
+import shutil
+from unittest import mock
 
 import pytest
 
 import json
 
+import numpy as np
 import pandas as pd
 from pandas.testing import assert_frame_equal
 
-from biofoundry.retropath.preloader import RetroPathPreloader
+from rdkit import Chem, DataStructs
+from rdkit.Chem import AllChem, rdFingerprintGenerator
+
+from biofoundry.base import BaseRetroPathBackend
+from biofoundry.retropath.chem import ConversionCache, get_inchis_from_smiles
+from biofoundry.retropath.expansion import (
+    UNREACHABLE,
+    get_incidence,
+    expand_network
+)
+from biofoundry.retropath.fingerprints import (
+    RuleScreen,
+    SimilarityIndex,
+    get_fingerprints
+)
+from biofoundry.retropath.attribution import (
+    attribute_pathways,
+    get_minimal_consortium
+)
+from biofoundry.retropath.graph import ScopeGraph, rank_pathways
+from biofoundry.retropath.pathways import (
+    PATHWAYS_STORE,
+    PathwayStore,
+    get_pathway_store
+)
+from biofoundry.retropath.plots import (
+    CLASS_FILES,
+    CLASS_SNAPSHOT,
+    RESULTS_MANIFEST,
+    get_classes_counts,
+    _load_class_reference,
+    get_retropath_results,
+    load_class_reference
+)
+from biofoundry.retropath.preloader import PARTITIONS_DIR, RetroPathPreloader
+from biofoundry.retropath.sources import (
+    EXCLUDED_SOURCES,
+    PACKED_SOURCES,
+    PACKED_SOURCES_INDEX,
+    read_packed_source
+)
+from biofoundry.retropath.runner import RetroPathJob, RetroPathRunner
+from biofoundry.retropath.scheduling import CostModel
+from biofoundry.retropath.scope import (
+    SCOPE_FOUND,
+    SOURCE_IN_SINK,
+    NO_SOLUTION,
+    ScopeBackend,
+    run_scope,
+    run_scopes
+)
+from biofoundry.retropath.sweep import (
+    SWEEPS_DIR,
+    get_window_inputs,
+    run_sweep
+)
+from biofoundry.retropath.store import (
+    SUBSTRATE,
+    PRODUCT,
+    parse_stoichiometry
+)
+
+
+class StubBackend(BaseRetroPathBackend):
+    """
+    Backend copying the source as results, hanging for the given sources.
+    """
+
+    def __init__(self, hanging: tuple = (), r_code: str = 0) -> None:
+        self.hanging = hanging
+        self.r_code = r_code
+
+    def run(
+        self,
+        source_path: str,
+        sink_path: str,
+        rules_path: str,
+        outdir: str,
+        params: dict
+    ) -> int:
+
+        if os.path.basename(source_path).replace(".csv", "") in self.hanging:
+            time.sleep(60)
+
+        shutil.copy(source_path, os.path.join(outdir, "results.csv"))
+
+        return self.r_code
 
 
 @pytest.fixture(scope="module")
@@ -119,6 +209,89 @@ def test_get_rules(
     )
 
 
+def test_filter_rules(
+    config: dict,
+    preloader: RetroPathPreloader
+) -> None:
+
+    config_modified = copy.deepcopy(config)
+    config_modified["retropath"]["rules"] = {
+        "usage": ["both", "retro"],
+        "deduplicate": True
+    }
+
+    preloader_modified = copy.deepcopy(preloader)
+    preloader_modified.config = config_modified
+
+    rules_df = pd.DataFrame({
+        "Rule ID": [
+            "MNXR2_MNXM1",
+            "MNXR6_MNXM1",
+            "MNXR8_MNXM1",
+            "MNXR8_MNXM2",
+            "MNXR9_MNXM1",
+            "MNXR16_MNXM1",
+            "MNXR18_MNXM1"
+        ],
+        "Rule": [
+            "[C:1]>>[O:1]",
+            "[C:1]>>[O:1]",
+            "([C:1]-[O:2])>>[C:1].[O:2]",
+            "[C:1]-[O:2]>>[C:1].[O:2]",
+            "[C:1]-[O:2]>>[C:1].[O:2]",
+            "[N:1]>>[O:1]",
+            "[S:1]>>[O:1]"
+        ],
+        "EC number": ["1.1.1.1"] * 7,
+        "Rule usage": [
+            "both", "both", "retro", "retro", "retro", "forward", "both"
+        ],
+        "Diameter": [2, 6, 8, 8, 8, 16, 18]
+    })
+
+    rules_df = preloader_modified.filter_rules(rules_df)
+
+    # Diameters 2 and 18 are out of range, 16 is only used forward and one of
+    # the MNXR8 rules is duplicated, while MNXR9 is kept for the sink
+    assert rules_df["Rule ID"].tolist() == [
+        "MNXR6_MNXM1", "MNXR8_MNXM1", "MNXR9_MNXM1"
+    ]
+
+
+def test_get_rules_incremental(config: dict, tmp_path) -> None:
+
+    config_modified = copy.deepcopy(config)
+    config_modified["retropath"]["cache"]["dir"] = str(tmp_path)
+    config_modified["retropath"]["cache"]["incremental"] = True
+    config_modified["retropath"]["files"]["ec_numbers"] = os.path.join(
+        os.path.dirname(config_modified["retropath"]["files"]["ec_numbers"]),
+        "expected",
+        os.path.basename(config_modified["retropath"]["files"]["ec_numbers"])
+    )
+
+    preloader = RetroPathPreloader(config_modified)
+
+    rules_path = os.path.join(
+        config["paths"]["retropath"],
+        config["retropath"]["files"]["rules"]
+    )
+
+    rules_df = preloader.get_rules()
+    mtime = os.stat(rules_path).st_mtime_ns
+
+    # Unchanged inputs: the saved rules are returned without recomputing
+    assert_frame_equal(left=preloader.get_rules(), right=rules_df)
+    assert os.stat(rules_path).st_mtime_ns == mtime
+
+    # Changed parameters: the rules are recomputed
+    preloader.config["retropath"]["params"]["dmax"] = 14
+    _ = preloader.get_rules()
+    assert os.stat(rules_path).st_mtime_ns != mtime
+
+    # Clean temporal data
+    os.remove(rules_path)
+
+
 def test_get_sink(
     config: dict,
     preloader: RetroPathPreloader
@@ -164,6 +337,88 @@ def test_get_sink(
     )
 
 
+def test_get_sink_from_models(
+    config: dict,
+    preloader: RetroPathPreloader,
+    tmp_path
+) -> None:
+
+    # Use the expected rules and a formatted model with a single known
+    # ModelSEED metabolite
+    config_modified = copy.deepcopy(config)
+    config_modified["retropath"]["files"]["rules"] = os.path.join(
+        os.path.dirname(config_modified["retropath"]["files"]["rules"]),
+        "expected",
+        os.path.basename(config_modified["retropath"]["files"]["rules"])
+    )
+    config_modified["retropath"]["files"]["sink"] = str(tmp_path / "sink.csv")
+    config_modified["retropath"]["sink"] = {"mode": "models"}
+    config_modified["paths"]["models"] = str(tmp_path)
+
+    shutil.copy(
+        os.path.join(
+            config["paths"]["models"],
+            "expected",
+            "test_model_formatted.json"
+        ),
+        tmp_path / "test_model_formatted.json"
+    )
+
+    preloader_modified = copy.deepcopy(preloader)
+    preloader_modified.config = config_modified
+
+    # cpdXXXXX maps to MNXM9999999, cpdNNNNN to a compound without reactions
+    chem_xref_df = preloader_modified.load_chem_xref()
+    assert chem_xref_df["xref"].tolist() == ["cpdNNNNN", "cpdXXXXX"]
+
+    sink_df = preloader_modified.get_sink()
+
+    assert sink_df["Name"].tolist() == ["MNXM9999999"]
+    assert pd.read_csv(tmp_path / "sink.csv")["Name"].tolist() == \
+        ["MNXM9999999"]
+
+
+def test_standardize_sink(
+    config: dict,
+    preloader: RetroPathPreloader,
+    tmp_path
+) -> None:
+
+    config_modified = copy.deepcopy(config)
+    config_modified["retropath"]["cache"]["dir"] = str(tmp_path)
+
+    preloader_modified = copy.deepcopy(preloader)
+    preloader_modified.config = config_modified
+
+    sink_df = pd.DataFrame({
+        "Name": ["MNXM1", "MNXM2", "MNXM3", "MNXM4", "MNXM5"],
+        "InChI": [
+            "InChI=1S/C2H4O2/c1-2(3)4/h1H3,(H,3,4)/p-1", # Acetate
+            "InChI=1S/C2H4O2/c1-2(3)4/h1H3,(H,3,4)", # Acetic acid
+            "InChI=1S/C3H6O3/c1-2(4)3(5)6/h2,4H,1H3,(H,5,6)/t2-/m0/s1",
+            "inchi1",
+            "None"
+        ]
+    })
+
+    standardized_df = preloader_modified.standardize_sink(sink_df)
+
+    assert standardized_df["Name"].tolist() == ["MNXM1", "MNXM3"]
+    assert standardized_df["InChI"].tolist() == [
+        "InChI=1S/C2H4O2/c1-2(3)4/h1H3,(H,3,4)",
+        "InChI=1S/C3H6O3/c1-2(4)3(5)6/h2,4H,1H3,(H,5,6)"
+    ]
+
+    # Standardized InChIs are cached for the next runs, invalid ones as ""
+    cache = ConversionCache(str(tmp_path / "sink_inchi.csv"))
+    assert len(cache) == 4
+    assert cache.get("inchi1") == ""
+
+    standardized_df = preloader_modified.standardize_sink(sink_df)
+
+    assert standardized_df["Name"].tolist() == ["MNXM1", "MNXM3"]
+
+
 def test_get_sources_file_creation(
     config: dict,
     preloader: RetroPathPreloader
@@ -232,3 +487,1335 @@ def test_get_sources_inchi(
                 filename
             )
         )
+
+
+def test_get_sources_filter(
+    config: dict,
+    preloader: RetroPathPreloader
+) -> None:
+
+    config_modified = copy.deepcopy(config)
+    config_modified["retropath"]["params"]["mwmax_source"] = 300
+
+    preloader_modified = copy.deepcopy(preloader)
+    preloader_modified.config = config_modified
+
+    sources_df = preloader_modified.get_sources(write_files=False)
+
+    excluded_path = os.path.join(
+        config["paths"]["retropath"],
+        "interesting_metabolites/",
+        EXCLUDED_SOURCES
+    )
+    excluded_df = pd.read_csv(excluded_path)
+
+    # Clean temporal data
+    os.remove(excluded_path)
+
+    assert sorted(sources_df["Name"]) == ["fructose", "glucose"]
+    assert excluded_df["Name"].tolist() == ["sucrose"]
+    assert excluded_df["Reason"].tolist() == ["Molecular weight > 300"]
+
+    # Unknown descriptors are rejected before computing any descriptor
+    preloader_modified.config["retropath"]["sources"]["max_descriptors"] = {
+        "rings": 2
+    }
+    with pytest.raises(ValueError, match="Heavy atoms"):
+        preloader_modified.filter_sources(
+            sources_df=sources_df,
+            excluded_path=excluded_path
+        )
+
+
+def test_runner_flagged_sources(
+    config: dict,
+    preloader: RetroPathPreloader
+) -> None:
+
+    config_modified = copy.deepcopy(config)
+    config_modified["retropath"]["params"]["mwmax_source"] = 300
+    config_modified["retropath"]["sources"]["max_descriptors"] = None
+    config_modified["retropath"]["sources"]["action"] = "flag"
+    for file in ("rules", "sink"):
+        config_modified["retropath"]["files"][file] = os.path.join(
+            "expected",
+            config_modified["retropath"]["files"][file]
+        )
+    config_modified["retropath"]["runner"].update(
+        n_workers=1,
+        schedule=False,
+        precheck=None
+    )
+
+    preloader_modified = copy.deepcopy(preloader)
+    preloader_modified.config = config_modified
+
+    sources_df = preloader_modified.get_sources(write_files=False, pack=True)
+
+    runner = RetroPathRunner(config=config_modified, backend=StubBackend())
+    excluded = {job.source: job.excluded for job in runner.get_jobs(packed=True)}
+
+    _ = runner.run(packed=True)
+    run_order = pd.read_csv(runner.manifest_path)["Source"].tolist()
+
+    # Clean temporal data
+    sources_dir = os.path.dirname(runner.manifest_path)
+    os.remove(runner.manifest_path)
+    os.remove(os.path.join(sources_dir, PACKED_SOURCES))
+    os.remove(os.path.join(sources_dir, PACKED_SOURCES_INDEX))
+    os.remove(os.path.join(sources_dir, EXCLUDED_SOURCES))
+    shutil.rmtree(runner.experiments_dir)
+
+    # Flagged sources are kept, but run after the others
+    assert sorted(sources_df["Name"]) == ["fructose", "glucose", "sucrose"]
+    assert excluded["sucrose"] == "Molecular weight > 300"
+    assert excluded["glucose"] is None
+    assert run_order[-1] == "sucrose"
+
+
+def test_tables_cache(
+    config: dict,
+    tmp_path
+) -> None:
+
+    preloader = RetroPathPreloader(config)
+
+    _ = preloader.load_metanetx_reac_prop()
+    _ = preloader.load_metanetx_reac_prop()
+
+    cache_info = preloader.tables.cache_info()
+
+    assert cache_info["misses"] == 1 and cache_info["hits"] == 1, \
+        "Reference tables were not memoized!"
+
+    # Modifying the file must invalidate the cached table
+    table_path = tmp_path / "table.csv"
+    table_path.write_text("A,B\n1,2\n")
+
+    table_df = preloader.tables.load(path=str(table_path), reader=pd.read_csv)
+    table_df["A"] = 0 # Copies must not modify the cache
+
+    table_path.write_text("A,B\n1,2\n3,4\n")
+
+    table_df = preloader.tables.load(path=str(table_path), reader=pd.read_csv)
+
+    assert table_df["A"].tolist() == [1, 3], "Cached table was not invalidated!"
+
+    # Tables exceeding the size limit must be evicted
+    preloader.tables.max_size = 0
+    preloader.tables.evict()
+
+    assert preloader.tables.cache_info()["tables"] == 0, \
+        "Tables were not evicted!"
+
+
+def test_parse_stoichiometry() -> None:
+
+    stoichiometry_df = parse_stoichiometry(
+        pd.DataFrame({
+            "ID": ["MNXR1", "MNXR2"],
+            "mnx_equation": [
+                "2 MNXM1@MNXD1 + 1 WATER@MNXD1 = 1 MNXM2@MNXD2",
+                "MNXM2 = MNXM3"
+            ]
+        })
+    )
+
+    assert stoichiometry_df["compound"].astype(str).tolist() == \
+        ["MNXM1", "WATER", "MNXM2", "MNXM2", "MNXM3"], \
+        "Compounds were not correctly parsed!"
+    assert stoichiometry_df["coefficient"].tolist() == [2, 1, 1, 1, 1], \
+        "Coefficients were not correctly parsed!"
+    assert stoichiometry_df["side"].tolist() == \
+        [SUBSTRATE, SUBSTRATE, PRODUCT, SUBSTRATE, PRODUCT], \
+        "Sides were not correctly parsed!"
+
+
+def test_expand_network() -> None:
+
+    stoichiometry_df = parse_stoichiometry(
+        pd.DataFrame({
+            "ID": ["MNXR1", "MNXR2", "MNXR3", "MNXR4"],
+            "mnx_equation": [
+                "1 MNXM1@MNXD1 + 1 MNXM2@MNXD1 = 1 MNXM3@MNXD1",
+                "1 MNXM3@MNXD1 = 1 MNXM4@MNXD1",
+                "1 MNXM2@MNXD1 = 1 MNXM5@MNXD1",
+                "1 MNXM6@MNXD1 = 1 MNXM7@MNXD1"
+            ]
+        })
+    )
+    compound_ids = stoichiometry_df["compound"].cat.categories
+
+    substrates, products, _ = get_incidence(
+        stoichiometry_df=stoichiometry_df,
+        reactions_df=pd.DataFrame({
+            "reaction": [0, 1, 2, 3],
+            "Reversible": [False, False, True, False]
+        })
+    )
+
+    # MNXM2 is only produced by the reversed MNXR3
+    seeds = np.isin(compound_ids, ["MNXM1", "MNXM5"])
+
+    rounds = expand_network(
+        substrates=substrates,
+        products=products,
+        seeds=seeds
+    )
+
+    assert dict(zip(compound_ids, rounds)) == {
+        "MNXM1": 0,
+        "MNXM2": 1,
+        "MNXM3": 2,
+        "MNXM4": 3,
+        "MNXM5": 0,
+        "MNXM6": UNREACHABLE,
+        "MNXM7": UNREACHABLE
+    }, "Compounds were not reached in the expected rounds!"
+
+
+def test_get_reachable_sources(config: dict, tmp_path) -> None:
+
+    # Ethyl acetate hydrolysis, consuming the generic WATER compound
+    metanetx_dir = tmp_path / "metanetx"
+    metanetx_dir.mkdir()
+    (metanetx_dir / "reac_prop.tsv").write_text(
+        "#ID\tmnx_equation\n" + \
+        "MNXR1\t1 MNXM10@MNXD1 + 1 WATER@MNXD1 = " + \
+        "1 MNXM11@MNXD1 + 1 MNXM12@MNXD1\n"
+    )
+    (metanetx_dir / "chem_prop.tsv").write_text(
+        "#ID\tname\treference\tformula\tcharge\tmass\tInChI\tInChIKey\n" + \
+        "MNXM11\tethanol\t\t\t\t\t\tLFQSCWFLJHTTHZ-UHFFFAOYSA-N\n" + \
+        "MNXM13\tmethanol\t\t\t\t\t\tOKKJLVBELUTLKV-UHFFFAOYSA-N\n"
+    )
+    (tmp_path / "interesting_metabolites").mkdir()
+    pd.DataFrame({
+        "Rule ID": ["MNXR1_MNXM11"],
+        "Rule": ["rule"],
+        "EC number": ["3.1.1.1"],
+        "Rule usage": ["forward"]
+    }).to_csv(tmp_path / "rules.csv", index=False)
+
+    config_modified = copy.deepcopy(config)
+    config_modified["paths"]["metanetx"] = str(metanetx_dir)
+    config_modified["paths"]["retropath"] = str(tmp_path)
+    config_modified["retropath"]["files"]["rules"] = "rules.csv"
+
+    preloader = RetroPathPreloader(config_modified)
+
+    expansion_df = preloader.get_reachable_sources(
+        sources_df=pd.DataFrame({
+            "Name": ["ethanol", "methanol"],
+            "InChI": [
+                "InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3",
+                "InChI=1S/CH4O/c1-2/h2H,1H3"
+            ]
+        }),
+        seeds=["MNXM10"]
+    )
+
+    assert expansion_df["Reachable"].tolist() == [True, pd.NA]
+    assert expansion_df["Round"].tolist()[0] == 1
+
+
+def test_get_orgs_with_source_in_sink(
+    config: dict,
+    preloader: RetroPathPreloader
+) -> None:
+
+    # Change input files by the expected ones
+    config_modified = copy.deepcopy(config)
+    for file in ("ec_numbers", "rules"):
+        config_modified["retropath"]["files"][file] = os.path.join(
+            "expected",
+            config_modified["retropath"]["files"][file]
+        )
+
+    preloader_modified = copy.deepcopy(preloader)
+    preloader_modified.config = config_modified
+
+    orgs_df = preloader_modified.get_orgs_with_source_in_sink(["MNXM9999999"])
+
+    assert orgs_df.to_dict(orient="records") == [
+        {"Organism": "organism", "Source match": "MNXM9999999"}
+    ], "Organisms with source in sink were not correctly retrieved!"
+
+
+def test_get_orgs_with_sources_in_sink(
+    config: dict,
+    preloader: RetroPathPreloader
+) -> None:
+
+    # Change input files by the expected ones
+    config_modified = copy.deepcopy(config)
+    for file in ("ec_numbers", "rules"):
+        config_modified["retropath"]["files"][file] = os.path.join(
+            "expected",
+            config_modified["retropath"]["files"][file]
+        )
+
+    preloader_modified = copy.deepcopy(preloader)
+    preloader_modified.config = config_modified
+
+    orgs_df = preloader_modified.get_orgs_with_sources_in_sink({
+        "first": ["MNXM9999999"],
+        "second": ["MNXM99999810", "MNXM0"],
+        "missing": ["MNXM0"]
+    })
+
+    assert orgs_df.to_dict(orient="records") == [
+        {
+            "Source": "first",
+            "Organism": "organism",
+            "Source match": "MNXM9999999"
+        },
+        {
+            "Source": "second",
+            "Organism": "organism",
+            "Source match": "MNXM99999810"
+        }
+    ], "Organisms with sources in sink were not correctly retrieved!"
+
+
+def test_get_inchis_from_smiles(tmp_path) -> None:
+
+    cache_path = str(tmp_path / "smiles_inchi.csv")
+
+    # The dummy atom is valid SMILES but has no InChI
+    smiles = pd.Series(["OCC", "CCO", "not-a-smiles", "*C", None])
+
+    inchis = get_inchis_from_smiles(
+        smiles=smiles,
+        cache=ConversionCache(cache_path),
+        n_jobs=2,
+        min_pool_size=1
+    )
+
+    assert inchis.tolist()[:4] == [
+        "InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3",
+        "InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3",
+        None,
+        None
+    ] and pd.isnull(inchis[4]), "SMILES were not correctly converted!"
+
+    # Equivalent SMILES share the same cache entry, failures are cached too
+    assert len(ConversionCache(cache_path)) == 2, \
+        "Conversions were not correctly cached!"
+
+    # Reruns convert nothing, not even the molecules without InChI
+    with mock.patch(
+        "biofoundry.retropath.chem.smiles_to_inchi"
+    ) as converter:
+        inchis_rerun = get_inchis_from_smiles(
+            smiles=smiles,
+            cache=ConversionCache(cache_path)
+        )
+
+    assert converter.call_count == 0
+    assert inchis_rerun.iloc[:4].tolist() == inchis.iloc[:4].tolist()
+
+
+def test_get_sources_packed(
+    config: dict,
+    preloader: RetroPathPreloader
+) -> None:
+
+    sources_df = preloader.get_sources(write_files=False, pack=True)
+
+    sources_dir = os.path.join(
+        config["paths"]["retropath"],
+        "interesting_metabolites/"
+    )
+    packed_path = os.path.join(sources_dir, PACKED_SOURCES)
+    index_path = os.path.join(sources_dir, PACKED_SOURCES_INDEX)
+
+    packed_df = pd.read_csv(packed_path)
+    index_df = pd.read_csv(index_path)
+
+    for name in sources_df["Name"]:
+        source_text = read_packed_source(
+            packed_path=packed_path,
+            name=name,
+            index_df=index_df
+        )
+
+        with open(
+            os.path.join(sources_dir, "../expected/sources/", f"{name}.csv")
+        ) as fh:
+            assert source_text == fh.read(), \
+                "Packed source does not match its source file!"
+
+    # Clean temporal data
+    os.remove(packed_path)
+    os.remove(index_path)
+
+    assert len(packed_df) == len(sources_df), \
+        "Packed sources file was not correctly created!"
+
+
+def test_runner(
+    config: dict,
+    preloader: RetroPathPreloader
+) -> None:
+
+    sources_df = preloader.get_sources(write_files=False, pack=True)
+
+    # Change input files by the expected ones
+    config_modified = copy.deepcopy(config)
+    for file in ("rules", "sink"):
+        config_modified["retropath"]["files"][file] = os.path.join(
+            "expected",
+            config_modified["retropath"]["files"][file]
+        )
+
+    runner = RetroPathRunner(
+        config=config_modified,
+        backend=StubBackend(hanging=("sucrose", ))
+    )
+    runner.timeout = 2
+
+    manifest_df = runner.run(packed=True)
+    statuses = dict(zip(manifest_df["Source"], manifest_df["Status"]))
+
+    # Restarting must only rerun unfinished sources
+    runner.backend = StubBackend()
+    manifest_df = runner.run(packed=True)
+    n_records = len(pd.read_csv(runner.manifest_path))
+
+    # Clean temporal data
+    sources_dir = os.path.dirname(runner.manifest_path)
+    os.remove(runner.manifest_path)
+    os.remove(os.path.join(sources_dir, PACKED_SOURCES))
+    os.remove(os.path.join(sources_dir, PACKED_SOURCES_INDEX))
+    shutil.rmtree(runner.experiments_dir)
+
+    assert statuses == {
+        "sucrose": "Timeout",
+        "glucose": "Finished",
+        "fructose": "Finished"
+    }, "Runs were not correctly recorded!"
+
+    assert (manifest_df["Status"] == "Finished").all() and \
+        n_records == len(sources_df) + 1, "Finished runs were not skipped!"
+
+
+def test_runner_changed_inputs(
+    config: dict,
+    preloader: RetroPathPreloader
+) -> None:
+
+    sources_df = preloader.get_sources(write_files=False, pack=True)
+
+    # Change input files by the expected ones
+    config_modified = copy.deepcopy(config)
+    for file in ("rules", "sink"):
+        config_modified["retropath"]["files"][file] = os.path.join(
+            "expected",
+            config_modified["retropath"]["files"][file]
+        )
+
+    runner = RetroPathRunner(config=config_modified, backend=StubBackend())
+    _ = runner.run(packed=True)
+
+    # Unchanged inputs are skipped, changed parameters are run again
+    _ = runner.run(packed=True)
+    n_records_unchanged = len(pd.read_csv(runner.manifest_path))
+
+    runner.config["retropath"]["params"]["dmax"] += 2
+    manifest_df = runner.run(packed=True)
+    records_df = pd.read_csv(runner.manifest_path)
+
+    # Clean temporal data
+    sources_dir = os.path.dirname(runner.manifest_path)
+    os.remove(runner.manifest_path)
+    os.remove(os.path.join(sources_dir, PACKED_SOURCES))
+    os.remove(os.path.join(sources_dir, PACKED_SOURCES_INDEX))
+    shutil.rmtree(runner.experiments_dir)
+
+    assert n_records_unchanged == len(sources_df)
+    assert len(records_df) == 2 * len(sources_df), \
+        "Runs with changed parameters were skipped!"
+    assert (manifest_df["Status"] == "Finished").all()
+    assert records_df.groupby("Experiment")["Cache key"].nunique().eq(2).all()
+
+
+def test_runner_result_cache(
+    config: dict,
+    preloader: RetroPathPreloader,
+    tmp_path
+) -> None:
+
+    _ = preloader.get_sources(write_files=False, pack=True)
+
+    # Change input files by the expected ones
+    config_modified = copy.deepcopy(config)
+    for file in ("rules", "sink"):
+        config_modified["retropath"]["files"][file] = os.path.join(
+            "expected",
+            config_modified["retropath"]["files"][file]
+        )
+    config_modified["retropath"]["cache"]["dir"] = str(tmp_path)
+    config_modified["retropath"]["cache"]["results"] = True
+
+    runner = RetroPathRunner(
+        config=config_modified,
+        backend=StubBackend(r_code="OK")
+    )
+    _ = runner.run(packed=True)
+
+    os.remove(runner.manifest_path)
+    shutil.rmtree(runner.experiments_dir)
+
+    # Cached runs must be restored instead of run again
+    runner = RetroPathRunner(
+        config=config_modified,
+        backend=StubBackend(
+            hanging=("glucose", "fructose", "sucrose"),
+            r_code="OK"
+        )
+    )
+    runner.timeout = 2
+    manifest_df = runner.run(packed=True)
+    is_restored = [
+        os.path.exists(
+            os.path.join(runner.experiments_dir, source, "results.csv")
+        )
+        for source in manifest_df["Source"]
+    ]
+    cache_info = runner.results.cache_info()
+
+    # Least recently used entries are evicted when over budget
+    runner.results.max_size = cache_info["size"] // 2
+    runner.results.evict()
+    n_entries = runner.results.cache_info()["entries"]
+
+    # Clean temporal data
+    sources_dir = os.path.dirname(runner.manifest_path)
+    os.remove(runner.manifest_path)
+    os.remove(os.path.join(sources_dir, PACKED_SOURCES))
+    os.remove(os.path.join(sources_dir, PACKED_SOURCES_INDEX))
+    shutil.rmtree(runner.experiments_dir)
+
+    assert (manifest_df["Status"] == "Finished").all() and all(is_restored)
+    assert cache_info["hits"] == 3 and cache_info["entries"] == 3
+    assert 0 < n_entries < 3
+
+
+def test_runner_result_cache_failures(
+    config: dict,
+    preloader: RetroPathPreloader,
+    tmp_path
+) -> None:
+
+    _ = preloader.get_sources(write_files=False, pack=True)
+
+    # Change input files by the expected ones
+    config_modified = copy.deepcopy(config)
+    for file in ("rules", "sink"):
+        config_modified["retropath"]["files"][file] = os.path.join(
+            "expected",
+            config_modified["retropath"]["files"][file]
+        )
+    config_modified["retropath"]["cache"]["dir"] = str(tmp_path)
+    config_modified["retropath"]["cache"]["results"] = True
+
+    # Runs exiting cleanly with a one-off failure must not be cached
+    runner = RetroPathRunner(
+        config=config_modified,
+        backend=StubBackend(r_code="JavaError")
+    )
+    manifest_df = runner.run(packed=True)
+    cache_info = runner.results.cache_info()
+
+    # Runs of another backend must not be restored
+    keys = [
+        runner.results.get_key(
+            rules_path=os.path.join(
+                config["paths"]["retropath"],
+                config_modified["retropath"]["files"]["rules"]
+            ),
+            sink_path=os.path.join(
+                config["paths"]["retropath"],
+                config_modified["retropath"]["files"]["sink"]
+            ),
+            source_name="methane",
+            source_inchi="InChI=1S/CH4/h1H4",
+            params={},
+            backend={"name": name, "version": None}
+        )
+        for name in ("ScopeBackend", "RetroPath2WrapperBackend")
+    ]
+
+    # Clean temporal data
+    sources_dir = os.path.dirname(runner.manifest_path)
+    os.remove(runner.manifest_path)
+    os.remove(os.path.join(sources_dir, PACKED_SOURCES))
+    os.remove(os.path.join(sources_dir, PACKED_SOURCES_INDEX))
+    shutil.rmtree(runner.experiments_dir)
+
+    assert (manifest_df["Status"] == "Finished").all()
+    assert (manifest_df["Return code"] == "JavaError").all()
+    assert cache_info["entries"] == 0
+    assert keys[0] != keys[1]
+
+
+def test_runner_partitions(
+    config: dict,
+    preloader: RetroPathPreloader
+) -> None:
+
+    # Change input files by the expected ones
+    config_modified = copy.deepcopy(config)
+    for file in ("ec_numbers", "rules", "sink"):
+        config_modified["retropath"]["files"][file] = os.path.join(
+            "expected",
+            config_modified["retropath"]["files"][file]
+        )
+
+    preloader_modified = copy.deepcopy(preloader)
+    preloader_modified.config = config_modified
+
+    partitions_df = preloader_modified.get_partitions()
+    _ = preloader_modified.get_sources(write_files=False, pack=True)
+
+    runner = RetroPathRunner(config=config_modified, backend=StubBackend())
+    manifest_df = runner.run(packed=True, partitions=True)
+
+    # Clean temporal data
+    sources_dir = os.path.dirname(runner.manifest_path)
+    os.remove(runner.manifest_path)
+    os.remove(os.path.join(sources_dir, PACKED_SOURCES))
+    os.remove(os.path.join(sources_dir, PACKED_SOURCES_INDEX))
+    shutil.rmtree(runner.experiments_dir)
+    shutil.rmtree(os.path.join(config["paths"]["retropath"], PARTITIONS_DIR))
+
+    assert partitions_df.to_dict("records") == [
+        {"Organism": "organism", "Rules": 3, "Sink": 2}
+    ]
+
+    assert sorted(manifest_df["Experiment"]) == [
+        "organism/fructose",
+        "organism/glucose",
+        "organism/sucrose"
+    ]
+    assert (manifest_df["Status"] == "Finished").all()
+
+
+def test_get_retropath_results(
+    config: dict,
+    tmp_path
+) -> None:
+
+    config_modified = copy.deepcopy(config)
+    config_modified["paths"]["retropath"] = str(tmp_path)
+
+    interesting_metabolites_dir = tmp_path / "interesting_metabolites"
+    (interesting_metabolites_dir / "sources").mkdir(parents=True)
+
+    experiments = {
+        "a": {"a_scope.csv": "x\n", "results.csv": "x\n"},
+        "b": {"results.csv": "x\n", "source-in-sink.csv": "x\n"},
+        "c": {"source-in-sink.csv": "x\ny\n"},
+        "d": {"source-in-sink.csv": "x\n"},
+        "e": {}
+    }
+    for source, files in experiments.items():
+        (interesting_metabolites_dir / "sources" / f"{source}.csv").touch()
+
+        # Organism partitions
+        for organism in ["org1", "org2"]:
+            experiment_dir = interesting_metabolites_dir / "experiments" / \
+                organism / source
+            experiment_dir.mkdir(parents=True)
+            for filename, contents in files.items():
+                (experiment_dir / filename).write_text(contents)
+
+    (interesting_metabolites_dir / "sources" / "f.csv").touch()
+
+    results_df = get_retropath_results(config_modified, incremental=True)
+    statuses = results_df.set_index("Source")["Status"]
+
+    assert len(statuses) == 12
+    assert statuses.loc[["org1/a", "org1/b", "org1/c", "org1/d"]].tolist() \
+        == ["Scope", "Results but no scope", "Source in sink",
+            "Source in sink (empty)"]
+    assert (statuses.loc[["org1/e", "org2/e", "org1/f", "org2/f"]] \
+        == "Error").all()
+
+    # Only modified folders are classified again
+    assert (interesting_metabolites_dir / RESULTS_MANIFEST).exists()
+    os.remove(interesting_metabolites_dir / "experiments/org2/b/results.csv")
+
+    results_df = get_retropath_results(config_modified, incremental=True)
+    statuses = results_df.set_index("Source")["Status"]
+
+    assert statuses["org1/b"] == "Results but no scope"
+    assert statuses["org2/b"] == "Source in sink (empty)"
+
+    # Files rewritten in place, which keeps the folder mtime, are classified
+    # again too
+    (interesting_metabolites_dir / "experiments/org1/c/source-in-sink.csv")\
+        .write_text("x\n")
+
+    results_df = get_retropath_results(config_modified, incremental=True)
+    statuses = results_df.set_index("Source")["Status"]
+
+    assert statuses["org1/c"] == "Source in sink (empty)"
+
+
+def test_get_classes_counts(
+    config: dict,
+    tmp_path
+) -> None:
+
+    classes_dir = tmp_path / "classes"
+    classes_dir.mkdir()
+
+    # Compound lists are read with a stub of pandas.read_excel
+    compounds = {
+        "Detectables_list.xlsx": [("D1", "Glucose")],
+        "Producibles_list.xlsx": [("P1", "Sucrose")]
+    }
+    annotations = {
+        "AnotacionDetectables.txt": "0\tD1\tSugars\n",
+        "AnotacionDetectablesEnvipath.txt": "0\tD2\tAlcohols\n",
+        "AnotacionProducibles.txt": "0\tP1\tDisaccharides\n",
+        "AnotacionProduciblesEnvipath.txt": "0\tP2\tAlcohols\n"
+    }
+    for _, filename in CLASS_FILES:
+        (classes_dir / filename).write_text(annotations.get(filename, ""))
+
+    def read_excel(path: str, header: int, names: list) -> pd.DataFrame:
+        return pd.DataFrame(
+            [
+                [compound_id, "C", *[None] * (len(names) - 3), source]
+                for compound_id, source in compounds[os.path.basename(path)]
+            ],
+            columns=names
+        )
+
+    config_modified = copy.deepcopy(config)
+    config_modified["paths"]["retropath_classes"] = str(classes_dir)
+    config_modified["paths"]["retropath"] = str(tmp_path)
+    config_modified["retropath"]["cache"]["dir"] = str(tmp_path)
+    config_modified["retropath"]["n_jobs"] = 1
+
+    results_df = pd.DataFrame({
+        "Source": ["org1/glucose", "sucrose", "fructose"],
+        "Status": ["Scope", "Scope", "Error"]
+    })
+
+    def get_counts() -> dict:
+        counts_df = get_classes_counts(results_df, config_modified)
+        return {
+            (status, class_name): frequency
+            for status, class_name, frequency in counts_df.to_numpy()
+        }
+
+    _load_class_reference.cache_clear()
+    with mock.patch("pandas.read_excel", side_effect=read_excel) as reader:
+        counts = get_counts()
+        assert (tmp_path / CLASS_SNAPSHOT).exists()
+        assert reader.call_count == 2
+
+        # The snapshot is used once the in-memory cache is cleared
+        _load_class_reference.cache_clear()
+        assert get_counts() == counts
+        assert reader.call_count == 2
+
+        # Modifying any source file invalidates the snapshot
+        (classes_dir / "AnotacionProducibles.txt").write_text(
+            "0\tP1\tSugars\n"
+        )
+        updated_counts = get_counts()
+        assert reader.call_count == 4
+
+        # Each call gets its own copy of the cached reference
+        reference_args = {
+            "classes_dir": str(classes_dir),
+            "snapshot_path": str(tmp_path / CLASS_SNAPSHOT),
+            "signatures": ()
+        }
+        reference_df = load_class_reference(**reference_args)
+        reference_df.drop(columns="Class", inplace=True)
+        assert "Class" in load_class_reference(**reference_args).columns
+
+    _load_class_reference.cache_clear()
+
+    # Partition prefixes are stripped, sources without class are skipped
+    assert counts == {("Scope", "Sugars"): 1, ("Scope", "Disaccharides"): 1}
+    assert updated_counts == {("Scope", "Sugars"): 2}
+
+
+def test_pathway_store(
+    config: dict,
+    tmp_path
+) -> None:
+
+    config_modified = copy.deepcopy(config)
+    config_modified["paths"]["retropath"] = str(tmp_path)
+
+    experiments_dir = tmp_path / "interesting_metabolites" / "experiments"
+
+    results = "Initial source,Transformation ID,Reaction SMILES," + \
+        "Substrate SMILES,Product SMILES,In Sink,Sink name,Rule ID," + \
+        "EC number,Diameter,Score,Iteration\n" + \
+        "a,TRS_1_0,CCO>>CC=O.O,CCO,CC=O.O,0.1,.MNXM2,RR-1,1.1.1.1,16,0.9,1\n" + \
+        "a,TRS_2_1,CC=O>>CC,CC=O,CC,1,MNXM3,\"[RR-2,RR-3]\"," + \
+        "\"[1.14.13.1,1.14.13.25]\",16,0.5,2\n" + \
+        "a,TRS_1_2,CCO>>C,CCO,C,0,,RR-4,2.3.1.-,16,0.1,1\n"
+
+    for source in ["a", "b"]:
+        (experiments_dir / source).mkdir(parents=True)
+        (experiments_dir / source / "results.csv").write_text(
+            results.replace("a,TRS", f"{source},TRS")
+        )
+    (experiments_dir / "a" / "a_scope.csv").write_text(
+        "\n".join(results.splitlines()[:3]) + "\n"
+    )
+    (experiments_dir / "c").mkdir()
+
+    store = get_pathway_store(config_modified)
+
+    assert (experiments_dir.parent / PATHWAYS_STORE).exists()
+    assert len(store) == 10
+
+    # EC class queries
+    ec_df = store.get_by_ec("1.14.13.x")
+    assert sorted(ec_df["EC number"].unique()) == ["1.14.13.1", "1.14.13.25"]
+    assert sorted(ec_df["Source"].unique()) == ["a", "b"]
+    assert len(store.get_by_ec("1.14.13.1")) == 2
+    assert len(store.get_by_ec("1.14.1")) == 0
+
+    # Compound queries, with sink flags per product
+    water_df = store.get_by_compound("O", side="product")
+    assert water_df["In sink"].all() and \
+        (water_df["Sink name"] == "MNXM2").all()
+    assert len(store.get_by_compound("OCC")) == 6
+
+    source_df = store.get_by_source("a")
+    assert sorted(source_df.loc[source_df["In scope"], "Transformation ID"]\
+        .unique()) == ["TRS_1_0", "TRS_2_1"]
+
+    # The saved store is reused for unmodified experiments
+    loaded = PathwayStore.load(str(experiments_dir.parent / PATHWAYS_STORE))
+    assert_frame_equal(loaded.df, store.df)
+
+    shutil.rmtree(experiments_dir / "b")
+    assert len(get_pathway_store(config_modified).get_by_source("b")) == 0
+
+    # Results rewritten in place, which keeps the folder mtime, are read again
+    (experiments_dir / "a" / "results.csv").write_text(
+        "\n".join(results.splitlines()[:2]) + "\n"
+    )
+    source_df = get_pathway_store(config_modified).get_by_source("a")
+    assert source_df["Transformation ID"].unique().tolist() == ["TRS_1_0"]
+
+
+def test_rank_pathways() -> None:
+
+    # S can be made from A, B or the sink, A from B or the sink and B from
+    # the sink or from C and D (branching)
+    scope_df = pd.DataFrame(
+        [
+            ("t1", "S", "A", False, 0.9, 1),
+            ("t1", "S", "W", True, 0.9, 1),
+            ("t2", "S", "B", False, 0.5, 1),
+            ("t3", "A", "X", True, 0.8, 2),
+            ("t4", "B", "X", True, 0.9, 2),
+            ("t5", "A", "B", False, 0.9, 2),
+            ("t6", "S", "X", True, 0.01, 1),
+            ("t7", "B", "C", False, 0.9, 2),
+            ("t7", "B", "D", False, 0.9, 2)
+        ],
+        columns=[
+            "Transformation ID",
+            "Substrate",
+            "Product",
+            "In sink",
+            "Score",
+            "Iteration"
+        ]
+    )
+    scope_df["Rule ID"] = "RR-" + scope_df["Transformation ID"]
+    scope_df["EC number"] = "1.1.1.1"
+    scope_df["In scope"] = True
+    scope_df["Source"] = "S"
+
+    graph = ScopeGraph.from_scope(scope_df)
+
+    assert len(graph.indices) == 6, "Branching transformations were kept!"
+
+    ranking_df = rank_pathways(scope_df, k=10, weight="steps")
+    pathways = ranking_df\
+        .groupby("Rank")["Transformation ID"]\
+        .agg(list)\
+        .tolist()
+
+    assert pathways == [
+        ["t6"],
+        ["t3", "t1"],
+        ["t4", "t2"],
+        ["t4", "t5", "t1"]
+    ]
+
+    # By score, the pathway with the highest product of scores comes first
+    ranking_df = rank_pathways(scope_df, k=2, weight="score")
+    best_df = ranking_df[ranking_df["Rank"] == 1]
+
+    assert best_df["Transformation ID"].tolist() == ["t4", "t5", "t1"]
+    assert np.isclose(best_df["Cost"].iloc[0], -np.log(0.9 ** 3))
+    assert best_df["Precursor"].tolist() == [None, "B", "A"]
+
+
+def test_attribute_pathways() -> None:
+
+    ranking_df = pd.DataFrame({
+        "Source": ["s", "s", "s", "t", "t"],
+        "Rank": [1, 1, 1, 1, 1],
+        "Step": [1, 2, 3, 1, 2],
+        "Rule ID": ["RR-1", "RR-2", "RR-3", "RR-1", "RR-4"],
+        "EC number": ["1.1.1.1", None, "2.2.2.2,3.3.3.3", "1.1.1.1", "9.9.9.9"]
+    })
+    ec_numbers_df = pd.DataFrame({
+        "ec_numbers": ["1.1.1.1", "2.2.2.2", "4.4.4.4", "1.1.1.1", "3.3.3.3"],
+        "ID": ["org1", "org1", "org2", "org2", "org3"]
+    })
+    rules_df = pd.DataFrame({"Rule ID": ["RR-2"], "EC number": ["4.4.4.4"]})
+
+    attribution_df, coverage_df = attribute_pathways(
+        ranking_df=ranking_df,
+        ec_numbers_df=ec_numbers_df,
+        rules_df=rules_df
+    )
+    attribution_df = attribution_df.set_index("Source")
+
+    # Step 2 of s is only attributed through the EC number of its rule
+    assert attribution_df.loc["s", "Steps covered"] == 3
+    assert attribution_df.loc["s", "Consortium"] == "org1,org2"
+    assert attribution_df.loc["t", "Consortium size"] == 0
+
+    assert coverage_df.loc[
+            coverage_df["Source"] == "s",
+            ["Organism", "Steps covered"]
+        ].values.tolist() == [["org1", 2], ["org2", 2], ["org3", 1]]
+
+    # The greedy cover is not minimal here
+    organism_masks = {"a": 0b111000, "b": 0b000111, "c": 0b110110}
+    assert get_minimal_consortium(organism_masks, 6) == (["a", "b"], True)
+    assert get_minimal_consortium(organism_masks, 6, max_exact=0)[1] is False
+
+
+def test_run_sweep(
+    config: dict,
+    preloader: RetroPathPreloader
+) -> None:
+
+    # Change input files by the expected ones
+    config_modified = copy.deepcopy(config)
+    for file in ("ec_numbers", "rules", "sink"):
+        config_modified["retropath"]["files"][file] = os.path.join(
+            "expected",
+            config_modified["retropath"]["files"][file]
+        )
+
+    preloader_modified = copy.deepcopy(preloader)
+    preloader_modified.config = config_modified
+    _ = preloader_modified.get_sources(write_files=False, pack=True)
+
+    runner = RetroPathRunner(config=config_modified, backend=StubBackend())
+
+    results_df = run_sweep(
+        config=config_modified,
+        grid={"max_steps": [2, 3], "dmin": [6, 8]},
+        packed=True,
+        runner=runner,
+        preloader=preloader_modified
+    )
+
+    # Clean temporal data
+    sources_dir = os.path.dirname(runner.manifest_path)
+    sweeps_dir = os.path.join(sources_dir, SWEEPS_DIR)
+    window_files = sorted(os.listdir(os.path.join(sweeps_dir, "windows")))
+    os.remove(runner.manifest_path)
+    os.remove(os.path.join(sources_dir, PACKED_SOURCES))
+    os.remove(os.path.join(sources_dir, PACKED_SOURCES_INDEX))
+    shutil.rmtree(sweeps_dir)
+
+    # Only the window not configured is prepared
+    assert window_files == ["dmin-8_dmax-16"]
+
+    assert len(results_df) == 12
+    assert sorted(results_df["Setting"].unique()) == [
+        "max_steps-2_dmin-6",
+        "max_steps-2_dmin-8",
+        "max_steps-3_dmin-6",
+        "max_steps-3_dmin-8"
+    ]
+    assert (results_df["Run status"] == "Finished").all()
+    assert (results_df["Status"] == "Error").all() # Stub results only
+
+
+def test_window_inputs_incremental(config: dict, tmp_path) -> None:
+
+    config_modified = copy.deepcopy(config)
+    config_modified["retropath"]["cache"]["dir"] = str(tmp_path)
+    config_modified["retropath"]["cache"]["incremental"] = True
+    config_modified["retropath"]["files"]["ec_numbers"] = os.path.join(
+        "expected",
+        config_modified["retropath"]["files"]["ec_numbers"]
+    )
+
+    preloader = RetroPathPreloader(config_modified)
+
+    rules_path = os.path.join(
+        config["paths"]["retropath"],
+        config["retropath"]["files"]["rules"]
+    )
+
+    _ = preloader.get_rules()
+    mtime = os.stat(rules_path).st_mtime_ns
+
+    # Rules of another window are recorded as steps of their own
+    inputs = get_window_inputs(preloader=preloader, windows=[(12, 16)])
+
+    # Configuring the swept window must not reuse the window's record for the
+    # community rules
+    preloader.config["retropath"]["params"]["dmin"] = 12
+    _ = preloader.get_rules()
+    is_recomputed = os.stat(rules_path).st_mtime_ns != mtime
+
+    # Clean temporal data
+    os.remove(rules_path)
+    shutil.rmtree(
+        os.path.join(
+            config["paths"]["retropath"],
+            "interesting_metabolites/",
+            SWEEPS_DIR
+        )
+    )
+
+    assert inputs[(12, 16)]["rules_path"] != rules_path
+    assert is_recomputed
+
+
+def test_run_scopes(tmp_path) -> None:
+
+    rules_path = os.path.join(tmp_path, "rules.csv")
+    pd.DataFrame({
+        "Rule ID": ["MNXR1_MNXM1", "MNXR2_MNXM2"],
+        "Rule": [
+            "([#6&v4:1](-[#8&v2:2]-[#1&v1:3])(-[#1&v1:4])(-[#1&v1:5])" + \
+                "-[#6:6])>>([#6&v4:1](=[#8&v2:2])(-[#1&v1:4])-[#6:6]." + \
+                "[#1&v1:3].[#1&v1:5])",
+            "rule2"
+        ],
+        "EC number": ["1.1.1.1", "2.2.2.2"],
+        "Rule usage": ["both", "both"],
+        "Diameter": [8, 8]
+    }).to_csv(rules_path, index=False)
+
+    # Acetaldehyde and methane
+    sink_path = os.path.join(tmp_path, "sink.csv")
+    pd.DataFrame({
+        "Name": ["MNXM75", "MNXM1"],
+        "InChI": ["InChI=1S/C2H4O/c1-2-3/h2H,1H3", "InChI=1S/CH4/h1H4"]
+    }).to_csv(sink_path, index=False)
+
+    r_codes_df = run_scopes(
+        sources_df=pd.DataFrame({
+            "Name": ["ethanol", "propanol", "methane"],
+            "InChI": [
+                "InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3",
+                "InChI=1S/C3H8O/c1-2-3-4/h4H,2-3H2,1H3",
+                "InChI=1S/CH4/h1H4"
+            ]
+        }),
+        sink_path=sink_path,
+        rules_path=rules_path,
+        experiments_dir=os.path.join(tmp_path, "experiments"),
+        params={"dmin": 6, "dmax": 16, "max_steps": 3, "topx": 100}
+    )
+
+    assert r_codes_df["Return code"].tolist() == \
+        [SCOPE_FOUND, NO_SOLUTION, SOURCE_IN_SINK]
+
+    # Outputs are classified as RetroPath2.0 ones
+    assert sorted(os.listdir(os.path.join(tmp_path, "experiments"))) == \
+        ["ethanol", "methane", "propanol"]
+    assert sorted(os.listdir(os.path.join(tmp_path, "experiments/ethanol"))) \
+        == ["ethanol_scope.csv", "results.csv", "source-in-sink.csv"]
+    assert sorted(os.listdir(os.path.join(tmp_path, "experiments/propanol")))\
+        == ["results.csv", "source-in-sink.csv"]
+    assert os.listdir(os.path.join(tmp_path, "experiments/methane")) == \
+        ["source-in-sink.csv"]
+
+    scope_df = pd.read_csv(
+        os.path.join(tmp_path, "experiments/ethanol/ethanol_scope.csv")
+    )
+    assert scope_df["Reaction SMILES"].tolist() == ["CCO>>CC=O"]
+
+
+def test_run_scope_unparsable_products(tmp_path) -> None:
+
+    rules_path = os.path.join(tmp_path, "rules.csv")
+    pd.DataFrame({
+        "Rule ID": ["MNXR1_MNXM1"],
+        "Rule": [
+            "([#6&v4:1](-[#8&v2:2]-[#1&v1:3])(-[#1&v1:4])(-[#1&v1:5])" + \
+                "-[#6:6])>>([#6&v4:1](=[#8&v2:2])(-[#1&v1:4])-[#6:6]." + \
+                "[#1&v1:3].[#1&v1:5])"
+        ],
+        "EC number": ["1.1.1.1"],
+        "Rule usage": ["both"],
+        "Diameter": [8]
+    }).to_csv(rules_path, index=False)
+
+    # Methane, so acetaldehyde is expanded in the next iteration
+    sink_path = os.path.join(tmp_path, "sink.csv")
+    pd.DataFrame({
+        "Name": ["MNXM1"],
+        "InChI": ["InChI=1S/CH4/h1H4"]
+    }).to_csv(sink_path, index=False)
+
+    # Products whose canonical SMILES cannot be parsed back are still
+    # expanded from their sanitized molecules
+    with mock.patch("rdkit.Chem.MolFromSmiles", return_value=None):
+        r_code = run_scope(
+            source_name="ethanol",
+            source_inchi="InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3",
+            sink_path=sink_path,
+            rules_path=rules_path,
+            outdir=os.path.join(tmp_path, "ethanol"),
+            params={"dmin": 6, "dmax": 16, "max_steps": 2, "topx": 100}
+        )
+
+    results_df = pd.read_csv(os.path.join(tmp_path, "ethanol/results.csv"))
+
+    assert r_code == NO_SOLUTION
+    assert results_df["Reaction SMILES"].tolist() == ["CCO>>CC=O"]
+
+
+def test_scope_backend_prepare(config: dict, tmp_path) -> None:
+
+    rule = "([#6&v4:1](-[#8&v2:2]-[#1&v1:3])(-[#1&v1:4])(-[#1&v1:5])" + \
+        "-[#6:6])>>([#6&v4:1](=[#8&v2:2])(-[#1&v1:4])-[#6:6]." + \
+        "[#1&v1:3].[#1&v1:5])"
+
+    rules_path = os.path.join(tmp_path, "rules.csv")
+    pd.DataFrame({
+        "Rule ID": ["MNXR1_MNXM1"],
+        "Rule": [rule],
+        "EC number": ["1.1.1.1"],
+        "Rule usage": ["both"],
+        "Diameter": [8]
+    }).to_csv(rules_path, index=False)
+
+    # Acetaldehyde
+    sink_path = os.path.join(tmp_path, "sink.csv")
+    pd.DataFrame({
+        "Name": ["MNXM75"],
+        "InChI": ["InChI=1S/C2H4O/c1-2-3/h2H,1H3"]
+    }).to_csv(sink_path, index=False)
+
+    config_modified = copy.deepcopy(config)
+    config_modified["paths"]["retropath"] = str(tmp_path)
+    config_modified["retropath"]["runner"].update(
+        schedule=False,
+        precheck=None
+    )
+    os.makedirs(os.path.join(tmp_path, "interesting_metabolites"))
+
+    class BreakingScopeBackend(ScopeBackend):
+        """
+        Break the rules after preparing, keeping the signature of the file:
+        only children inheriting the compiled rules can still find the scope.
+        """
+
+        def prepare(self, jobs: list) -> None:
+            super().prepare(jobs)
+
+            stat = os.stat(rules_path)
+            with open(rules_path, mode="r") as fh:
+                text = fh.read()
+            with open(rules_path, mode="w") as fh:
+                fh.write(text.replace(rule, "(" * len(rule)))
+            os.utime(rules_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    runner = RetroPathRunner(
+        config=config_modified,
+        backend=BreakingScopeBackend()
+    )
+    job = RetroPathJob(
+        experiment="ethanol",
+        source="ethanol",
+        source_path=None,
+        sink_path=sink_path,
+        rules_path=rules_path,
+        outdir=os.path.join(runner.experiments_dir, "ethanol"),
+        params={"dmin": 6, "dmax": 16, "max_steps": 3, "topx": 100},
+        source_text='Name,InChI\nethanol,"InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3"\n'
+    )
+
+    manifest_df = runner.run_jobs([job])
+
+    with open(rules_path, mode="r") as fh:
+        is_broken = rule not in fh.read()
+
+    # The rules were prepared (and broken) before forking, yet the child used
+    # the compiled ones
+    assert is_broken
+    assert manifest_df["Return code"].tolist() == [SCOPE_FOUND]
+
+
+def test_rule_screen() -> None:
+
+    reactions = [
+        AllChem.ReactionFromSmarts(rule)
+        for rule in [
+            # Primary alcohol to aldehyde
+            "([#6&v4:1](-[#8&v2:2]-[#1&v1:3])(-[#1&v1:4])(-[#1&v1:5])" + \
+                "-[#6:6])>>([#6&v4:1](=[#8&v2:2])(-[#1&v1:4])-[#6:6]." + \
+                "[#1&v1:3].[#1&v1:5])",
+            # Amide hydrolysis
+            "([#6:1](=[#8:2])-[#7:3])>>([#6:1](=[#8:2])-[#8].[#7:3])",
+            # Aromatic hydroxylation
+            "([c:1]-[#8]-[#1])>>([c:1]-[#1])"
+        ]
+    ]
+    screen = RuleScreen(reactions)
+
+    for smiles in ["CCO", "CC(C)O", "CC(N)=O", "c1ccccc1O", "CCCC"]:
+        mol = Chem.AddHs(Chem.MolFromSmiles(smiles))
+
+        is_candidate = screen.get_mask(mol)
+        is_match = [
+            len(reaction.RunReactants((mol, ))) > 0
+            for reaction in reactions
+        ]
+
+        # Matching rules are never pruned
+        assert all(is_candidate[is_match]), \
+            f"Matching rules were pruned for {smiles}!"
+
+    assert 0 < screen.pruning_ratio < 1
+
+
+def test_similarity_index() -> None:
+
+    smiles = ["CCO", "CCCO", "CC(C)O", "OCC(O)CO", "c1ccccc1O", "CC(N)=O"]
+    inchis = [Chem.MolToInchi(Chem.MolFromSmiles(smi)) for smi in smiles]
+    mols = [Chem.MolFromInchi(inchi) for inchi in inchis]
+
+    names, fingerprints = get_fingerprints(
+        names=smiles + ["invalid"],
+        inchis=inchis + ["InChI=1S/invalid"]
+    )
+    index = SimilarityIndex(names=names, fingerprints=fingerprints)
+
+    neighbours_df = index.query(
+        names=names,
+        fingerprints=fingerprints,
+        k=2,
+        exclude_self=True
+    )
+
+    # Compare against RDKit
+    generator = rdFingerprintGenerator.GetMorganGenerator(
+        radius=2,
+        fpSize=2048
+    )
+    rdkit_fps = [generator.GetFingerprint(mol) for mol in mols]
+
+    for i, name in enumerate(names):
+        similarities = DataStructs.BulkTanimotoSimilarity(
+            rdkit_fps[i],
+            rdkit_fps
+        )
+        similarities[i] = -1
+        expected = sorted(similarities, reverse=True)[:2]
+
+        assert np.allclose(
+            neighbours_df.loc[neighbours_df["Query"] == name, "Similarity"],
+            expected
+        ), f"Wrong nearest neighbours for {name}!"
+
+
+def test_cost_model() -> None:
+
+    features_df = pd.DataFrame({
+        "Heavy atoms": [5, 10, 20, 40],
+        "Molecular weight": [70, 140, 280, 560],
+        "Rings": [0, 1, 2, 4],
+        "max_steps": [10] * 4,
+        "Rules": [1000] * 4
+    })
+    runtimes = pd.Series([10, 40, 160, 640])
+
+    model = CostModel(min_history=3).fit(
+        features_df=features_df,
+        runtimes=runtimes
+    )
+    predicted = model.predict(features_df)
+
+    assert model.is_fitted and predicted.is_monotonic_increasing, \
+        "Runtimes were not correctly estimated!"
+
+    timeouts = model.get_timeouts(
+        predicted=predicted,
+        factor=2,
+        min_timeout=30,
+        max_timeout=1000
+    )
+
+    assert (timeouts >= 30).all() and (timeouts <= 1000).all() and \
+        (timeouts >= predicted.clip(upper=500)).all(), \
+        "Timeouts were not correctly estimated!"
+
+
+def test_runner_precheck(
+    config: dict,
+    preloader: RetroPathPreloader,
+    tmp_path
+) -> None:
+
+    preloader.get_sources()
+
+    # Sink containing glucose with stereochemistry
+    sink_path = tmp_path / "sink.csv"
+    sink_path.write_text(
+        '"Name","InChI"\n' + \
+        '"MNXM1","InChI=1S/C6H12O6/c7-1-2-3(8)4(9)5(10)6(11)12-2/' + \
+        'h2-11H,1H2/t2-,3-,4+,5-,6?/m1/s1"\n'
+    )
+
+    config_modified = copy.deepcopy(config)
+    config_modified["retropath"]["files"]["sink"] = str(sink_path)
+    config_modified["retropath"]["files"]["rules"] = os.path.join(
+        "expected",
+        config_modified["retropath"]["files"]["rules"]
+    )
+
+    runner = RetroPathRunner(config=config_modified, backend=StubBackend())
+    manifest_df = runner.run()
+
+    return_codes = dict(zip(manifest_df["Source"], manifest_df["Return code"]))
+    source_in_sink_df = pd.read_csv(
+        os.path.join(runner.experiments_dir, "glucose", "source-in-sink.csv")
+    )
+
+    # Clean temporal data
+    os.remove(runner.manifest_path)
+    shutil.rmtree(runner.experiments_dir)
+    for filename in os.listdir(runner.sources_dir):
+        os.remove(os.path.join(runner.sources_dir, filename))
+
+    assert return_codes == {
+        "glucose": "SrcInSink",
+        "fructose": "0",
+        "sucrose": "0"
+    }, "Sources in sink were not correctly detected!"
+
+    assert source_in_sink_df["Name"].tolist() == ["glucose"], \
+        "Source in sink file was not correctly created!"